@@ -13,4 +13,122 @@ AZURE_OPENAI_EMBEDDING_DEPLOYMENT = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT
 AZURE_OPENAI_EMBEDDING_API_KEY = os.getenv("AZURE_OPENAI_EMBEDDING_API_KEY")
 AZURE_OPENAI_EMBEDDING_ENDPOINT = os.getenv("AZURE_OPENAI_EMBEDDING_ENDPOINT")
 
+# Document cache (content-addressed, survives restarts)
+DOCUMENT_CACHE_DIR = os.getenv("DOCUMENT_CACHE_DIR", "./data/cache/documents")
+DOCUMENT_CACHE_MAX_ENTRIES = int(os.getenv("DOCUMENT_CACHE_MAX_ENTRIES", "100"))
+DOCUMENT_CACHE_MAX_BYTES = int(os.getenv("DOCUMENT_CACHE_MAX_BYTES", str(1024 ** 3)))
+DOCUMENT_CACHE_TTL_SECONDS = int(os.getenv("DOCUMENT_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# HTTP clients shared by the Azure OpenAI calls and document downloads
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "60"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "4"))
+HTTP_BACKOFF_BASE_SECONDS = float(os.getenv("HTTP_BACKOFF_BASE_SECONDS", "0.5"))
+HTTP_BACKOFF_MAX_SECONDS = float(os.getenv("HTTP_BACKOFF_MAX_SECONDS", "30"))
+# Startup warmup: open keep-alive connections to the Azure endpoints before /api/v1/ready
+WARMUP_CONNECTIONS = os.getenv("WARMUP_CONNECTIONS", "true").lower() == "true"
+# Cap of the backoff between retries of a failed required warmup step
+WARMUP_RETRY_MAX_SECONDS = float(os.getenv("WARMUP_RETRY_MAX_SECONDS", "60"))
+
+# Azure OpenAI quotas enforced by the client-side scheduler (0 = unlimited):
+# requests and tokens per minute of the embedding and chat deployments
+AZURE_EMBEDDING_RPM = int(os.getenv("AZURE_EMBEDDING_RPM", "0"))
+AZURE_EMBEDDING_TPM = int(os.getenv("AZURE_EMBEDDING_TPM", "0"))
+AZURE_CHAT_RPM = int(os.getenv("AZURE_CHAT_RPM", "0"))
+AZURE_CHAT_TPM = int(os.getenv("AZURE_CHAT_TPM", "0"))
+
+# Admission control: concurrent document ingestions (download + parse + embed) and
+# LLM calls across all requests, callers allowed to wait for each, and the
+# default per-request deadline
+ADMISSION_MAX_INGESTIONS = int(os.getenv("ADMISSION_MAX_INGESTIONS", "4"))
+ADMISSION_MAX_QUEUED_INGESTIONS = int(os.getenv("ADMISSION_MAX_QUEUED_INGESTIONS", "16"))
+ADMISSION_MAX_QUESTIONS = int(os.getenv("ADMISSION_MAX_QUESTIONS", "32"))
+ADMISSION_MAX_QUEUED_QUESTIONS = int(os.getenv("ADMISSION_MAX_QUEUED_QUESTIONS", "256"))
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("REQUEST_TIMEOUT_SECONDS", "120"))
+
+# Maximum number of questions from one request answered concurrently
+QUESTION_CONCURRENCY = int(os.getenv("QUESTION_CONCURRENCY", "5"))
+
+# Embedding sub-batching: limits per upstream request and parallel requests
+# (failed requests are retried by the shared HTTP clients)
+EMBEDDING_BATCH_MAX_ITEMS = int(os.getenv("EMBEDDING_BATCH_MAX_ITEMS", "64"))
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "50000"))
+EMBEDDING_MAX_WORKERS = int(os.getenv("EMBEDDING_MAX_WORKERS", "4"))
+
+# Chunk embedding cache shared across documents: directory and LRU size (0 disables it)
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "./data/cache/embeddings")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+# Vector store backend: "chroma", "numpy" (in-process, .npy persistence) or "shared"
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "chroma")
+CHROMA_PERSIST_DIR = os.getenv("CHROMA_PERSIST_DIR", ".chromadb")
+NUMPY_STORE_DIR = os.getenv("NUMPY_STORE_DIR", "./data/vectors")
+# Vectors shared by the worker processes of a host (VECTOR_STORE_BACKEND=shared)
+SHARED_STORE_DIR = os.getenv("SHARED_STORE_DIR", "./data/shared_vectors")
+# Memory budget of documents held by the vector store (0 disables a limit); least
+# recently used documents beyond it are unloaded, and spilled to disk if enabled
+VECTOR_STORE_MAX_BYTES = int(os.getenv("VECTOR_STORE_MAX_BYTES", str(512 * 1024 ** 2)))
+VECTOR_STORE_MAX_DOCUMENTS = int(os.getenv("VECTOR_STORE_MAX_DOCUMENTS", "50"))
+VECTOR_STORE_SPILL = os.getenv("VECTOR_STORE_SPILL", "true").lower() == "true"
+# Numpy/shared backends: precision of the searched vectors ("float32", "float16" or
+# "int8") and how many top_k multiples are re-scored against the float32 copy on disk
+VECTOR_STORE_PRECISION = os.getenv("VECTOR_STORE_PRECISION", "float32")
+VECTOR_STORE_RESCORE_FACTOR = int(os.getenv("VECTOR_STORE_RESCORE_FACTOR", "4"))
+
+# Corpus-wide IVF index behind /api/v1/search, off unless a directory is set (e.g.
+# ./data/corpus_index); it holds every chunk's vector at VECTOR_STORE_PRECISION within
+# VECTOR_STORE_MAX_BYTES. Lists scanned per query and the corpus size from which it is
+# clustered instead of searched exactly
+CORPUS_INDEX_DIR = os.getenv("CORPUS_INDEX_DIR", "")
+CORPUS_INDEX_NPROBE = int(os.getenv("CORPUS_INDEX_NPROBE", "32"))
+CORPUS_INDEX_TRAIN_SIZE = int(os.getenv("CORPUS_INDEX_TRAIN_SIZE", "20000"))
+
+# Hybrid retrieval: per-document BM25 indexes (empty disables them) fused with vector
+# search by reciprocal rank (constant k). Questions whose best chunk holds this share
+# of their IDF mass, and at least this much IDF, skip the embedding call
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", "./data/lexical")
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+LEXICAL_FAST_PATH = os.getenv("LEXICAL_FAST_PATH", "true").lower() == "true"
+LEXICAL_FAST_PATH_COVERAGE = float(os.getenv("LEXICAL_FAST_PATH_COVERAGE", "0.9"))
+LEXICAL_FAST_PATH_MIN_IDF = float(os.getenv("LEXICAL_FAST_PATH_MIN_IDF", "6.0"))
+
+# PDF parsing: documents with at least this many pages are split across processes
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+PDF_MAX_WORKERS = int(os.getenv("PDF_MAX_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Token-aware chunking: chunk size budget and overlap between neighbours
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "400"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "50"))
+
+# Embedded batches that may wait to be stored during pipelined ingestion
+INGESTION_QUEUE_DEPTH = int(os.getenv("INGESTION_QUEUE_DEPTH", "4"))
+
+# Background ingestion (POST /api/v1/documents): concurrent jobs and waiting backlog
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+INGESTION_MAX_QUEUED_JOBS = int(os.getenv("INGESTION_MAX_QUEUED_JOBS", "32"))
+
+# LLM answer cache: in-memory LRU plus an optional SQLite file (empty disables it),
+# capped at ANSWER_CACHE_MAX_DISK_ENTRIES rows
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(24 * 3600)))
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "./data/cache/answers.sqlite3")
+ANSWER_CACHE_MAX_DISK_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_DISK_ENTRIES", "100000"))
+
+# Packed mode: answer questions with overlapping context in one LLM call
+LLM_PACKED_MODE = os.getenv("LLM_PACKED_MODE", "false").lower() == "true"
+LLM_PACK_MAX_QUESTIONS = int(os.getenv("LLM_PACK_MAX_QUESTIONS", "5"))
+LLM_PACK_MAX_TOKENS = int(os.getenv("LLM_PACK_MAX_TOKENS", "6000"))
+
+# Context selection: MMR re-ranking of retrieved candidates into a token budget
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "10"))
+CONTEXT_MAX_CHUNKS = int(os.getenv("CONTEXT_MAX_CHUNKS", "5"))
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "1500"))
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.95"))
+
+# Observability: loguru level / JSON output and the opt-in Server-Timing header
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_JSON = os.getenv("LOG_JSON", "false").lower() == "true"
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "false").lower() == "true"
+
 # GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")  # Not currently used
@@ -3,49 +3,245 @@
 # Deployment ID: COMPLETE-NUCLEAR-SOLUTION-2024
 
 import time
+import math
+import asyncio
+import hashlib
 import threading
-import webbrowser
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Header
+from contextlib import asynccontextmanager, nullcontext
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Header, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import HTMLResponse
-from app.utils.helpers import FileManager, ResponseFormatter
-from app.services.document_loader import load_document
-from app.services.chunker import chunk_document
-from app.services.embedder_new import embed_chunks
-from app.services.vector_store import store_embeddings, search_similar_chunks
-from app.services.llm_service_new import query_llm
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, Response
+from loguru import logger
+from app.utils.helpers import FileManager, ResponseFormatter, configure_logging
+from app.services import metrics, document_loader
+from app.services.ingestion import ingest_document
+from app.services.embedder_new import embedding_cache, embed_chunks_async
+from app.services.corpus_index import corpus_index
+from app.services.lexical_index import lexical_index
+from app.services.vector_store import (
+    store_embeddings,
+    hybrid_candidates_batch_async,
+    has_document,
+    delete_document,
+    pinned_document,
+    publish_document,
+    document_write_lock,
+    resident_documents,
+    vector_store,
+)
+from app.services.context_selector import select_contexts
+from app.services.document_cache import DocumentCache, content_hash
+from app.services.answer_cache import AnswerCache, answer_key
+from app.services.llm_service_new import query_llm_async, query_llm_packed_async
+from app.services.question_packing import group_questions, merge_contexts
+from app.services.http_client import async_request_with_retries, close_async_client, warm_connections
 from app.services.evaluator import evaluate_response, evaluate_accuracy
+from app.services.ingestion_jobs import IngestionJobs, JobQueueFull, RUNNING, READY, FAILED
+from app.services.rate_limiter import scheduler, scheduling, current_deadline, SchedulerRejected, BULK
+from app.services.admission import AdmissionController, AdmissionRejected
+from app.services.warmup import Warmup
 import os
 import sys
-import requests
+import httpx
 import json
 from typing import List, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
+from app.config import (
+    AZURE_OPENAI_CHAT_ENDPOINT,
+    AZURE_OPENAI_EMBEDDING_ENDPOINT,
+    WARMUP_CONNECTIONS,
+    WARMUP_RETRY_MAX_SECONDS,
+    DOCUMENT_CACHE_DIR,
+    DOCUMENT_CACHE_MAX_ENTRIES,
+    DOCUMENT_CACHE_MAX_BYTES,
+    DOCUMENT_CACHE_TTL_SECONDS,
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_TTL_SECONDS,
+    ANSWER_CACHE_PATH,
+    ANSWER_CACHE_MAX_DISK_ENTRIES,
+    QUESTION_CONCURRENCY,
+    ADMISSION_MAX_INGESTIONS,
+    ADMISSION_MAX_QUEUED_INGESTIONS,
+    ADMISSION_MAX_QUESTIONS,
+    ADMISSION_MAX_QUEUED_QUESTIONS,
+    REQUEST_TIMEOUT_SECONDS,
+    INGESTION_WORKERS,
+    INGESTION_MAX_QUEUED_JOBS,
+    LLM_PACKED_MODE,
+    LLM_PACK_MAX_QUESTIONS,
+    LLM_PACK_MAX_TOKENS,
+    CONTEXT_CANDIDATES,
+    CONTEXT_MAX_CHUNKS,
+    LOG_LEVEL,
+    LOG_JSON,
+    SERVER_TIMING_ENABLED,
+)
 
 # Add project root to PYTHONPATH
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Warm up in the background while the server already accepts requests
+    (/api/v1/ready reports when it is done); close the shared HTTP client
+    and save the document cache's access times on shutdown.
+    """
+    warmup.start()
+    try:
+        yield
+    finally:
+        await warmup.stop()
+        await close_async_client()
+        await asyncio.to_thread(document_cache.flush)
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Intelligent Document Query API",
     description="AI-powered document querying system using Azure OpenAI",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Initialize security and file manager
 security = HTTPBearer()
 file_manager = FileManager()
+answer_cache = AnswerCache(
+    max_entries=ANSWER_CACHE_MAX_ENTRIES,
+    ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+    db_path=ANSWER_CACHE_PATH or None,
+    max_disk_entries=ANSWER_CACHE_MAX_DISK_ENTRIES,
+)
+
+def _evict_document(entry: dict):
+    delete_document(entry["doc_id"])
+    answer_cache.invalidate_document(entry["content_hash"])
+
+document_cache = DocumentCache(
+    cache_dir=DOCUMENT_CACHE_DIR,
+    max_entries=DOCUMENT_CACHE_MAX_ENTRIES,
+    max_bytes=DOCUMENT_CACHE_MAX_BYTES,
+    ttl_seconds=DOCUMENT_CACHE_TTL_SECONDS,
+    on_evict=_evict_document,
+)
+
+admission = AdmissionController({
+    "ingestion": (ADMISSION_MAX_INGESTIONS, ADMISSION_MAX_QUEUED_INGESTIONS),
+    "questions": (ADMISSION_MAX_QUESTIONS, ADMISSION_MAX_QUEUED_QUESTIONS),
+})
+ingestion_jobs = IngestionJobs(workers=INGESTION_WORKERS, max_queued=INGESTION_MAX_QUEUED_JOBS)
+
+# Startup work deferred from import time; the vector store and PDF parser
+# must be ready, the rest only saves the first request some latency
+warmup = Warmup(max_retry_seconds=WARMUP_RETRY_MAX_SECONDS)
+warmup.add("vector_store", lambda: asyncio.to_thread(vector_store.warm))
+warmup.add("pdf_parser", lambda: asyncio.to_thread(document_loader.warm))
+warmup.add("embedding_cache", lambda: asyncio.to_thread(embedding_cache.warm), required=False)
+if corpus_index is not None:
+    warmup.add("corpus_index", lambda: asyncio.to_thread(corpus_index.stats), required=False)
+_upstreams = list(dict.fromkeys(url for url in (AZURE_OPENAI_EMBEDDING_ENDPOINT, AZURE_OPENAI_CHAT_ENDPOINT) if url))
+if WARMUP_CONNECTIONS and _upstreams:
+    warmup.add("upstream_connections", lambda: warm_connections(_upstreams), required=False)
+
+metrics.cache_stats.register("documents", document_cache.stats)
+metrics.cache_stats.register("answers", answer_cache.stats)
+metrics.cache_stats.register("vectors", vector_store.residency_stats)
+metrics.cache_stats.register("embeddings", embedding_cache.stats)
+if lexical_index is not None:
+    metrics.cache_stats.register("lexical", lexical_index.stats)
+configure_logging(LOG_LEVEL, LOG_JSON)
+
+# Documents are content-addressed, so the ID must not depend on the upload name
+DOCUMENT_NAME = "document.pdf"
+
+def document_id_for(digest: str) -> str:
+    return file_manager.generate_document_id(DOCUMENT_NAME, digest)
 
 # Get team token from environment variable
 TEAM_TOKEN = os.getenv("TEAM_TOKEN", "acee50b025067ece530801f7901433430fae46c00beae83921306b8503bfb39a")
 
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    """
+    Track in-flight requests and request latency until the response body
+    has been sent; with SERVER_TIMING_ENABLED, report the request's stage
+    timings in a Server-Timing header (streamed answers, whose stages run
+    after the headers are sent, repeat them in their summary event).
+    """
+    start = time.perf_counter()
+    timings, timings_token = metrics.start_request_timings() if SERVER_TIMING_ENABLED else (None, None)
+    metrics.REQUESTS_IN_FLIGHT.inc()
+    status = "500"
+
+    def finish():
+        metrics.REQUESTS_IN_FLIGHT.dec()
+        route = request.scope.get("route")
+        metrics.REQUEST_SECONDS.labels(route.path if route else "unmatched", status).observe(time.perf_counter() - start)
+
+    try:
+        response = await call_next(request)
+    except BaseException:
+        finish()
+        raise
+    finally:
+        if timings_token is not None:
+            metrics.stop_request_timings(timings_token)
+    status = str(response.status_code)
+    if timings is not None:
+        timings["total"] = time.perf_counter() - start
+        response.headers["Server-Timing"] = metrics.server_timing_header(timings)
+    response.body_iterator = _finish_after(response.body_iterator, finish)
+    return response
+
+async def _finish_after(body_iterator, on_done):
+    # The endpoint may still be producing the body (streamed answers)
+    try:
+        async for chunk in body_iterator:
+            yield chunk
+    finally:
+        on_done()
+
 # Pydantic models
 class DocumentQueryRequest(BaseModel):
-    documents: str  # URL to the document
+    documents: Optional[str] = None  # URL to the document
+    document_id: Optional[str] = None  # ID returned by POST /api/v1/documents
     questions: List[str]
 
+    @model_validator(mode="after")
+    def require_document(self):
+        if not self.documents and not self.document_id:
+            raise ValueError("Either documents (a URL) or document_id is required")
+        return self
+
+class SearchRequest(BaseModel):
+    query: str
+    top_k: int = Field(10, ge=1, le=100)
+
 class DocumentQueryResponse(BaseModel):
     answers: List[str]
+    # Question indices answered together in packed mode
+    packed_groups: Optional[List[List[int]]] = None
+
+def request_deadline(timeout_header: Optional[str]) -> float:
+    """
+    time.monotonic() deadline of a request: REQUEST_TIMEOUT_SECONDS, or a
+    shorter X-Request-Timeout (seconds) sent by the client.
+    """
+    timeout = REQUEST_TIMEOUT_SECONDS
+    try:
+        if timeout_header:
+            timeout = min(timeout, max(0.1, float(timeout_header)))
+    except ValueError:
+        pass
+    return time.monotonic() + timeout
+
+def overload_error(e: Exception) -> HTTPException:
+    """503 / 429 with Retry-After for work refused by admission control or the Azure scheduler."""
+    if isinstance(e, AdmissionRejected):
+        return HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": e.retry_after_header})
+    return HTTPException(
+        status_code=429, detail=str(e), headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+    )
 
 # Authentication dependency
 async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
@@ -97,6 +293,41 @@ def health_check():
         "version": "1.0.0"
     }
 
+@app.get("/api/v1/ready")
+def readiness_check():
+    """
+    Readiness probe, unlike /api/v1/health which only reports liveness:
+    503 until the startup warmup has finished, with each step's progress.
+    """
+    status = warmup.status()
+    if not status["ready"]:
+        return JSONResponse(status_code=503, content=status)
+    return status
+
+@app.get("/api/v1/cache/stats")
+def cache_stats():
+    """Document, answer, chunk embedding and BM25 index cache hit/miss counters."""
+    stats = {"documents": document_cache.stats(), "answers": answer_cache.stats(), "embeddings": embedding_cache.stats()}
+    if lexical_index is not None:
+        stats["lexical"] = lexical_index.stats()
+    return stats
+
+@app.get("/api/v1/admin/documents")
+def admin_resident_documents(token: str = Depends(verify_token)):
+    """Documents held in memory by the vector store, their approximate sizes and the memory budget."""
+    return resident_documents()
+
+@app.get("/api/v1/scheduler/stats")
+def scheduler_stats():
+    """Azure rate-limit scheduler: available quota, queue depth and wait times per service."""
+    return {**scheduler.stats(), "admission": admission.stats()}
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus scrape endpoint."""
+    body, content_type = metrics.render_metrics()
+    return Response(content=body, media_type=content_type)
+
 @app.get("/api/v1/test")
 def test_deployment():
     """Test endpoint to verify current deployment."""
@@ -107,146 +338,648 @@ def test_deployment():
         "environment": os.getenv("ENVIRONMENT", "production")
     }
 
-@app.post("/api/v1/hackrx/run", response_model=DocumentQueryResponse)
+async def download_document(url: str, revalidate: bool = True):
+    """
+    Download a document and return (content, content_hash).
+
+    The body is streamed and hashed as it arrives. When the URL was seen
+    before, a conditional GET is sent; on a 304 the content is None and the
+    hash of the cached copy is returned instead.
+    """
+    headers = document_cache.conditional_headers(url) if revalidate else {}
+    response = await async_request_with_retries("GET", url, headers=headers, timeout=30, stream=True)
+    try:
+        if response.status_code == 304:
+            cached_hash = document_cache.hash_for_url(url)
+            if cached_hash:
+                return None, cached_hash
+            await response.aclose()
+            response = await async_request_with_retries("GET", url, timeout=30, stream=True)
+        response.raise_for_status()
+
+        hasher = hashlib.sha256()
+        content = bytearray()
+        async for piece in response.aiter_bytes():
+            hasher.update(piece)
+            content.extend(piece)
+    finally:
+        await response.aclose()
+
+    digest = hasher.hexdigest()
+    previous_hash = document_cache.hash_for_url(url)
+    if previous_hash and previous_hash != digest:
+        # The document behind this URL changed; its old answers are stale
+        answer_cache.invalidate_document(previous_hash)
+    await asyncio.to_thread(
+        document_cache.remember_url,
+        url, digest, response.headers.get("ETag"), response.headers.get("Last-Modified"),
+    )
+    return content, digest
+
+async def fetch_document(url: str):
+    """
+    download_document, falling back to a full download when the server
+    answers "not modified" but the cached copy is gone.
+    """
+    content, digest = await download_document(url)
+    if content is None and digest not in document_cache:
+        content, digest = await download_document(url, revalidate=False)
+    return content, digest
+
+def _refetch(url: str):
+    """Full download of url for index_document, when its cached copy vanished after a 304."""
+    return lambda: download_document(url, revalidate=False)
+
+# One ingestion per document content at a time; concurrent requests for the
+# same bytes wait and then hit the cache. digest -> [lock, holder and waiters]
+_ingestion_locks = {}
+
+@asynccontextmanager
+async def _ingestion_lock(digest: str):
+    # Counted rather than checked with locked(): a released lock is unlocked
+    # before its woken waiter runs, and must not be replaced meanwhile
+    entry = _ingestion_locks.setdefault(digest, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del _ingestion_locks[digest]
+
+async def index_document(content: bytes, digest: str, performance_metrics: dict, refetch=None) -> str:
+    """
+    Make sure a document is searchable in the vector store and return its doc_id.
+    A cache hit restores stored chunks and embeddings; a miss runs the
+    pipelined parse -> chunk -> embed -> store ingestion on the in-memory
+    bytes and populates the cache.
+
+    content is None when only the cache was expected to hold the document
+    (a 304, or a document_id); if its entry has gone since, the bytes come
+    from refetch() -> (content, digest), or the document is reported gone.
+    """
+    async with _ingestion_lock(digest):
+        # Cache file I/O runs in threads so it does not stall other requests
+        cached = await asyncio.to_thread(document_cache.get, digest)
+        if cached:
+            doc_id = cached["doc_id"]
+            if not has_document(doc_id):
+                async with document_write_lock(doc_id):
+                    stored = None if has_document(doc_id) else await asyncio.to_thread(document_cache.load, digest)
+                    if stored:
+                        # Fresh process: restore stored embeddings instead of re-embedding
+                        await asyncio.to_thread(store_embeddings, doc_id, *stored)
+                        await asyncio.to_thread(publish_document, doc_id)
+            if has_document(doc_id):
+                performance_metrics["document_cache"] = "hit"
+                return doc_id
+        performance_metrics["document_cache"] = "miss"
+        if content is None:
+            if refetch is None:
+                raise HTTPException(status_code=410, detail="Document was evicted from the cache; submit it again")
+            content, refetched = await refetch()
+            if refetched != digest:
+                raise HTTPException(status_code=409, detail="Document changed while it was being indexed; retry")
+
+        process_start = time.time()
+        doc_id = document_id_for(digest)
+        # With the shared backend another worker process may be ingesting
+        # the same document; wait for it and reuse its vectors
+        async with document_write_lock(doc_id):
+            if has_document(doc_id):
+                performance_metrics["document_cache"] = "store"
+                return doc_id
+            result = await ingest_document(content, doc_id)
+        for stage in ("parse", "chunk", "embed", "store"):
+            metrics.observe_stage(stage, result["stage_seconds"][stage])
+        with metrics.stage_timer("save"):
+            await asyncio.to_thread(
+                document_cache.put, digest, doc_id, result["chunks"], result["embeddings"], result["metadatas"]
+            )
+        process_time = round(time.time() - process_start, 2)
+        performance_metrics["processing_time"] = process_time
+        performance_metrics["ingestion_stages"] = result["stage_seconds"]
+        performance_metrics["embedding_cache"] = result["embedding_cache"]
+        logger.info(
+            "Document {doc_id} processed in {seconds}s ({hits} chunk embeddings cached, {misses} embedded)",
+            doc_id=doc_id, seconds=process_time, stages=result["stage_seconds"], **result["embedding_cache"],
+        )
+        return doc_id
+
+async def answer_question(index: int, question: str, relevant_chunks: list, semaphore: asyncio.Semaphore, digest: str):
+    """
+    Ask the LLM one question over its retrieved chunks; returns (answer, seconds).
+    Repeated questions over the same document and context come from the
+    answer cache. A failure becomes that question's error string instead of
+    failing the request.
+    """
+    async with semaphore:
+        try:
+            question_start = time.time()
+            logger.debug("Processing question {index}: {question}", index=index + 1, question=question[:50])
+
+            # Generate answer using LLM (or the answer cache)
+            llm_start = time.time()
+            answer, cached = await answer_cache.get_or_compute(
+                answer_key(digest, question, relevant_chunks),
+                digest,
+                lambda: ask_llm(question, relevant_chunks),
+            )
+            llm_time = time.time() - llm_start
+            if not cached:
+                metrics.observe_stage("llm", llm_time)
+            return finish_answer(index, question, answer, question_start, "cache" if cached else "LLM", round(llm_time, 2))
+
+        except (AdmissionRejected, SchedulerRejected):
+            # Overload fails the whole request with a Retry-After
+            raise
+        except Exception as e:
+            logger.error("Error processing question {index}: {error}", index=index + 1, error=str(e))
+            return f"Error processing question: {str(e)}", 0
+
+async def ask_llm(question: str, context_chunks: list) -> str:
+    """query_llm_async within the process-wide limit on concurrent LLM calls."""
+    async with admission.slot("questions", current_deadline()):
+        return await query_llm_async(question, context_chunks)
+
+def finish_answer(index: int, question: str, answer: str, question_start: float, source: str, llm_time: float):
+    """
+    Clean up a raw answer and log its accuracy; returns (answer, seconds).
+    """
+    # Clean and format the answer
+    answer = answer.strip()
+    if answer.startswith("Based on the document"):
+        answer = answer.replace("Based on the document, ", "").replace("Based on the document,", "")
+
+    # Evaluate accuracy
+    with metrics.stage_timer("evaluation"):
+        accuracy_metrics = evaluate_accuracy(question, answer)
+
+    question_time = round(time.time() - question_start, 2)
+    logger.debug(
+        "Question {index} processed in {seconds}s ({source}: {llm_seconds}s, accuracy: {accuracy}%)",
+        index=index + 1, seconds=question_time, source=source, llm_seconds=llm_time,
+        accuracy=accuracy_metrics["accuracy_score"],
+    )
+    return answer, question_time
+
+def plan_question_groups(questions: list, retrievals: list) -> list:
+    """
+    Question indices to answer together: groups of overlapping context in
+    packed mode, one question per group otherwise.
+    """
+    if not LLM_PACKED_MODE or LLM_PACK_MAX_QUESTIONS <= 1:
+        return [[i] for i in range(len(questions))]
+    return group_questions(questions, retrievals, LLM_PACK_MAX_QUESTIONS, LLM_PACK_MAX_TOKENS)
+
+async def answer_group(indices: list, questions: list, retrievals: list, semaphore: asyncio.Semaphore, digest: str):
+    """
+    Answer a group of questions, with one packed LLM call for those not in
+    the answer cache. Falls back to one call per question when the packed
+    output does not parse. Returns [(index, answer, seconds)].
+    """
+    if len(indices) == 1:
+        i = indices[0]
+        return [(i, *await answer_question(i, questions[i], retrievals[i], semaphore, digest))]
+
+    group_start = time.time()
+    results, pending = [], []
+    for i in indices:
+        cached = await asyncio.to_thread(answer_cache.get, answer_key(digest, questions[i], retrievals[i]))
+        if cached is None:
+            pending.append(i)
+        else:
+            results.append((i, *finish_answer(i, questions[i], cached, group_start, "cache", 0)))
+    if len(pending) == 1:
+        i = pending[0]
+        return results + [(i, *await answer_question(i, questions[i], retrievals[i], semaphore, digest))]
+    if not pending:
+        return results
+
+    logger.debug("Answering questions {questions} in one packed prompt", questions=[i + 1 for i in pending])
+    try:
+        async with semaphore, admission.slot("questions", current_deadline()):
+            llm_start = time.time()
+            answers = await query_llm_packed_async(
+                [questions[i] for i in pending], merge_contexts([retrievals[i] for i in pending])
+            )
+            llm_time = time.time() - llm_start
+            metrics.observe_stage("llm", llm_time)
+            llm_time = round(llm_time, 2)
+    except (RuntimeError, ValueError) as e:
+        logger.warning("Packed prompt failed ({error}); answering questions one by one", error=str(e))
+        singles = await asyncio.gather(*(
+            answer_question(i, questions[i], retrievals[i], semaphore, digest) for i in pending
+        ))
+        return results + [(i, *single) for i, single in zip(pending, singles)]
+
+    for i, answer in zip(pending, answers):
+        await asyncio.to_thread(answer_cache.put, answer_key(digest, questions[i], retrievals[i]), digest, answer)
+        results.append((i, *finish_answer(i, questions[i], answer, group_start, "packed LLM", llm_time)))
+    return results
+
+async def retrieve_contexts(questions: list, doc_id: str, performance_metrics: dict) -> list:
+    """
+    Retrieve candidate chunks for every question with at most one embedding
+    call (hybrid BM25 + vector search), then narrow each to a de-duplicated,
+    token-budgeted prompt context.
+    """
+    with metrics.stage_timer("retrieval"):
+        query_vectors, candidates = await hybrid_candidates_batch_async(questions, doc_id, top_k=CONTEXT_CANDIDATES)
+        contexts, token_stats = await asyncio.to_thread(select_contexts, query_vectors, candidates, CONTEXT_MAX_CHUNKS)
+    performance_metrics["context_tokens"] = token_stats
+    logger.info(
+        "Context selection saved {saved} of {retrieved} prompt tokens",
+        saved=token_stats["saved"], retrieved=token_stats["retrieved"],
+    )
+    return contexts
+
+async def run_ingestion_job(job: dict, content: bytes = None):
+    """
+    Body of a background ingestion job: download the job's URL unless the
+    content was uploaded, then index it. Records the document's content
+    hash and stage timings on the job.
+    """
+    performance_metrics = {}
+    try:
+        # Shares the ingestion slots with queries, but waits instead of being rejected
+        async with admission.slot("ingestion", bounded=False):
+            refetch = None
+            if content is None:
+                download_start = time.time()
+                with metrics.stage_timer("download"):
+                    content, digest = await fetch_document(job["source"])
+                job["timings"]["download"] = round(time.time() - download_start, 3)
+                refetch = _refetch(job["source"])
+            else:
+                digest = job["digest"]
+            # Background ingestion yields Azure quota to interactive queries
+            with scheduling(priority=BULK):
+                await index_document(content, digest, performance_metrics, refetch)
+    except Exception:
+        if job.get("digest"):
+            # The upload's alias was written on submit; other workers must not wait on it
+            await asyncio.to_thread(document_cache.remove_alias, job["document_id"])
+        raise
+    job["digest"] = digest
+    # Resolvable by every worker process, and after a restart
+    await asyncio.to_thread(document_cache.add_alias, job["document_id"], digest)
+    job["document_cache"] = performance_metrics["document_cache"]
+    if "ingestion_stages" in performance_metrics:
+        job["timings"]["ingestion"] = performance_metrics["ingestion_stages"]
+        job["embedding_cache"] = performance_metrics["embedding_cache"]
+
+async def resolve_document_id(document_id: str) -> str:
+    """
+    Content hash of a document submitted to POST /api/v1/documents, waiting
+    for its ingestion to finish if it is still queued or running here.
+    Documents ingested by another worker process (or before a restart) are
+    found through the document cache; uploads still being ingested there
+    get a 409 to retry.
+    """
+    job = await ingestion_jobs.wait(document_id)
+    if job is None:
+        digest = await asyncio.to_thread(document_cache.resolve_alias, document_id)
+        if digest is None:
+            raise HTTPException(status_code=404, detail=f"Unknown document_id: {document_id}")
+        if digest not in document_cache:
+            # Evictions remove aliases, so another worker is still ingesting it
+            raise HTTPException(
+                status_code=409, detail=f"Document {document_id} is still being ingested; retry shortly",
+                headers={"Retry-After": "2"},
+            )
+    elif job["status"] == FAILED:
+        raise HTTPException(status_code=422, detail=f"Ingestion of {document_id} failed: {job['error']}")
+    else:
+        digest = job["digest"]
+    if digest not in document_cache:
+        raise HTTPException(status_code=410, detail=f"Document {document_id} was evicted; submit it again")
+    return digest
+
+async def prepare_questions(request: DocumentQueryRequest, performance_metrics: dict):
+    """
+    Download and index the request's document (or look up the one ingested
+    under its document_id) and retrieve the chunks of every question;
+    returns (digest, retrievals).
+    """
+    # Downloading, parsing and embedding hold one of the ingestion slots; a
+    # document ingested in the background only needs looking up
+    slot = nullcontext() if request.document_id else admission.slot("ingestion", current_deadline())
+    async with slot:
+        if request.document_id:
+            document_content, digest = None, await resolve_document_id(request.document_id)
+        else:
+            logger.info("Downloading document from {url}", url=request.documents)
+
+            # Download document with timeout (conditional when we have a cached copy)
+            download_start = time.time()
+            with metrics.stage_timer("download"):
+                document_content, digest = await fetch_document(request.documents)
+            download_time = round(time.time() - download_start, 2)
+            performance_metrics["download_time"] = download_time
+            logger.debug("Download completed in {seconds}s", seconds=download_time)
+
+        # Keep the document in memory from indexing until retrieval is done
+        with pinned_document(document_id_for(digest)):
+            refetch = None if request.document_id else _refetch(request.documents)
+            doc_id = await index_document(document_content, digest, performance_metrics, refetch)
+
+            logger.debug("Processing {count} questions", count=len(request.questions))
+
+            # Find relevant chunks for all questions with one embedding call
+            search_start = time.time()
+            retrievals = await retrieve_contexts(request.questions, doc_id, performance_metrics)
+    performance_metrics["search_time"] = round(time.time() - search_start, 2)
+    return digest, retrievals
+
+def _stream_format(accept: str) -> Optional[str]:
+    """Streaming media type requested by an Accept header, if any."""
+    accept = (accept or "").lower()
+    if "text/event-stream" in accept:
+        return "text/event-stream"
+    if "application/x-ndjson" in accept:
+        return "application/x-ndjson"
+    return None
+
+def _encode_event(media_type: str, event: str, data: dict) -> str:
+    if media_type == "text/event-stream":
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return json.dumps({"event": event, **data}) + "\n"
+
+async def stream_answers(media_type: str, request: DocumentQueryRequest, digest: str, retrievals: list,
+                         start_time: float, performance_metrics: dict, deadline: float = None):
+    """
+    Yield an "ingested" event, then one "answer" event per question as soon
+    as it is answered (tagged with its index), then a "summary" event. If
+    the request's deadline (time.monotonic()) passes first, the unanswered
+    questions are abandoned and an "error" event ends the stream.
+    """
+    yield _encode_event(media_type, "ingested", {
+        "questions": len(request.questions),
+        "elapsed": round(time.time() - start_time, 2),
+        **performance_metrics,
+    })
+
+    semaphore = asyncio.Semaphore(QUESTION_CONCURRENCY)
+    groups = plan_question_groups(request.questions, retrievals)
+    if LLM_PACKED_MODE:
+        performance_metrics["packed_groups"] = groups
+    # Tasks inherit the deadline, so their upstream calls are bounded by it too
+    with scheduling(deadline=deadline):
+        tasks = [
+            asyncio.create_task(answer_group(group, request.questions, retrievals, semaphore, digest))
+            for group in groups
+        ]
+    answers = [None] * len(request.questions)
+    first_answer_time = None
+    timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+    try:
+        for next_done in asyncio.as_completed(tasks, timeout=timeout):
+            try:
+                group_results = await next_done
+            except (asyncio.TimeoutError, AdmissionRejected, SchedulerRejected) as e:
+                detail = "Request deadline exceeded" if isinstance(e, asyncio.TimeoutError) else str(e)
+                logger.warning("Streaming stopped: {detail}", detail=detail)
+                yield _encode_event(media_type, "error", {"detail": detail, "answers": answers})
+                return
+            for i, answer, question_time in sorted(group_results):
+                answers[i] = answer
+                elapsed = round(time.time() - start_time, 2)
+                if first_answer_time is None:
+                    first_answer_time = elapsed
+                yield _encode_event(media_type, "answer", {
+                    "index": i, "answer": answer, "question_time": question_time, "elapsed": elapsed,
+                })
+    finally:
+        # The client may have disconnected; don't keep answering for nobody
+        for task in tasks:
+            task.cancel()
+
+    performance_metrics["time_to_first_answer"] = first_answer_time
+    performance_metrics["total_time"] = round(time.time() - start_time, 2)
+    logger.info("Streamed {count} answers", count=len(answers), **performance_metrics)
+    summary = {"answers": answers, **performance_metrics}
+    timings = metrics.request_timings()
+    if timings is not None:
+        # The Server-Timing header went out before the answers were generated
+        summary["server_timing"] = metrics.server_timing_header({**timings, "total": time.time() - start_time})
+    yield _encode_event(media_type, "summary", summary)
+
+@app.post("/api/v1/hackrx/run", response_model=DocumentQueryResponse, response_model_exclude_none=True)
 async def run_document_queries(
     request: DocumentQueryRequest,
-    token: str = Depends(verify_token)
+    token: str = Depends(verify_token),
+    accept: Optional[str] = Header(None),
+    x_request_timeout: Optional[str] = Header(None)
 ):
     """
     Main endpoint to query documents with questions.
+
+    With "Accept: application/x-ndjson" or "Accept: text/event-stream" the
+    answers are streamed as they complete instead of returned together.
+    When the server is saturated the request is refused with 503 or 429
+    and a Retry-After header; work still running at the request's deadline
+    (X-Request-Timeout seconds, capped by REQUEST_TIMEOUT_SECONDS) is
+    cancelled with a 504.
     """
     start_time = time.time()
     performance_metrics = {}
+    deadline = request_deadline(x_request_timeout)
     
     try:
-        print(f"📥 Downloading document from: {request.documents}")
-        
-        # Download document with timeout
-        download_start = time.time()
-        response = requests.get(request.documents, timeout=30)
-        response.raise_for_status()
-        document_content = response.content
-        download_time = round(time.time() - download_start, 2)
-        performance_metrics["download_time"] = download_time
-        print(f"⏱️ Download completed in {download_time}s")
-        
-        # Save document
-        save_start = time.time()
-        filename = f"document_{int(time.time())}.pdf"
-        saved_path = await file_manager.save_uploaded_file(document_content, filename)
-        save_time = round(time.time() - save_start, 2)
-        performance_metrics["save_time"] = save_time
-        print(f"📄 Document saved in {save_time}s")
-        
-        # Process document
-        process_start = time.time()
-        text = load_document(saved_path)
-        chunks = chunk_document(text)
-        embeddings = embed_chunks(chunks)
-        
-        doc_id = file_manager.generate_document_id(filename)
-        store_embeddings(doc_id, chunks, embeddings)
-        process_time = round(time.time() - process_start, 2)
-        performance_metrics["processing_time"] = process_time
-        print(f"🔍 Document processed in {process_time}s")
+        # Refuse before downloading anything when the queues are already full
+        if not request.document_id:
+            admission.check("ingestion")
+        admission.check("questions")
+
+        with scheduling(deadline=deadline):
+            async with asyncio.timeout_at(deadline):
+                digest, retrievals = await prepare_questions(request, performance_metrics)
         
-        print(f"🔍 Processing {len(request.questions)} questions...")
+        media_type = _stream_format(accept)
+        if media_type:
+            return StreamingResponse(
+                stream_answers(media_type, request, digest, retrievals, start_time, performance_metrics, deadline),
+                media_type=media_type,
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
         
-        # Process each question
-        answers = []
-        question_times = []
-        for i, question in enumerate(request.questions):
-            try:
-                question_start = time.time()
-                print(f"❓ Processing question {i+1}: {question[:50]}...")
-                
-                # Find relevant chunks
-                search_start = time.time()
-                relevant_chunks = search_similar_chunks(question, doc_id, top_k=5)
-                search_time = round(time.time() - search_start, 2)
-                
-                # Generate answer using LLM
-                llm_start = time.time()
-                answer = query_llm(question, relevant_chunks)
-                llm_time = round(time.time() - llm_start, 2)
-                
-                # Clean and format the answer
-                answer = answer.strip()
-                if answer.startswith("Based on the document"):
-                    answer = answer.replace("Based on the document, ", "").replace("Based on the document,", "")
-                
-                # Evaluate accuracy
-                accuracy_metrics = evaluate_accuracy(question, answer)
-                
-                answers.append(answer)
-                question_time = round(time.time() - question_start, 2)
-                question_times.append(question_time)
-                print(f"✅ Question {i+1} processed in {question_time}s (search: {search_time}s, LLM: {llm_time}s, accuracy: {accuracy_metrics['accuracy_score']}%)")
-                
-            except Exception as e:
-                print(f"❌ Error processing question {i+1}: {str(e)}")
-                answers.append(f"Error processing question: {str(e)}")
-                question_times.append(0)
+        # Answer question groups concurrently, then restore the original order
+        semaphore = asyncio.Semaphore(QUESTION_CONCURRENCY)
+        groups = plan_question_groups(request.questions, retrievals)
+        with scheduling(deadline=deadline):
+            async with asyncio.timeout_at(deadline):
+                grouped = await asyncio.gather(*(
+                    answer_group(group, request.questions, retrievals, semaphore, digest) for group in groups
+                ))
+        results = sorted(result for group_results in grouped for result in group_results)
+        answers = [answer for _, answer, _ in results]
+        question_times = [question_time for _, _, question_time in results]
+        packed_groups = groups if LLM_PACKED_MODE else None
+        if packed_groups:
+            performance_metrics["packed_groups"] = packed_groups
         
         elapsed = round(time.time() - start_time, 2)
         performance_metrics["total_time"] = elapsed
         performance_metrics["avg_question_time"] = round(sum(question_times) / len(question_times), 2)
         performance_metrics["question_times"] = question_times
         
-        print(f"⏱️ Total processing time: {elapsed} seconds")
-        print(f"📊 Performance metrics: {performance_metrics}")
+        logger.info("Answered {count} questions in {seconds}s", count=len(answers), seconds=elapsed, **performance_metrics)
         
-        # Cleanup
-        await file_manager.cleanup_file(saved_path)
+        return DocumentQueryResponse(answers=answers, packed_groups=packed_groups)
         
-        return DocumentQueryResponse(answers=answers)
-        
-    except requests.RequestException as e:
+    except HTTPException:
+        raise
+    except (AdmissionRejected, SchedulerRejected) as e:
+        raise overload_error(e)
+    except TimeoutError:
+        logger.warning("Request deadline exceeded after {seconds:.2f}s", seconds=time.time() - start_time)
+        raise HTTPException(status_code=504, detail="Request deadline exceeded")
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=400, detail=f"Failed to download document: {str(e)}")
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Failed to answer document queries")
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
+@app.post("/api/v1/documents", status_code=202)
+async def submit_document(request: Request, token: str = Depends(verify_token)):
+    """
+    Queue a document for background ingestion and return its document_id
+    right away. Send JSON {"url": ...} or a multipart form with a "file"
+    upload (or a "url" field). Poll GET /api/v1/documents/{document_id}
+    for progress, or pass the ID as document_id to the query endpoints.
+    Submitting a URL or content that is already being ingested returns the
+    existing job.
+    """
+    if "application/json" in request.headers.get("content-type", ""):
+        try:
+            body = await request.json()
+        except ValueError:
+            body = None
+        url, upload = (body.get("url") if isinstance(body, dict) else None), None
+    else:
+        form = await request.form()
+        url, upload = form.get("url"), form.get("file")
+
+    try:
+        if upload is not None and not isinstance(upload, str):
+            content = await upload.read()
+            digest = content_hash(content)
+            job = ingestion_jobs.submit(
+                f"content:{digest}", lambda job: run_ingestion_job(job, content),
+                job_id=document_id_for(digest), source=upload.filename or "upload", digest=digest,
+            )
+            # Other worker processes can resolve the ID before ingestion finishes
+            await asyncio.to_thread(document_cache.add_alias, job["document_id"], digest)
+        elif url:
+            job = ingestion_jobs.submit(f"url:{url}", run_ingestion_job, source=url)
+        else:
+            raise HTTPException(status_code=422, detail="Provide a url or a file upload")
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+    return {
+        "document_id": job["document_id"],
+        "status": job["status"],
+        "status_url": f"/api/v1/documents/{job['document_id']}",
+    }
+
+@app.get("/api/v1/documents/{document_id}")
+def document_status(document_id: str, token: str = Depends(verify_token)):
+    """Status ("queued", "running", "ready" or "failed") and timings of an ingestion job."""
+    job = ingestion_jobs.get(document_id)
+    if job is None:
+        # Submitted to another worker process, or ingested before a restart
+        digest = document_cache.resolve_alias(document_id)
+        if digest is None:
+            raise HTTPException(status_code=404, detail=f"Unknown document_id: {document_id}")
+        return {"document_id": document_id, "status": READY if digest in document_cache else RUNNING, "digest": digest}
+    return job
+
+@app.post("/api/v1/search")
+async def search_corpus(
+    request: SearchRequest,
+    token: str = Depends(verify_token),
+    x_request_timeout: Optional[str] = Header(None)
+):
+    """
+    Top-k chunks for a query across every ingested document, with the
+    document ID, cosine score and source pages of each.
+    """
+    if corpus_index is None:
+        raise HTTPException(status_code=404, detail="Corpus search is disabled (CORPUS_INDEX_DIR is empty)")
+    start_time = time.time()
+    deadline = request_deadline(x_request_timeout)
+    try:
+        with scheduling(deadline=deadline):
+            async with asyncio.timeout_at(deadline):
+                with metrics.stage_timer("retrieval"):
+                    [query_vector] = await embed_chunks_async([request.query])
+                    [results] = await asyncio.to_thread(corpus_index.search, [query_vector], request.top_k)
+    except SchedulerRejected as e:
+        raise overload_error(e)
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail="Request deadline exceeded")
+    except RuntimeError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    return {"results": results, "search_time": round(time.time() - start_time, 3)}
+
+@app.get("/api/v1/admin/corpus")
+def admin_corpus_index(token: str = Depends(verify_token)):
+    """Size and shape of the corpus-wide search index."""
+    if corpus_index is None:
+        raise HTTPException(status_code=404, detail="Corpus search is disabled (CORPUS_INDEX_DIR is empty)")
+    return corpus_index.stats()
+
 # Legacy endpoint for backward compatibility
 @app.post("/query/")
-async def query_document(file: UploadFile = File(...), query: str = ""):
+async def query_document(file: UploadFile = File(None), query: str = "", document_id: Optional[str] = None,
+                         x_request_timeout: Optional[str] = Header(None)):
     """
-    Legacy endpoint to query a document (for testing purposes).
+    Legacy endpoint to query a document (for testing purposes): an uploaded
+    file, or a document_id from POST /api/v1/documents.
     """
     start_time = time.time()
-    content = await file.read()
-    saved_path = await file_manager.save_uploaded_file(content, file.filename)
+    deadline = request_deadline(x_request_timeout)
 
     try:
-        text = load_document(saved_path)
-        chunks = chunk_document(text)
-        embeddings = embed_chunks(chunks)
+        if document_id:
+            content, digest = None, await resolve_document_id(document_id)
+        elif file is not None:
+            content = await file.read()
+            digest = content_hash(content)
+        else:
+            raise HTTPException(status_code=422, detail="Provide a file or a document_id")
 
-        doc_id = file_manager.generate_document_id(file.filename)
-        store_embeddings(doc_id, chunks, embeddings)
+        admission.check("questions")
+        with scheduling(deadline=deadline):
+            async with asyncio.timeout_at(deadline):
+                slot = nullcontext() if document_id else admission.slot("ingestion", deadline)
+                async with slot:
+                    with pinned_document(document_id_for(digest)):
+                        doc_id = await index_document(content, digest, {})
+                        relevant_chunks = (await retrieve_contexts([query], doc_id, {}))[0]
 
-        relevant_chunks = search_similar_chunks(query, doc_id)
-
-        try:
-            answer = query_llm(query, relevant_chunks)
-        except RuntimeError as e:
-            raise HTTPException(status_code=500, detail=str(e))
-
-        await file_manager.cleanup_file(saved_path)
+                try:
+                    answer, _ = await answer_cache.get_or_compute(
+                        answer_key(digest, query, relevant_chunks),
+                        digest,
+                        lambda: ask_llm(query, relevant_chunks),
+                    )
+                except RuntimeError as e:
+                    raise HTTPException(status_code=500, detail=str(e))
 
         return {
             "answer": answer,
             "processing_time": round(time.time() - start_time, 2)
         }
 
+    except HTTPException:
+        raise
+    except (AdmissionRejected, SchedulerRejected) as e:
+        raise overload_error(e)
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail="Request deadline exceeded")
     except Exception as e:
-        await file_manager.cleanup_file(saved_path)
         raise HTTPException(status_code=500, detail=str(e))
-
-# Development-only: Auto-open browser
-if os.getenv("ENVIRONMENT", "development") == "development":
-    try:
-        webbrowser.open_new("http://localhost:8000/docs")
-    except:
-        pass
@@ -0,0 +1,136 @@
+# app/services/admission.py
+
+import math
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+
+from loguru import logger
+
+from app.services.metrics import ADMISSION_ACTIVE, ADMISSION_QUEUED, ADMISSION_REJECTED
+
+class AdmissionRejected(Exception):
+    """Work refused because the server is saturated; retry after retry_after seconds."""
+
+    def __init__(self, message: str, retry_after: float = 1.0, status_code: int = 503):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+class _Pool:
+    def __init__(self, limit: int, max_queued: int):
+        self.limit = limit
+        self.max_queued = max_queued
+        self.active = 0
+        self.waiters = deque()
+        # Smoothed seconds a slot is held, for Retry-After estimates
+        self.hold_seconds = 1.0
+        self.admitted = 0
+        self.rejected = 0
+
+class AdmissionController:
+    """
+    Bounded slots for expensive work (e.g. "ingestion": download + parse +
+    embed, "questions": LLM calls), shared by all requests of the process.
+
+    At most `limit` holders run at once and at most `max_queued` callers
+    wait for a slot; a caller beyond that, or one whose deadline passes
+    while waiting, gets AdmissionRejected with a Retry-After estimate
+    instead of piling up. A limit of 0 disables a pool. Meant for the
+    single event loop of a server process.
+    """
+
+    def __init__(self, limits: dict):
+        # limits: pool name -> (concurrent slots, waiting callers)
+        self.pools = {name: _Pool(limit, max_queued) for name, (limit, max_queued) in limits.items()}
+
+    def _retry_after(self, pool: _Pool) -> float:
+        # Time for the queue ahead to drain through the pool's slots
+        return pool.hold_seconds * (len(pool.waiters) + 1) / max(1, pool.limit)
+
+    def _reject(self, name: str, pool: _Pool, reason: str):
+        pool.rejected += 1
+        ADMISSION_REJECTED.labels(name, reason).inc()
+        retry_after = self._retry_after(pool)
+        logger.warning("Rejected {pool} work ({reason}), retry after {seconds:.1f}s",
+                       pool=name, reason=reason, seconds=retry_after)
+        raise AdmissionRejected(f"Server is busy ({name} {reason}); retry later", retry_after)
+
+    def check(self, name: str):
+        """Reject up front when the pool's queue is already full."""
+        pool = self.pools[name]
+        if pool.limit and pool.active >= pool.limit and len(pool.waiters) >= pool.max_queued:
+            self._reject(name, pool, "queue full")
+
+    @asynccontextmanager
+    async def slot(self, name: str, deadline: float = None, bounded: bool = True):
+        """
+        Hold one slot of pool `name` for the block. deadline is a
+        time.monotonic() value; bounded=False waits regardless of the
+        queue limit (for background work that has no client waiting).
+        """
+        pool = self.pools[name]
+        if not pool.limit:
+            yield
+            return
+
+        if pool.active < pool.limit and not pool.waiters:
+            pool.active += 1
+        else:
+            if bounded and len(pool.waiters) >= pool.max_queued:
+                self._reject(name, pool, "queue full")
+            future = asyncio.get_running_loop().create_future()
+            pool.waiters.append(future)
+            ADMISSION_QUEUED.labels(name).inc()
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                # A released slot is handed over directly, so active is unchanged
+                await asyncio.wait_for(future, timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if future.done() and not future.cancelled():
+                    # Granted just as we gave up; pass the slot on
+                    self._release(pool)
+                elif future in pool.waiters:
+                    pool.waiters.remove(future)
+                if isinstance(e, asyncio.TimeoutError):
+                    self._reject(name, pool, "deadline")
+                raise
+            finally:
+                ADMISSION_QUEUED.labels(name).dec()
+
+        pool.admitted += 1
+        ADMISSION_ACTIVE.labels(name).inc()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            pool.hold_seconds = 0.8 * pool.hold_seconds + 0.2 * (time.monotonic() - start)
+            ADMISSION_ACTIVE.labels(name).dec()
+            self._release(pool)
+
+    def _release(self, pool: _Pool):
+        while pool.waiters:
+            future = pool.waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        pool.active -= 1
+
+    def stats(self) -> dict:
+        return {
+            name: {
+                "limit": pool.limit,
+                "max_queued": pool.max_queued,
+                "active": pool.active,
+                "queued": sum(1 for future in pool.waiters if not future.done()),
+                "admitted": pool.admitted,
+                "rejected": pool.rejected,
+                "avg_hold_seconds": round(pool.hold_seconds, 3),
+            }
+            for name, pool in self.pools.items()
+        }
@@ -0,0 +1,252 @@
+# app/services/answer_cache.py
+
+import re
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+from loguru import logger
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    return re.sub(r"\s+", " ", question).strip().rstrip("?.!").strip().lower()
+
+
+def chunk_ids(chunks: list) -> list:
+    """
+    Content-addressed IDs of retrieved chunks. Documents are keyed by the
+    hash of their bytes, so a chunk's text identifies it within a document.
+    """
+    return [hashlib.sha256(chunk.encode("utf-8")).hexdigest()[:16] for chunk in chunks]
+
+
+def answer_key(document_hash: str, question: str, chunks: list) -> str:
+    """Cache key of an answer: document, normalized question and retrieved context."""
+    context_hash = hashlib.sha256("\n".join(chunk_ids(chunks)).encode("utf-8")).hexdigest()
+    raw = "\0".join([document_hash, normalize_question(question), context_hash])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """
+    Two-tier cache of LLM answers: an in-memory LRU in front of an optional
+    SQLite file, so repeated questions survive restarts.
+
+    Entries expire after ttl_seconds and can be dropped per document when
+    its content changes. Each write also purges expired rows from the
+    SQLite file and, beyond max_disk_entries, the oldest ones.
+    get_or_compute collapses concurrent lookups of the same key into one
+    upstream call; failures are never cached.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        ttl_seconds: int = 24 * 3600,
+        db_path: Optional[str] = None,
+        max_disk_entries: int = 100_000,
+    ):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        self._lock = threading.RLock()
+        # key -> (answer, document_hash, created_at)
+        self._memory = OrderedDict()
+        self._in_flight = {}
+        self._db = self._open_db(db_path) if db_path else None
+
+    # Disk tier
+
+    def _open_db(self, db_path: str):
+        try:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(db_path, check_same_thread=False)
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "key TEXT PRIMARY KEY, document_hash TEXT, answer TEXT, created_at REAL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS answers_document ON answers (document_hash)")
+            db.execute("CREATE INDEX IF NOT EXISTS answers_created ON answers (created_at)")
+            db.commit()
+            return db
+        except sqlite3.Error as e:
+            logger.warning(f"Answer cache disk tier disabled: {e}")
+            return None
+
+    def _db_get(self, key: str):
+        row = self._db.execute(
+            "SELECT answer, document_hash, created_at FROM answers WHERE key = ?", (key,)
+        ).fetchone()
+        return tuple(row) if row else None
+
+    def _db_execute(self, sql: str, params: tuple):
+        try:
+            self._db.execute(sql, params)
+            self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Answer cache write failed: {e}")
+
+    def _db_put(self, key: str, entry: tuple):
+        try:
+            with self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO answers (key, answer, document_hash, created_at) VALUES (?, ?, ?, ?)",
+                    (key, *entry),
+                )
+                # Expired rows would otherwise only go when their key is looked up again
+                if self.ttl_seconds > 0:
+                    cursor = self._db.execute(
+                        "DELETE FROM answers WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+                    )
+                    self.disk_evictions += cursor.rowcount
+                if self.max_disk_entries > 0:
+                    cursor = self._db.execute(
+                        "DELETE FROM answers WHERE key IN "
+                        "(SELECT key FROM answers ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                        (self.max_disk_entries,),
+                    )
+                    self.disk_evictions += cursor.rowcount
+        except sqlite3.Error as e:
+            logger.warning(f"Answer cache write failed: {e}")
+
+    # Entries
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_seconds > 0 and time.time() - created_at > self.ttl_seconds
+
+    def _lookup(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None and self._db is not None:
+                entry = self._db_get(key)
+                if entry is not None:
+                    self._remember(key, entry)
+            if entry is None:
+                return None
+            if self._expired(entry[2]):
+                self._drop(key)
+                return None
+            self._memory.move_to_end(key)
+            return entry[0]
+
+    def _remember(self, key: str, entry: tuple):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _drop(self, key: str):
+        self._memory.pop(key, None)
+        if self._db is not None:
+            self._db_execute("DELETE FROM answers WHERE key = ?", (key,))
+
+    def _count(self, hit: bool, coalesced: bool = False):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            if coalesced:
+                self.coalesced += 1
+
+    def get(self, key: str) -> Optional[str]:
+        """Cached answer for a key, recording a hit or miss."""
+        answer = self._lookup(key)
+        self._count(answer is not None)
+        return answer
+
+    def put(self, key: str, document_hash: str, answer: str):
+        with self._lock:
+            entry = (answer, document_hash, time.time())
+            self._remember(key, entry)
+            if self._db is not None:
+                self._db_put(key, entry)
+
+    def invalidate_document(self, document_hash: str):
+        """Drop every answer given for a document, e.g. after its content changed."""
+        with self._lock:
+            for key in [k for k, e in self._memory.items() if e[1] == document_hash]:
+                del self._memory[key]
+            if self._db is not None:
+                self._db_execute("DELETE FROM answers WHERE document_hash = ?", (document_hash,))
+
+    async def get_or_compute(self, key: str, document_hash: str, compute: Callable[[], Awaitable[str]]) -> tuple:
+        """
+        Return (answer, cached). Identical concurrent lookups share one
+        compute() call; its result is cached only if it succeeds.
+        """
+        while True:
+            in_flight = self._in_flight.get(key)
+            if in_flight is None:
+                if self._db is not None:
+                    answer = await asyncio.to_thread(self._lookup, key)
+                else:
+                    answer = self._lookup(key)
+                if answer is not None:
+                    self._count(hit=True)
+                    return answer, True
+                # Another coroutine may have started while we read the disk tier
+                in_flight = self._in_flight.get(key)
+            if in_flight is None:
+                break
+            try:
+                answer = await asyncio.shield(in_flight)
+            except asyncio.CancelledError:
+                if in_flight.cancelled():
+                    # The caller doing the work went away; take over
+                    continue
+                raise
+            self._count(hit=True, coalesced=True)
+            return answer, True
+
+        self._count(hit=False)
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            answer = await compute()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody else may be waiting; don't warn about an unretrieved exception
+            future.exception()
+            raise
+        else:
+            future.set_result(answer)
+            if self._db is not None:
+                await asyncio.to_thread(self.put, key, document_hash, answer)
+            else:
+                self.put(key, document_hash, answer)
+            return answer, False
+        finally:
+            self._in_flight.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            size = len(self._memory)
+            if self._db is not None:
+                size = self._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            return {
+                "entries": size,
+                "memory_entries": len(self._memory),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "disk_evictions": self.disk_evictions,
+            }
@@ -1,5 +1,11 @@
 # app/services/chunker.py
 
+import re
+from collections import deque
+
+from app.config import CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS
+from app.utils.helpers import estimate_tokens
+
 def chunk_document(document: str, max_chunk_size: int = 500) -> list:
     words = document.split()
     chunks = []
@@ -7,3 +13,101 @@ def chunk_document(document: str, max_chunk_size: int = 500) -> list:
         chunk = " ".join(words[i:i + max_chunk_size])
         chunks.append(chunk.strip())
     return chunks
+
+# Paragraph breaks, or whitespace after sentence-ending punctuation
+_BOUNDARY = re.compile(r"\n\s*\n|(?<=[.!?;:])\s+")
+
+def _segments(text: str, base: int):
+    """
+    Yield (start, end, text, ends_paragraph) sentence segments of a page,
+    with offsets relative to the whole document.
+    """
+    position = 0
+    for match in _BOUNDARY.finditer(text):
+        if match.start() > position:
+            yield base + position, base + match.start(), text[position:match.start()], "\n" in match.group()
+        position = match.end()
+    if position < len(text):
+        yield base + position, base + len(text), text[position:], True
+
+def _split_long(start: int, text: str, max_chars: int):
+    """
+    Split a segment with no usable sentence boundary at whitespace.
+    """
+    position = 0
+    while len(text) - position > max_chars:
+        cut = text.rfind(" ", position, position + max_chars)
+        if cut <= position:
+            cut = position + max_chars
+        yield start + position, start + cut, text[position:cut]
+        position = cut
+        while position < len(text) and text[position].isspace():
+            position += 1
+    if position < len(text):
+        yield start + position, start + len(text), text[position:]
+
+def iter_token_chunks(pages, max_tokens: int = None, overlap_tokens: int = None):
+    """
+    Stream token-budgeted chunks from an iterable of page texts.
+
+    Chunks are packed from whole sentences, end early at a paragraph break
+    once they are three-quarters full, and start with up to overlap_tokens
+    of the previous chunk's trailing sentences. Each chunk is a dict with
+    "text", "page" / "last_page" (1-based) and "start" / "end" character
+    offsets into the concatenated page texts.
+    """
+    max_tokens = max_tokens or CHUNK_MAX_TOKENS
+    overlap_tokens = CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    max_chars = max_tokens * 4
+
+    # (start, end, text, tokens, page) of the sentences in the open chunk
+    current = deque()
+    current_tokens = 0
+    # Sentences added since the last emitted chunk (the rest is overlap)
+    fresh = 0
+
+    def emit():
+        nonlocal current_tokens, fresh
+        chunk = {
+            "text": " ".join(segment[2] for segment in current),
+            "page": current[0][4],
+            "last_page": current[-1][4],
+            "start": current[0][0],
+            "end": current[-1][1],
+        }
+        # Keep the longest run of trailing sentences that fits the overlap
+        kept, kept_tokens = 0, 0
+        for segment in reversed(current):
+            if kept + 1 == len(current) or kept_tokens + segment[3] > overlap_tokens:
+                break
+            kept += 1
+            kept_tokens += segment[3]
+        for _ in range(len(current) - kept):
+            current.popleft()
+        current_tokens, fresh = kept_tokens, 0
+        return chunk
+
+    base = 0
+    for page_number, page in enumerate(pages, start=1):
+        for start, end, text, ends_paragraph in _segments(page, base):
+            stripped = text.strip()
+            if not stripped:
+                continue
+            start += len(text) - len(text.lstrip())
+            end -= len(text) - len(text.rstrip())
+            pieces = [(start, end, stripped)] if len(stripped) <= max_chars else _split_long(start, stripped, max_chars)
+            for piece_start, piece_end, piece in pieces:
+                tokens = estimate_tokens(piece)
+                if fresh and current_tokens + tokens > max_tokens:
+                    yield emit()
+                # Overlap never pushes a new sentence over the budget
+                while current and not fresh and current_tokens + tokens > max_tokens:
+                    current_tokens -= current.popleft()[3]
+                current.append((piece_start, piece_end, piece, tokens, page_number))
+                current_tokens += tokens
+                fresh += 1
+            if ends_paragraph and fresh and current_tokens >= max_tokens * 3 // 4:
+                yield emit()
+        base += len(page)
+    if fresh:
+        yield emit()
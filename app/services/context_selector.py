@@ -0,0 +1,99 @@
+# app/services/context_selector.py
+
+import re
+
+import numpy as np
+
+from app.config import (
+    CONTEXT_MAX_TOKENS,
+    CONTEXT_MAX_CHUNKS,
+    CONTEXT_MMR_LAMBDA,
+    CONTEXT_DUPLICATE_THRESHOLD,
+)
+from app.services.numpy_store import normalize_rows
+from app.utils.helpers import estimate_tokens
+
+_SENTENCE_END = re.compile(r"(?<=[.!?;:])\s+")
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Longest run of leading whole sentences of text within max_tokens
+    (empty if even the first sentence does not fit).
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    kept, used = [], 0
+    for sentence in _SENTENCE_END.split(text):
+        tokens = estimate_tokens(sentence) + (1 if kept else 0)
+        if used + tokens > max_tokens:
+            break
+        kept.append(sentence)
+        used += tokens
+    return " ".join(kept)
+
+def mmr_order(query_vector, embeddings, max_chunks: int, lambda_mult: float, duplicate_threshold: float) -> list:
+    """
+    Indices of candidates in Maximal Marginal Relevance order, skipping
+    near-duplicates (cosine similarity >= duplicate_threshold to a chunk
+    already picked). Without a query vector (lexical fast path) relevance
+    falls linearly with the candidates' rank.
+    """
+    matrix = normalize_rows(embeddings)
+    if query_vector is None:
+        relevance = 1 - np.arange(len(matrix), dtype=np.float32) / len(matrix)
+    else:
+        relevance = matrix @ normalize_rows([query_vector])[0]
+    similarity = matrix @ matrix.T
+    # Highest similarity of each candidate to anything picked so far
+    redundancy = np.zeros(len(matrix), dtype=np.float32)
+    available = np.ones(len(matrix), dtype=bool)
+    order = []
+    while len(order) < max_chunks and available.any():
+        scores = np.where(available, lambda_mult * relevance - (1 - lambda_mult) * redundancy, -np.inf)
+        best = int(np.argmax(scores))
+        order.append(best)
+        redundancy = np.maximum(redundancy, similarity[best])
+        available[best] = False
+        available &= redundancy < duplicate_threshold
+    return order
+
+def select_context(query_vector, chunks: list, embeddings, max_tokens: int = None, max_chunks: int = None,
+                   lambda_mult: float = None, duplicate_threshold: float = None) -> list:
+    """
+    Pick the prompt context of one question from its retrieved candidates:
+    MMR re-ranking, near-duplicate removal and a token budget, where the
+    last chunk that does not fit whole is trimmed at a sentence boundary.
+    """
+    max_tokens = max_tokens or CONTEXT_MAX_TOKENS
+    max_chunks = max_chunks or CONTEXT_MAX_CHUNKS
+    lambda_mult = CONTEXT_MMR_LAMBDA if lambda_mult is None else lambda_mult
+    duplicate_threshold = duplicate_threshold or CONTEXT_DUPLICATE_THRESHOLD
+    if not chunks:
+        return []
+
+    selected, remaining = [], max_tokens
+    for i in mmr_order(query_vector, embeddings, max_chunks, lambda_mult, duplicate_threshold):
+        tokens = estimate_tokens(chunks[i])
+        if tokens <= remaining:
+            selected.append(chunks[i])
+            remaining -= tokens
+            continue
+        trimmed = trim_to_tokens(chunks[i], remaining)
+        if trimmed:
+            selected.append(trimmed)
+        break
+    return selected
+
+def select_contexts(query_vectors: list, candidates: list, baseline_chunks: int) -> tuple:
+    """
+    select_context for a batch of questions; returns (contexts, token_stats)
+    where token_stats compares the prompt tokens of the first
+    baseline_chunks raw candidates with those of the selected context.
+    """
+    contexts, retrieved, selected = [], 0, 0
+    for query_vector, (chunks, embeddings) in zip(query_vectors, candidates):
+        context = select_context(query_vector, chunks, embeddings)
+        contexts.append(context)
+        retrieved += sum(estimate_tokens(chunk) for chunk in chunks[:baseline_chunks])
+        selected += sum(estimate_tokens(chunk) for chunk in context)
+    return contexts, {"retrieved": retrieved, "selected": selected, "saved": retrieved - selected}
@@ -0,0 +1,434 @@
+# app/services/corpus_index.py
+
+import os
+import json
+import shutil
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+from loguru import logger
+
+from app.config import CORPUS_INDEX_DIR, CORPUS_INDEX_NPROBE, CORPUS_INDEX_TRAIN_SIZE, VECTOR_STORE_PRECISION
+from app.services.numpy_store import (
+    PRECISIONS, normalize_rows, top_k_indices, quantize_rows, dequantize_rows, approximate_scores,
+)
+from app.services.vector_store import vector_store
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """
+    Spherical k-means on normalized rows; returns k normalized centroids.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        empty = ~sums.any(axis=1)
+        # Restart empty clusters from random points
+        sums[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()))]
+        centroids = normalize_rows(sums)
+    return centroids
+
+def _grown(array: np.ndarray, needed: int) -> np.ndarray:
+    # Amortized growth of a 1-d array to hold `needed` items
+    return array if needed <= len(array) else np.resize(array, max(1024, needed, 2 * len(array)))
+
+class _InvertedList:
+    """
+    Vectors of one cluster in a contiguous, over-allocated matrix (compressed
+    like the vector store's, with one scale per row for int8), with their
+    row IDs.
+    """
+
+    __slots__ = ("precision", "vectors", "scales", "rows", "size")
+
+    def __init__(self, dim: int, precision: str = "float32"):
+        self.precision = precision
+        self.vectors = np.empty((0, dim), dtype=precision)
+        self.scales = np.empty(0, dtype=np.float32) if precision == "int8" else None
+        self.rows = np.empty(0, dtype=np.int64)
+        self.size = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self.vectors.nbytes + self.rows.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def _resize(self, capacity: int):
+        resized = np.empty((capacity, self.vectors.shape[1]), dtype=self.vectors.dtype)
+        resized[:self.size] = self.vectors[:self.size]
+        self.vectors = resized
+        self.rows = np.resize(self.rows, capacity)
+        if self.scales is not None:
+            self.scales = np.resize(self.scales, capacity)
+
+    def append(self, vectors: np.ndarray, rows: np.ndarray):
+        needed = self.size + len(rows)
+        if needed > len(self.rows):
+            self._resize(max(16, needed, 2 * len(self.rows)))
+        codes, scales = quantize_rows(vectors, self.precision)
+        self.vectors[self.size:needed] = codes
+        if scales is not None:
+            self.scales[self.size:needed] = scales
+        self.rows[self.size:needed] = rows
+        self.size = needed
+
+    def remove(self, rows: np.ndarray):
+        keep = ~np.isin(self.rows[:self.size], rows)
+        kept = int(keep.sum())
+        self.vectors[:kept] = self.vectors[:self.size][keep]
+        self.rows[:kept] = self.rows[:self.size][keep]
+        if self.scales is not None:
+            self.scales[:kept] = self.scales[:self.size][keep]
+        self.size = kept
+        # Give memory back once the list has shrunk well below its capacity
+        if len(self.rows) > 64 and kept < len(self.rows) // 4:
+            self._resize(max(16, 2 * kept))
+
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        scales = self.scales[:self.size] if self.scales is not None else None
+        return approximate_scores(queries, self.vectors[:self.size], scales)
+
+    def decoded(self) -> np.ndarray:
+        scales = self.scales[:self.size] if self.scales is not None else None
+        return dequantize_rows(self.vectors[:self.size], scales)
+
+class CorpusIndex:
+    """
+    Inverted-file (IVF) index over the chunks of every ingested document,
+    for searching the whole corpus without naming a document.
+
+    Below train_size chunks the index is a single list searched exactly.
+    From there it clusters the vectors with k-means into about sqrt(N)
+    lists and a query scans only the nprobe lists nearest to it; the
+    clustering is redone whenever the corpus has grown fourfold. Chunks
+    are staged by add() and become searchable when their document is
+    published, after all of its batches have been stored.
+
+    Each document is persisted as its own directory (normalized vectors,
+    chunks and metadata), so deletes need no compaction on disk and worker
+    processes sharing the directory pick up each other's documents.
+    Chunk texts stay on disk and are read for the returned hits only. In
+    memory the vectors are held at `precision`, and on_resize(nbytes) is
+    told the index's size whenever it changes; row IDs are renumbered once
+    most of them belong to deleted documents.
+    """
+
+    VERSION_FILE = "version"
+
+    def __init__(self, directory: str, nprobe: int = 32, train_size: int = 20000, precision: str = "float32",
+                 on_resize=None):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown vector precision: {precision}")
+        self.directory = Path(directory)
+        self.nprobe = nprobe
+        self.train_size = train_size
+        self.precision = precision
+        self.on_resize = on_resize
+        self.dim = None
+        self.centroids = None
+        self.trained_on = 0
+        self.lists = []
+        # Per row ID: document slot, position in the document and list; IDs are never reused
+        self._row_doc = np.empty(0, dtype=np.int32)
+        self._row_position = np.empty(0, dtype=np.int32)
+        self._row_list = np.empty(0, dtype=np.int32)
+        self._next_row = 0
+        self._doc_ids = []
+        # doc_id -> (slot in _doc_ids, row IDs)
+        self._documents = {}
+        self._pending = {}
+        self._chunk_cache = OrderedDict()
+        self._lock = threading.RLock()
+        self._loaded = False
+        # mtime of the version file when this process last synced with the directory
+        self._version = -1
+
+    # Persistence
+
+    def _document_dir(self, doc_id: str) -> Path:
+        return self.directory / "documents" / doc_id
+
+    def _version_mtime(self):
+        try:
+            return (self.directory / self.VERSION_FILE).stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _bump_version(self):
+        (self.directory / self.VERSION_FILE).touch()
+        self._version = self._version_mtime()
+
+    def _ensure_loaded(self):
+        # Called with self._lock held: load lazily, then follow other processes' changes
+        if not self._loaded:
+            (self.directory / "documents").mkdir(parents=True, exist_ok=True)
+            centroids_path = self.directory / "centroids.npy"
+            if centroids_path.exists():
+                self.centroids = np.load(centroids_path)
+                self.dim = self.centroids.shape[1]
+                self.lists = [_InvertedList(self.dim, self.precision) for _ in range(len(self.centroids))]
+                # Lists are sized for about their square in chunks
+                self.trained_on = len(self.centroids) ** 2
+            self._loaded = True
+        version = self._version_mtime()
+        if version != self._version:
+            self._refresh()
+            self._version = version
+            self._resized()
+
+    def _refresh(self):
+        on_disk = {
+            path.name for path in (self.directory / "documents").iterdir()
+            if (path / "complete").exists()
+        }
+        for doc_id in set(self._documents) - on_disk:
+            self._remove(doc_id)
+        for doc_id in sorted(on_disk - set(self._documents)):
+            doc_dir = self._document_dir(doc_id)
+            try:
+                vectors = np.load(doc_dir / "vectors.npy")
+            except (OSError, ValueError) as e:
+                logger.warning("Skipping unreadable corpus index document {doc_id}: {error}", doc_id=doc_id, error=str(e))
+                continue
+            self._insert(doc_id, vectors)
+        self._maybe_train()
+
+    # Updates
+
+    def add(self, doc_id: str, chunks: list, embeddings, metadatas: list = None):
+        """Stage a batch of a document's chunks until publish()."""
+        vectors = normalize_rows(embeddings)
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in chunks]
+        with self._lock:
+            pending = self._pending.setdefault(doc_id, {"chunks": [], "metadatas": [], "vectors": []})
+            pending["chunks"].extend(chunks)
+            pending["metadatas"].extend(metadatas)
+            pending["vectors"].append(vectors)
+
+    def publish(self, doc_id: str):
+        """Persist a document's staged chunks and make them searchable."""
+        with self._lock:
+            pending = self._pending.pop(doc_id, None)
+            if pending is None:
+                return
+            self._ensure_loaded()
+            if doc_id in self._documents:
+                # IDs are content hashes: restored from the document cache, already indexed
+                return
+            vectors = np.concatenate(pending["vectors"])
+            if self._documents and vectors.shape[1] != self.dim:
+                logger.warning(
+                    "Not indexing {doc_id}: {dim}-dimensional embeddings in a {index_dim}-dimensional corpus index",
+                    doc_id=doc_id, dim=vectors.shape[1], index_dim=self.dim,
+                )
+                return
+            doc_dir = self._document_dir(doc_id)
+            shutil.rmtree(doc_dir, ignore_errors=True)
+            doc_dir.mkdir(parents=True)
+            np.save(doc_dir / "vectors.npy", vectors)
+            with open(doc_dir / "chunks.json", "w", encoding="utf-8") as f:
+                json.dump({"chunks": pending["chunks"], "metadatas": pending["metadatas"]}, f)
+            # Written last: other processes only load complete documents
+            (doc_dir / "complete").touch()
+            self._insert(doc_id, vectors)
+            self._maybe_train()
+            self._bump_version()
+            self._resized()
+
+    def delete(self, doc_id: str):
+        with self._lock:
+            self._pending.pop(doc_id, None)
+            if not self._loaded and not self._document_dir(doc_id).exists():
+                return
+            self._ensure_loaded()
+            self._remove(doc_id)
+            if self._document_dir(doc_id).exists():
+                shutil.rmtree(self._document_dir(doc_id), ignore_errors=True)
+                self._bump_version()
+            self._resized()
+
+    def _insert(self, doc_id: str, vectors: np.ndarray):
+        if not len(vectors):
+            return
+        if self.dim != vectors.shape[1]:
+            if self._documents:
+                logger.warning("Skipping corpus index document {doc_id} with a different dimension", doc_id=doc_id)
+                return
+            # First document, or every earlier one is gone: adopt its dimension
+            self.dim = vectors.shape[1]
+            self.centroids = None
+            self.lists = []
+        if not self.lists:
+            self.lists = [_InvertedList(self.dim, self.precision)]
+        rows = np.arange(self._next_row, self._next_row + len(vectors))
+        self._next_row += len(vectors)
+        slot = len(self._doc_ids)
+        self._doc_ids.append(doc_id)
+        self._documents[doc_id] = (slot, rows)
+        self._row_doc = _grown(self._row_doc, self._next_row)
+        self._row_position = _grown(self._row_position, self._next_row)
+        self._row_list = _grown(self._row_list, self._next_row)
+        self._row_doc[rows] = slot
+        self._row_position[rows] = np.arange(len(rows))
+        self._row_list[rows] = self._assign(vectors, rows)
+
+    def _assign(self, vectors: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        if self.centroids is None:
+            assignment = np.zeros(len(rows), dtype=np.int32)
+        else:
+            assignment = np.empty(len(rows), dtype=np.int32)
+            # Bounded blocks keep the score matrix small on a full reassignment
+            for start in range(0, len(rows), 65536):
+                assignment[start:start + 65536] = np.argmax(vectors[start:start + 65536] @ self.centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable")
+        boundaries = np.flatnonzero(np.diff(assignment[order])) + 1
+        for group in np.split(order, boundaries):
+            if len(group):
+                self.lists[assignment[group[0]]].append(vectors[group], rows[group])
+        return assignment
+
+    def _remove(self, doc_id: str):
+        entry = self._documents.pop(doc_id, None)
+        self._chunk_cache.pop(doc_id, None)
+        if entry is None:
+            return
+        _, rows = entry
+        for list_id in np.unique(self._row_list[rows]):
+            self.lists[list_id].remove(rows)
+        if self._next_row > 1024 and self._next_row > 2 * self.size():
+            self._compact()
+
+    def _compact(self):
+        # Renumber the rows and document slots of the remaining documents densely
+        renumbered = np.full(self._next_row, -1, dtype=np.int64)
+        doc_ids, documents, start = [], {}, 0
+        row_doc, row_position, row_list = (np.empty(self.size(), dtype=np.int32) for _ in range(3))
+        for doc_id, (_, rows) in self._documents.items():
+            new_rows = np.arange(start, start + len(rows))
+            renumbered[rows] = new_rows
+            row_doc[new_rows] = len(doc_ids)
+            row_position[new_rows] = self._row_position[rows]
+            row_list[new_rows] = self._row_list[rows]
+            documents[doc_id] = (len(doc_ids), new_rows)
+            doc_ids.append(doc_id)
+            start += len(rows)
+        for lst in self.lists:
+            lst.rows[:lst.size] = renumbered[lst.rows[:lst.size]]
+        self._row_doc, self._row_position, self._row_list = row_doc, row_position, row_list
+        self._doc_ids, self._documents, self._next_row = doc_ids, documents, start
+
+    def _resized(self):
+        if self.on_resize is not None:
+            self.on_resize(self.nbytes)
+
+    def _maybe_train(self):
+        size = self.size()
+        if size < self.train_size or (self.centroids is not None and size < 4 * self.trained_on):
+            return
+        nlist = max(16, int(np.sqrt(size)))
+        vectors = np.concatenate([lst.decoded() for lst in self.lists])
+        rows = np.concatenate([lst.rows[:lst.size] for lst in self.lists])
+        sample = vectors[np.random.default_rng(0).choice(len(vectors), size=min(len(vectors), 64 * nlist), replace=False)]
+        logger.info("Training corpus index: {lists} lists over {chunks} chunks", lists=nlist, chunks=size)
+        self.centroids = kmeans(sample, nlist)
+        self.trained_on = size
+        self.lists = [_InvertedList(self.dim, self.precision) for _ in range(nlist)]
+        self._row_list[rows] = self._assign(vectors, rows)
+        np.save(self.directory / "centroids.tmp.npy", self.centroids)
+        os.replace(self.directory / "centroids.tmp.npy", self.directory / "centroids.npy")
+
+    # Search
+
+    def size(self) -> int:
+        return sum(lst.size for lst in self.lists)
+
+    @property
+    def nbytes(self) -> int:
+        rows = self._row_doc.nbytes + self._row_position.nbytes + self._row_list.nbytes
+        return sum(lst.nbytes for lst in self.lists) + rows
+
+    def search(self, query_vectors, top_k: int = 10, nprobe: int = None) -> list:
+        """
+        Top-k chunks of the whole corpus for each query vector; returns per
+        query a list of {"document_id", "chunk", "score", "metadata"}.
+        """
+        queries = normalize_rows(query_vectors)
+        with self._lock:
+            self._ensure_loaded()
+            if not self.size() or queries.shape[1] != self.dim:
+                return [[] for _ in queries]
+            if self.centroids is None:
+                probes = np.zeros((len(queries), 1), dtype=np.int64)
+            else:
+                probes = top_k_indices(queries @ self.centroids.T, nprobe or self.nprobe)
+            found_scores = [[] for _ in queries]
+            found_rows = [[] for _ in queries]
+            # Scan each probed list once for all the queries probing it
+            for list_id in np.unique(probes):
+                lst = self.lists[list_id]
+                if not lst.size:
+                    continue
+                probing = np.flatnonzero((probes == list_id).any(axis=1))
+                scores = lst.scores(queries[probing])
+                best = top_k_indices(scores, top_k)
+                for i, query in enumerate(probing):
+                    found_scores[query].append(scores[i, best[i]])
+                    found_rows[query].append(lst.rows[best[i]])
+            results = []
+            for scores, rows in zip(found_scores, found_rows):
+                if not scores:
+                    results.append([])
+                    continue
+                scores, rows = np.concatenate(scores), np.concatenate(rows)
+                order = np.argsort(-scores)[:top_k]
+                results.append([self._hit(rows[i], scores[i]) for i in order])
+            return results
+
+    def _hit(self, row: int, score: float) -> dict:
+        doc_id = self._doc_ids[self._row_doc[row]]
+        position = int(self._row_position[row])
+        chunks = self._chunks(doc_id)
+        return {
+            "document_id": doc_id,
+            "chunk": chunks["chunks"][position],
+            "score": round(float(score), 4),
+            "metadata": chunks["metadatas"][position],
+        }
+
+    def _chunks(self, doc_id: str) -> dict:
+        chunks = self._chunk_cache.get(doc_id)
+        if chunks is None:
+            with open(self._document_dir(doc_id) / "chunks.json", "r", encoding="utf-8") as f:
+                chunks = self._chunk_cache[doc_id] = json.load(f)
+            while len(self._chunk_cache) > 32:
+                self._chunk_cache.popitem(last=False)
+        self._chunk_cache.move_to_end(doc_id)
+        return chunks
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._ensure_loaded()
+            sizes = [lst.size for lst in self.lists]
+            return {
+                "documents": len(self._documents),
+                "chunks": sum(sizes),
+                "dimensions": self.dim,
+                "lists": len(self.lists),
+                "trained": self.centroids is not None,
+                "largest_list": max(sizes, default=0),
+                "nprobe": self.nprobe,
+                "precision": self.precision,
+                "bytes": self.nbytes,
+            }
+
+def _reserve_memory(nbytes: int):
+    # The index holds every chunk's vector, so it shares the vector store's memory budget
+    vector_store.reserve("corpus_index", nbytes)
+
+# Global index, None when CORPUS_INDEX_DIR is empty (the default)
+corpus_index = CorpusIndex(
+    CORPUS_INDEX_DIR, CORPUS_INDEX_NPROBE, CORPUS_INDEX_TRAIN_SIZE, VECTOR_STORE_PRECISION, _reserve_memory,
+) if CORPUS_INDEX_DIR else None
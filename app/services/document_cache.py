@@ -0,0 +1,320 @@
+# app/services/document_cache.py
+
+import json
+import os
+import re
+import shutil
+import hashlib
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+from loguru import logger
+
+
+def content_hash(content: bytes) -> str:
+    """SHA-256 hex digest used as the cache key for a document."""
+    return hashlib.sha256(content).hexdigest()
+
+
+class DocumentCache:
+    """
+    Content-addressed cache of processed documents.
+
+    Each entry is keyed by the SHA-256 of the downloaded bytes and stores the
+    chunks and embeddings on disk, so a repeated document (even after a
+    restart) skips download, parsing, chunking and embedding. The URL index
+    keeps ETag / Last-Modified validators so unchanged URLs can be
+    revalidated with a conditional GET instead of a full download.
+
+    Adding and removing entries, or a URL's new content, rewrites the index
+    at once; access times are written at most every flush_seconds (and by
+    flush()), since losing them only costs some LRU order.
+
+    Each entry directory also holds its own metadata, so entries added by
+    other processes sharing the directory are picked up on a miss, and
+    aliases (e.g. the document_id of an ingestion job) map a name to a
+    content hash for every process.
+    """
+
+    INDEX_FILE = "index.json"
+    ENTRY_FILE = "entry.json"
+    ALIAS_DIR = "aliases"
+    _ALIAS_NAME = re.compile(r"[0-9A-Za-z_-]{1,64}")
+
+    def __init__(
+        self,
+        cache_dir: str = "./data/cache/documents",
+        max_entries: int = 100,
+        max_bytes: int = 1024 ** 3,
+        ttl_seconds: int = 7 * 24 * 3600,
+        on_evict: Optional[Callable[[dict], None]] = None,
+        flush_seconds: float = 30.0,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.on_evict = on_evict
+        self.flush_seconds = flush_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.RLock()
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        self._entries, self._urls = self._load_index()
+        if self._entries:
+            self._evict()
+            self._save_index()
+
+    # Index persistence
+
+    def _load_index(self):
+        index_path = self.cache_dir / self.INDEX_FILE
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            entries = {
+                key: entry for key, entry in data.get("entries", {}).items()
+                if (self.cache_dir / key).is_dir()
+            }
+            return entries, data.get("urls", {})
+        except FileNotFoundError:
+            return {}, {}
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable document cache index: {e}")
+            return {}, {}
+
+    def _save_index(self):
+        index_path = self.cache_dir / self.INDEX_FILE
+        tmp_path = index_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"entries": self._entries, "urls": self._urls}, f)
+        os.replace(tmp_path, index_path)
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    def _touch(self):
+        # Called with self._lock held, after a change that may be written late
+        self._dirty = True
+        if time.monotonic() - self._saved_at >= self.flush_seconds:
+            self._save_index()
+
+    def flush(self):
+        """Write access times and URL validators not yet saved."""
+        with self._lock:
+            if self._dirty:
+                self._save_index()
+
+    # URL validators
+
+    def conditional_headers(self, url: str) -> dict:
+        """Headers for a conditional GET of a URL we have fetched before."""
+        with self._lock:
+            known = self._urls.get(url)
+            if not known or known["content_hash"] not in self._entries:
+                return {}
+            headers = {}
+            if known.get("etag"):
+                headers["If-None-Match"] = known["etag"]
+            if known.get("last_modified"):
+                headers["If-Modified-Since"] = known["last_modified"]
+            return headers
+
+    def hash_for_url(self, url: str) -> Optional[str]:
+        """Content hash last seen at a URL (used on a 304 response)."""
+        with self._lock:
+            known = self._urls.get(url)
+            return known["content_hash"] if known else None
+
+    def remember_url(self, url: str, content_hash: str, etag: str = None, last_modified: str = None):
+        known = {"content_hash": content_hash, "etag": etag, "last_modified": last_modified}
+        with self._lock:
+            if self._urls.get(url) == known:
+                return
+            self._urls[url] = known
+            self._save_index()
+
+    # Entries
+
+    def _entry(self, key: str) -> Optional[dict]:
+        # Called with self._lock held; adopts an entry another process stored
+        entry = self._entries.get(key)
+        if entry is not None:
+            return entry
+        entry_dir = self.cache_dir / key
+        try:
+            with open(entry_dir / self.ENTRY_FILE, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not (entry_dir / "embeddings.npy").exists():
+            return None
+        self._entries[key] = entry
+        self._touch()
+        return entry
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            entry = self._entry(key)
+            return entry is not None and not self._expired(entry)
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        Look up a document by content hash and record a hit or miss.
+        Returns the entry metadata (including "doc_id"), or None.
+        """
+        with self._lock:
+            entry = self._entry(key)
+            if entry is None or self._expired(entry):
+                if entry is not None:
+                    self._remove(key)
+                    self._save_index()
+                self.misses += 1
+                return None
+
+            entry["last_access"] = time.time()
+            self._touch()
+            self.hits += 1
+            return dict(entry)
+
+    def load(self, key: str) -> Optional[tuple]:
+        """
+        Read the stored (chunks, embeddings, metadatas) of a cached document,
+        dropping the entry if its files are unreadable. metadatas is None for
+        entries stored without it.
+        """
+        with self._lock:
+            if self._entry(key) is None:
+                return None
+            entry_dir = self.cache_dir / key
+            try:
+                with open(entry_dir / "chunks.json", "r", encoding="utf-8") as f:
+                    chunks = json.load(f)
+                embeddings = np.load(entry_dir / "embeddings.npy")
+                metadatas = None
+                if (entry_dir / "metadatas.json").exists():
+                    with open(entry_dir / "metadatas.json", "r", encoding="utf-8") as f:
+                        metadatas = json.load(f)
+            except Exception as e:
+                logger.warning(f"Dropping corrupt document cache entry {key}: {e}")
+                self._remove(key)
+                self._save_index()
+                return None
+            return chunks, embeddings.tolist(), metadatas
+
+    def put(self, key: str, doc_id: str, chunks: list, embeddings: list, metadatas: list = None):
+        """Persist the processed form of a document under its content hash."""
+        with self._lock:
+            entry_dir = self.cache_dir / key
+            entry_dir.mkdir(parents=True, exist_ok=True)
+            with open(entry_dir / "chunks.json", "w", encoding="utf-8") as f:
+                json.dump(chunks, f)
+            if metadatas is not None:
+                with open(entry_dir / "metadatas.json", "w", encoding="utf-8") as f:
+                    json.dump(metadatas, f)
+            np.save(entry_dir / "embeddings.npy", np.asarray(embeddings, dtype=np.float32))
+
+            size_bytes = sum(p.stat().st_size for p in entry_dir.iterdir())
+            now = time.time()
+            self._entries[key] = {
+                "doc_id": doc_id,
+                "chunk_count": len(chunks),
+                "size_bytes": size_bytes,
+                "created_at": now,
+                "last_access": now,
+            }
+            with open(entry_dir / self.ENTRY_FILE, "w", encoding="utf-8") as f:
+                json.dump(self._entries[key], f)
+            self._evict(keep=key)
+            self._save_index()
+            logger.info(f"Cached document {doc_id} ({len(chunks)} chunks, {size_bytes} bytes)")
+
+    # Aliases
+
+    def _alias_path(self, name: str) -> Path:
+        if not self._ALIAS_NAME.fullmatch(name):
+            raise ValueError(f"Invalid alias: {name!r}")
+        return self.cache_dir / self.ALIAS_DIR / name
+
+    def add_alias(self, name: str, key: str):
+        """Let name stand for the content hash key, in every process sharing the directory."""
+        path = self._alias_path(name)
+        path.parent.mkdir(exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(key, encoding="utf-8")
+        os.replace(tmp_path, path)
+
+    def remove_alias(self, name: str):
+        try:
+            self._alias_path(name).unlink(missing_ok=True)
+        except (OSError, ValueError):
+            pass
+
+    def resolve_alias(self, name: str) -> Optional[str]:
+        """Content hash an alias stands for (the entry may have been evicted since), or None."""
+        try:
+            return self._alias_path(name).read_text(encoding="utf-8").strip() or None
+        except (OSError, ValueError):
+            return None
+
+    def invalidate(self, key: str):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+                self._save_index()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "size_bytes": sum(e["size_bytes"] for e in self._entries.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+    # Eviction
+
+    def _expired(self, entry: dict) -> bool:
+        return self.ttl_seconds > 0 and time.time() - entry["last_access"] > self.ttl_seconds
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        shutil.rmtree(self.cache_dir / key, ignore_errors=True)
+        self._urls = {url: v for url, v in self._urls.items() if v["content_hash"] != key}
+        for alias in (self.cache_dir / self.ALIAS_DIR).glob("*"):
+            try:
+                if alias.read_text(encoding="utf-8").strip() == key:
+                    alias.unlink()
+            except OSError:
+                pass
+        self.evictions += 1
+        if self.on_evict:
+            try:
+                self.on_evict({**entry, "content_hash": key})
+            except Exception as e:
+                logger.warning(f"Eviction callback failed for {entry['doc_id']}: {e}")
+
+    def _evict(self, keep: str = None):
+        """Drop expired entries, then least recently used ones until within budget."""
+        for key in [k for k, e in self._entries.items() if self._expired(e) and k != keep]:
+            self._remove(key)
+
+        by_age = sorted(
+            (k for k in self._entries if k != keep),
+            key=lambda k: self._entries[k]["last_access"],
+        )
+        total_bytes = sum(e["size_bytes"] for e in self._entries.values())
+        while by_age and (
+            len(self._entries) > self.max_entries or total_bytes > self.max_bytes
+        ):
+            key = by_age.pop(0)
+            total_bytes -= self._entries[key]["size_bytes"]
+            self._remove(key)
@@ -1,14 +1,105 @@
 # app/services/document_loader.py
 
-import fitz  # PyMuPDF
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Union
 
-def load_document(file_path: str) -> str:
-    """Extracts text from PDF"""
-    text = ""
+from app.config import PDF_PARALLEL_MIN_PAGES, PDF_MAX_WORKERS
+
+# Either a path on disk or the raw PDF bytes
+DocumentSource = Union[str, bytes]
+
+_executor = None
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn: forking a process that runs server threads is not safe
+        _executor = ProcessPoolExecutor(
+            max_workers=PDF_MAX_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+def _reset_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+def warm():
+    """Import PyMuPDF ahead of the first ingestion."""
+    import fitz  # PyMuPDF
+
+def _open(source: DocumentSource):
+    # Imported on first use: only ingestion needs PyMuPDF, and it is slow to import
+    import fitz  # PyMuPDF
+
+    if source is None:
+        # fitz.open(None) would be an empty PDF, i.e. a document with no chunks
+        raise ValueError("No document content to open")
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
+
+def _extract_range(source: DocumentSource, start: int, stop: int) -> list[str]:
+    """Text of pages [start, stop); runs in a worker process for large PDFs."""
+    with _open(source) as doc:
+        return [doc[i].get_text() for i in range(start, stop)]
+
+def iter_pages(source: DocumentSource):
+    """
+    Yield the text of each page in order as soon as it is extracted. Large
+    documents are split into page ranges that are extracted in parallel
+    across a process pool.
+    """
     try:
-        with fitz.open(file_path) as doc:
-            for page in doc:
-                text += page.get_text()
+        with _open(source) as doc:
+            page_count = doc.page_count
+            if page_count < PDF_PARALLEL_MIN_PAGES or PDF_MAX_WORKERS <= 1:
+                for page in doc:
+                    yield page.get_text()
+                return
+
+        step = -(-page_count // PDF_MAX_WORKERS)
+        ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+        futures = [_get_executor().submit(_extract_range, source, start, stop) for start, stop in ranges]
+        for (start, _), future in zip(ranges, futures):
+            try:
+                pages = future.result()
+            except BrokenProcessPool:
+                # A crashed worker poisons the pool; replace it and parse the rest in-process
+                _reset_executor()
+                yield from _extract_range(source, start, page_count)
+                return
+            yield from pages
     except Exception as e:
         raise RuntimeError(f"Failed to load document: {str(e)}")
-    return text.strip()
+
+def extract_pages(source: DocumentSource) -> list[str]:
+    """
+    Extract the text of every page.
+    """
+    return list(iter_pages(source))
+
+def load_document_with_offsets(source: DocumentSource) -> tuple[str, list[int]]:
+    """
+    Extract text from a PDF path or bytes, returning the text and the
+    character offset at which each page starts in it.
+    """
+    pages = extract_pages(source)
+    offsets = []
+    position = 0
+    for page in pages:
+        offsets.append(position)
+        position += len(page)
+
+    # Join once instead of growing a string page by page
+    text = "".join(pages)
+    leading = len(text) - len(text.lstrip())
+    return text.strip(), [max(0, offset - leading) for offset in offsets]
+
+def load_document(source: DocumentSource) -> str:
+    """Extracts text from PDF"""
+    return load_document_with_offsets(source)[0]
@@ -2,55 +2,210 @@
 # This file completely replaces the old embedder.py
 # Deployment ID: COMPLETE-NUCLEAR-SOLUTION-2024
 
-import os
+import asyncio
+import contextvars
 import requests
+import httpx
 import json
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+from app.config import (
+    AZURE_OPENAI_EMBEDDING_API_KEY,
+    AZURE_OPENAI_EMBEDDING_ENDPOINT,
+    AZURE_OPENAI_EMBEDDING_DEPLOYMENT,
+    EMBEDDING_BATCH_MAX_ITEMS,
+    EMBEDDING_BATCH_MAX_TOKENS,
+    EMBEDDING_MAX_WORKERS,
+    EMBEDDING_CACHE_DIR,
+    EMBEDDING_CACHE_MAX_ENTRIES,
+)
+from app.services.http_client import request_with_retries, async_request_with_retries
+from app.services.metrics import record_usage
+from app.services.rate_limiter import scheduler
+from app.services.embedding_cache import EmbeddingCache, embedding_key
+from app.utils.helpers import estimate_tokens
+
+# Process-wide pool so concurrent ingestions share one bound on parallel requests
+_batch_executor = ThreadPoolExecutor(max_workers=EMBEDDING_MAX_WORKERS, thread_name_prefix="embed")
+
+# Chunk embeddings shared across documents (and worker processes)
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_MAX_ENTRIES)
+
+# Read once at import; the endpoint does not change per call
+EMBEDDING_API_URL = (
+    f"{(AZURE_OPENAI_EMBEDDING_ENDPOINT or '').rstrip('/')}/openai/deployments/"
+    f"{AZURE_OPENAI_EMBEDDING_DEPLOYMENT}/embeddings?api-version=2024-02-01"
+)
+EMBEDDING_HEADERS = {
+    "Content-Type": "application/json",
+    "api-key": AZURE_OPENAI_EMBEDDING_API_KEY or ""
+}
+
+def iter_batches(chunks, max_items=None, max_tokens=None, key=None):
+    """
+    Group an iterable of chunks into consecutive sub-batches bounded by item
+    count and estimated token count. A single oversized chunk gets a batch
+    of its own. `key` extracts the text when chunks are not plain strings.
+    """
+    max_items = max_items or EMBEDDING_BATCH_MAX_ITEMS
+    max_tokens = max_tokens or EMBEDDING_BATCH_MAX_TOKENS
+    current, current_tokens = [], 0
+    for chunk in chunks:
+        tokens = estimate_tokens(key(chunk) if key else chunk)
+        if current and (len(current) >= max_items or current_tokens + tokens > max_tokens):
+            yield current
+            current, current_tokens = [], 0
+        current.append(chunk)
+        current_tokens += tokens
+    if current:
+        yield current
+
+def split_batches(chunks, max_items=None, max_tokens=None):
+    """
+    List form of iter_batches.
+    """
+    return list(iter_batches(chunks, max_items, max_tokens))
+
+def _parse_embeddings(result):
+    # Azure tags each item with the position of its input
+    return [item["embedding"] for item in sorted(result["data"], key=lambda item: item["index"])]
+
+def _cache_keys(chunks) -> list:
+    return [embedding_key(AZURE_OPENAI_EMBEDDING_DEPLOYMENT, chunk) for chunk in chunks]
+
+def _cache_misses(chunks, keys, found: dict) -> dict:
+    """
+    The distinct chunks missing from `found` (the cached vectors), as
+    key -> text; records the hits and misses.
+    """
+    missing = {}
+    for key, chunk in zip(keys, chunks):
+        if key not in found:
+            missing.setdefault(key, chunk)
+    # Repeats within the input are served by the first copy's embedding
+    embedding_cache.count(hits=len(chunks) - len(missing), misses=len(missing))
+    return missing
+
+def _merge_cached(keys, found: dict, missing: dict, embeddings) -> tuple:
+    """Embeddings in input order, and the fresh ones to add to the cache."""
+    fresh = dict(zip(missing, embeddings))
+    merged = [fresh[key] if key in fresh else found[key].tolist() for key in keys]
+    return merged, fresh
 
 def embed_chunks(chunks):
     """
     Generate embeddings for document chunks using direct HTTP requests.
     This bypasses the openai library issues completely.
+
+    Chunks already in the embedding cache are not sent upstream. Large
+    inputs are split into sub-batches that are embedded in parallel and
+    retried individually; results come back in input order.
     """
-    # Get environment variables
-    api_key = os.getenv("AZURE_OPENAI_EMBEDDING_API_KEY")
-    endpoint = os.getenv("AZURE_OPENAI_EMBEDDING_ENDPOINT")
-    deployment = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT")
-    
-    print(f"🔗 Embedding Endpoint: {endpoint}")
-    print(f"🔑 Embedding API Key (last 5): {api_key[-5:] if api_key else 'MISSING'}")
-    print(f"🤖 Embedding Deployment: {deployment}")
-    
-    # Construct the API URL
-    api_url = f"{endpoint}/openai/deployments/{deployment}/embeddings?api-version=2024-02-01"
-    
-    # Prepare headers
-    headers = {
-        "Content-Type": "application/json",
-        "api-key": api_key
-    }
-    
-    # Prepare request body
-    data = {
-        "input": chunks
-    }
-    
+    chunks = list(chunks)
+    keys = _cache_keys(chunks)
+    found = embedding_cache.get_many(keys)
+    missing = _cache_misses(chunks, keys, found)
+    embeddings = _embed_uncached(list(missing.values())) if missing else []
+    merged, fresh = _merge_cached(keys, found, missing, embeddings)
+    embedding_cache.put_many(fresh)
+    return merged
+
+def _embed_uncached(chunks):
+    batches = split_batches(chunks)
+    if len(batches) <= 1:
+        return _embed_batch(chunks)
+
+    logger.debug("Embedding {chunks} chunks in {batches} sub-batches", chunks=len(chunks), batches=len(batches))
+    # Pool threads run each batch in a copy of the caller's context, so the
+    # scheduler still sees the request's priority and deadline
+    contexts = [contextvars.copy_context() for _ in batches]
+    results = _batch_executor.map(lambda context, batch: context.run(_embed_batch, batch), contexts, batches)
+    return [embedding for batch in results for embedding in batch]
+
+def _embed_batch(chunks):
+    """
+    Embed one sub-batch with a single POST. Connection errors, 429 and 5xx
+    are retried by request_with_retries; anything else fails the batch.
+    """
+    estimated = sum(estimate_tokens(chunk) for chunk in chunks)
+    scheduler.acquire_sync("embeddings", estimated)
     try:
-        print("🚀 Making direct HTTP request to Azure OpenAI...")
-        response = requests.post(api_url, headers=headers, json=data, timeout=30)
+        response = request_with_retries(
+            "POST", EMBEDDING_API_URL, headers=EMBEDDING_HEADERS, json={"input": chunks}, timeout=30
+        )
         response.raise_for_status()
-        
+
         result = response.json()
-        embeddings = [item["embedding"] for item in result["data"]]
-        
-        print(f"✅ Successfully generated {len(embeddings)} embeddings")
+        record_usage("embeddings", result)
+        scheduler.settle("embeddings", estimated, result.get("usage"))
+        embeddings = _parse_embeddings(result)
+
+        logger.debug("Generated {count} embeddings", count=len(embeddings))
         return embeddings
-        
+
     except requests.exceptions.RequestException as e:
-        print(f"❌ HTTP request failed: {e}")
+        logger.error("Embedding request failed: {error}", error=str(e))
+        raise RuntimeError(f"Failed to generate embeddings via HTTP: {e}")
+    except json.JSONDecodeError as e:
+        logger.error("Embedding response is not JSON: {error}", error=str(e))
+        raise RuntimeError(f"Failed to parse embedding response: {e}")
+    except Exception as e:
+        logger.error("Unexpected embedding error: {error}", error=str(e))
+        raise RuntimeError(f"Failed to generate embeddings: {e}")
+
+async def embed_chunks_async(chunks):
+    """
+    Async variant of embed_chunks on the shared async HTTP client, so
+    embedding does not block the event loop.
+    """
+    chunks = list(chunks)
+    keys = _cache_keys(chunks)
+    found = await asyncio.to_thread(embedding_cache.get_many, keys)
+    missing = _cache_misses(chunks, keys, found)
+    embeddings = await _embed_uncached_async(list(missing.values())) if missing else []
+    merged, fresh = _merge_cached(keys, found, missing, embeddings)
+    if fresh:
+        await asyncio.to_thread(embedding_cache.put_many, fresh)
+    return merged
+
+async def _embed_uncached_async(chunks):
+    batches = split_batches(chunks)
+    if len(batches) <= 1:
+        return await _embed_batch_async(chunks)
+
+    logger.debug("Embedding {chunks} chunks in {batches} sub-batches", chunks=len(chunks), batches=len(batches))
+    semaphore = asyncio.Semaphore(EMBEDDING_MAX_WORKERS)
+
+    async def run(batch):
+        async with semaphore:
+            return await _embed_batch_async(batch)
+
+    results = await asyncio.gather(*(run(batch) for batch in batches))
+    return [embedding for batch in results for embedding in batch]
+
+async def _embed_batch_async(chunks):
+    estimated = sum(estimate_tokens(chunk) for chunk in chunks)
+    await scheduler.acquire("embeddings", estimated)
+    try:
+        response = await async_request_with_retries(
+            "POST", EMBEDDING_API_URL, headers=EMBEDDING_HEADERS, json={"input": chunks}, timeout=30
+        )
+        response.raise_for_status()
+
+        result = response.json()
+        record_usage("embeddings", result)
+        scheduler.settle("embeddings", estimated, result.get("usage"))
+        embeddings = _parse_embeddings(result)
+
+        logger.debug("Generated {count} embeddings", count=len(embeddings))
+        return embeddings
+
+    except httpx.HTTPError as e:
+        logger.error("Embedding request failed: {error}", error=str(e))
         raise RuntimeError(f"Failed to generate embeddings via HTTP: {e}")
     except json.JSONDecodeError as e:
-        print(f"❌ JSON parsing failed: {e}")
+        logger.error("Embedding response is not JSON: {error}", error=str(e))
         raise RuntimeError(f"Failed to parse embedding response: {e}")
     except Exception as e:
-        print(f"❌ Unexpected error: {e}")
-        raise RuntimeError(f"Failed to generate embeddings: {e}") 
\ No newline at end of file
+        logger.error("Unexpected embedding error: {error}", error=str(e))
+        raise RuntimeError(f"Failed to generate embeddings: {e}")
@@ -0,0 +1,244 @@
+# app/services/embedding_cache.py
+
+import os
+import re
+import time
+import fcntl
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from loguru import logger
+
+# Hits and misses of lookups made in the current context; set with track_lookups()
+_lookups: ContextVar[Optional[dict]] = ContextVar("embedding_cache_lookups", default=None)
+
+def normalize_chunk(text: str) -> str:
+    """Collapse whitespace, so re-flowed copies of the same clause share an entry."""
+    return re.sub(r"\s+", " ", text).strip()
+
+def embedding_key(deployment: str, text: str) -> str:
+    """Cache key of a chunk's embedding: deployment and normalized text."""
+    return hashlib.sha256(f"{deployment}\0{normalize_chunk(text)}".encode("utf-8")).hexdigest()
+
+@contextmanager
+def track_lookups():
+    """
+    Count embedding cache hits and misses in the block (including tasks
+    started from it); yields the {"hits", "misses"} dict being updated.
+    """
+    counts = {"hits": 0, "misses": 0}
+    token = _lookups.set(counts)
+    try:
+        yield counts
+    finally:
+        _lookups.reset(token)
+
+class EmbeddingCache:
+    """
+    Persistent cache of chunk embeddings shared by all documents, so
+    boilerplate that recurs across policies is embedded once.
+
+    Vectors are appended as raw float32 to a blob file; a SQLite index maps
+    each key to its offset and dimension and records when it was last used.
+    Beyond max_entries the least recently used keys are dropped, and the
+    blob is compacted into a new generation once half of it is dead space.
+    Worker processes sharing the directory coordinate with a file lock.
+    A max_entries of 0 disables the cache.
+    """
+
+    INDEX_FILE = "index.sqlite3"
+    LOCK_FILE = "lock"
+    # Compact only blobs at least this large
+    MIN_COMPACT_BYTES = 1024 ** 2
+
+    def __init__(self, cache_dir: str = "./data/cache/embeddings", max_entries: int = 200_000):
+        self.cache_dir = Path(cache_dir)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.RLock()
+        self._db = None
+        self._disabled = max_entries <= 0
+        self._last_used = 0.0
+
+    # Storage
+
+    def _open(self):
+        # Called with self._lock held; opened on first use to keep imports free of I/O
+        if self._db is None and not self._disabled:
+            try:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                db = sqlite3.connect(self.cache_dir / self.INDEX_FILE, timeout=30, check_same_thread=False)
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS entries ("
+                    "key TEXT PRIMARY KEY, offset INTEGER, dim INTEGER, last_used REAL)"
+                )
+                db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+                db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)")
+                db.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('generation', 0)")
+                db.commit()
+                self._db = db
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"Embedding cache disabled: {e}")
+                self._disabled = True
+        return self._db
+
+    def warm(self):
+        """Open the index ahead of the first lookup."""
+        with self._lock:
+            self._open()
+
+    @contextmanager
+    def _file_lock(self, shared: bool = False):
+        fd = os.open(self.cache_dir / self.LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def _blob_path(self, generation: int = None) -> Path:
+        if generation is None:
+            generation = self._db.execute("SELECT value FROM meta WHERE name = 'generation'").fetchone()[0]
+        return self.cache_dir / f"vectors.{generation}.f32"
+
+    def _now(self) -> float:
+        # Strictly increasing, so LRU order is exact even within a clock tick
+        self._last_used = max(time.time(), self._last_used + 1e-6)
+        return self._last_used
+
+    # Entries
+
+    def get_many(self, keys: list) -> dict:
+        """Cached vectors (float32 arrays) of the keys found, marking them used."""
+        keys = list(dict.fromkeys(keys))
+        with self._lock:
+            if not keys or self._open() is None:
+                return {}
+            try:
+                with self._file_lock(shared=True):
+                    rows = []
+                    # Stay below SQLite's limit on bound parameters
+                    for start in range(0, len(keys), 500):
+                        part = keys[start:start + 500]
+                        rows += self._db.execute(
+                            f"SELECT key, offset, dim FROM entries WHERE key IN ({','.join('?' * len(part))})", part
+                        ).fetchall()
+                    if not rows:
+                        return {}
+                    found = {}
+                    with open(self._blob_path(), "rb") as blob:
+                        for key, offset, dim in sorted(rows, key=lambda row: row[1]):
+                            blob.seek(offset)
+                            found[key] = np.frombuffer(blob.read(dim * 4), dtype="<f4")
+                    now = self._now()
+                    self._db.executemany("UPDATE entries SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+                    self._db.commit()
+                    return found
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"Embedding cache read failed: {e}")
+                return {}
+
+    def put_many(self, vectors: dict):
+        """Append vectors (key -> sequence of floats) not cached yet, then evict beyond max_entries."""
+        with self._lock:
+            if not vectors or self._open() is None:
+                return
+            try:
+                with self._file_lock():
+                    known = set()
+                    keys = list(vectors)
+                    for start in range(0, len(keys), 500):
+                        part = keys[start:start + 500]
+                        known.update(row[0] for row in self._db.execute(
+                            f"SELECT key FROM entries WHERE key IN ({','.join('?' * len(part))})", part
+                        ))
+                    rows = []
+                    now = self._now()
+                    # The blob is written and flushed before the index points into it
+                    with open(self._blob_path(), "ab") as blob:
+                        offset = blob.tell()
+                        for key, vector in vectors.items():
+                            if key in known:
+                                continue
+                            data = np.asarray(vector, dtype="<f4").tobytes()
+                            blob.write(data)
+                            rows.append((key, offset, len(data) // 4, now))
+                            offset += len(data)
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO entries (key, offset, dim, last_used) VALUES (?, ?, ?, ?)", rows
+                    )
+                    self._db.commit()
+                    self._evict()
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"Embedding cache write failed: {e}")
+
+    def _evict(self):
+        # Called with both locks held
+        count = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        if count > self.max_entries:
+            excess = count - self.max_entries
+            self._db.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY last_used LIMIT ?)", (excess,)
+            )
+            self._db.commit()
+            self.evictions += excess
+        blob_path = self._blob_path()
+        size = blob_path.stat().st_size if blob_path.exists() else 0
+        live = (self._db.execute("SELECT SUM(dim) FROM entries").fetchone()[0] or 0) * 4
+        if size >= self.MIN_COMPACT_BYTES and size >= 2 * live:
+            self._compact(blob_path)
+
+    def _compact(self, blob_path: Path):
+        # Copy live vectors into the next generation; offsets and generation
+        # change in one transaction, so readers see either blob consistently
+        generation = self._db.execute("SELECT value FROM meta WHERE name = 'generation'").fetchone()[0] + 1
+        new_path = self._blob_path(generation)
+        moved = []
+        with open(blob_path, "rb") as old, open(new_path, "wb") as new:
+            for key, offset, dim in self._db.execute("SELECT key, offset, dim FROM entries ORDER BY offset").fetchall():
+                old.seek(offset)
+                moved.append((new.tell(), key))
+                new.write(old.read(dim * 4))
+            new.flush()
+            os.fsync(new.fileno())
+        self._db.executemany("UPDATE entries SET offset = ? WHERE key = ?", moved)
+        self._db.execute("UPDATE meta SET value = ? WHERE name = 'generation'", (generation,))
+        self._db.commit()
+        blob_path.unlink(missing_ok=True)
+        logger.debug("Compacted embedding cache to {bytes} bytes", bytes=new_path.stat().st_size)
+
+    def count(self, hits: int, misses: int):
+        """Record lookups, also in the counts of the current track_lookups() block."""
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+        counts = _lookups.get()
+        if counts is not None:
+            counts["hits"] += hits
+            counts["misses"] += misses
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = 0
+            if self._db is not None:
+                try:
+                    entries = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+                except sqlite3.Error:
+                    pass
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
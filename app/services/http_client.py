@@ -0,0 +1,212 @@
+# app/services/http_client.py
+
+import time
+import random
+import asyncio
+import threading
+import weakref
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import httpx
+import requests
+from loguru import logger
+from requests.adapters import HTTPAdapter
+
+from app.config import (
+    HTTP_MAX_CONNECTIONS,
+    HTTP_TIMEOUT_SECONDS,
+    HTTP_MAX_RETRIES,
+    HTTP_BACKOFF_BASE_SECONDS,
+    HTTP_BACKOFF_MAX_SECONDS,
+)
+from app.services.metrics import UPSTREAM_REQUESTS, UPSTREAM_RETRIES, UPSTREAM_THROTTLED, upstream_service
+from app.services.rate_limiter import scheduler, time_left
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# Only these responses carry a Retry-After we should honor
+RETRY_AFTER_STATUS_CODES = {429, 503}
+
+_session = None
+_session_lock = threading.Lock()
+
+# One client per event loop: httpx connection pools cannot be shared
+# across loops, and tests / workers may run more than one.
+_async_clients = weakref.WeakKeyDictionary()
+
+def get_session() -> requests.Session:
+    """
+    Return the process-wide requests session (pooled keep-alive connections).
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=HTTP_MAX_CONNECTIONS,
+                    pool_maxsize=HTTP_MAX_CONNECTIONS,
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Return the shared async HTTP client for the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT_SECONDS,
+            follow_redirects=True,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+            ),
+        )
+        _async_clients[loop] = client
+    return client
+
+async def close_async_client():
+    """
+    Close the client bound to the running event loop (called on shutdown).
+    """
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+async def warm_connections(urls: list, timeout: float = 5.0):
+    """
+    Open a keep-alive connection to each URL's host from the running loop's
+    client, so the first upstream call skips the TCP and TLS handshakes.
+    Any HTTP status will do; raises if a host cannot be reached.
+    """
+    client = get_async_client()
+    results = await asyncio.gather(*(client.head(url, timeout=timeout) for url in urls), return_exceptions=True)
+    failed = [f"{url}: {result!r}" for url, result in zip(urls, results) if isinstance(result, Exception)]
+    if failed:
+        raise ConnectionError("; ".join(failed))
+
+def retry_after_seconds(headers) -> float:
+    """
+    Parse Azure's retry-after-ms or a standard Retry-After header
+    (seconds or HTTP date). Returns None when absent or unparseable.
+    """
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(retry_after)
+        return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt: int, status_code: int = None, headers=None) -> float:
+    """
+    Delay before retry number `attempt` (0-based): the server's Retry-After
+    on 429/503, otherwise full-jitter exponential backoff.
+    """
+    if status_code in RETRY_AFTER_STATUS_CODES and headers is not None:
+        retry_after = retry_after_seconds(headers)
+        if retry_after is not None:
+            return retry_after + random.uniform(0, HTTP_BACKOFF_BASE_SECONDS)
+    return random.uniform(0, min(HTTP_BACKOFF_MAX_SECONDS, HTTP_BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+def _should_give_up(attempt: int, delay: float) -> bool:
+    # A Retry-After longer than our backoff cap, or one that outlasts the
+    # request's deadline, is not worth blocking for
+    left = time_left()
+    return attempt >= HTTP_MAX_RETRIES or delay > HTTP_BACKOFF_MAX_SECONDS or (left is not None and delay >= left)
+
+def _bounded_timeout(kwargs: dict, default: float) -> dict:
+    # Never wait on upstream past the request's deadline
+    left = time_left()
+    if left is None:
+        return kwargs
+    return {**kwargs, "timeout": max(0.001, min(kwargs.get("timeout") or default, left))}
+
+def _record_response(service: str, status_code: int, headers=None):
+    if status_code == 429:
+        UPSTREAM_THROTTLED.labels(service).inc()
+        # Hold everyone's calls to this service, not just the one that was throttled
+        scheduler.throttled(service, retry_after_seconds(headers) if headers is not None else None)
+
+def _record_retry(service: str, reason: str, delay: float):
+    UPSTREAM_RETRIES.labels(service, reason).inc()
+    logger.debug("Retrying {service} call after {reason} in {delay:.2f}s", service=service, reason=reason, delay=delay)
+
+def request_with_retries(method: str, url: str, **kwargs) -> requests.Response:
+    """
+    Send a request on the shared session, retrying connection errors and
+    429/5xx responses. The last response is returned for the caller to check.
+    """
+    session = get_session()
+    service = upstream_service(url)
+    attempt = 0
+    while True:
+        try:
+            response = session.request(method, url, **_bounded_timeout(kwargs, HTTP_TIMEOUT_SECONDS))
+        except (requests.ConnectionError, requests.Timeout) as e:
+            delay = backoff_delay(attempt)
+            if _should_give_up(attempt, delay):
+                UPSTREAM_REQUESTS.labels(service, "error").inc()
+                raise
+            _record_retry(service, type(e).__name__, delay)
+        else:
+            _record_response(service, response.status_code, response.headers)
+            if response.status_code not in RETRY_STATUS_CODES:
+                UPSTREAM_REQUESTS.labels(service, str(response.status_code)).inc()
+                return response
+            delay = backoff_delay(attempt, response.status_code, response.headers)
+            if _should_give_up(attempt, delay):
+                UPSTREAM_REQUESTS.labels(service, str(response.status_code)).inc()
+                return response
+            _record_retry(service, str(response.status_code), delay)
+            response.close()
+        time.sleep(delay)
+        attempt += 1
+
+async def async_request_with_retries(method: str, url: str, stream: bool = False, **kwargs) -> httpx.Response:
+    """
+    Async counterpart of request_with_retries on the shared async client.
+    With stream=True the body is not read; the caller must close the response.
+    """
+    client = get_async_client()
+    service = upstream_service(url)
+    attempt = 0
+    while True:
+        try:
+            request = client.build_request(method, url, **_bounded_timeout(kwargs, HTTP_TIMEOUT_SECONDS))
+            response = await client.send(request, stream=stream)
+        except httpx.TransportError as e:
+            delay = backoff_delay(attempt)
+            if _should_give_up(attempt, delay):
+                UPSTREAM_REQUESTS.labels(service, "error").inc()
+                raise
+            _record_retry(service, type(e).__name__, delay)
+        else:
+            _record_response(service, response.status_code, response.headers)
+            if response.status_code not in RETRY_STATUS_CODES:
+                UPSTREAM_REQUESTS.labels(service, str(response.status_code)).inc()
+                return response
+            delay = backoff_delay(attempt, response.status_code, response.headers)
+            if _should_give_up(attempt, delay):
+                UPSTREAM_REQUESTS.labels(service, str(response.status_code)).inc()
+                return response
+            _record_retry(service, str(response.status_code), delay)
+            await response.aclose()
+        await asyncio.sleep(delay)
+        attempt += 1
@@ -0,0 +1,132 @@
+# app/services/ingestion.py
+
+import time
+import asyncio
+from collections import deque
+
+from app.config import INGESTION_QUEUE_DEPTH, EMBEDDING_MAX_WORKERS
+from app.services.document_loader import iter_pages
+from app.services.chunker import iter_token_chunks
+from app.services.embedder_new import iter_batches, embed_chunks_async
+from app.services.embedding_cache import track_lookups
+from app.services.vector_store import store_embeddings, delete_document, publish_document
+
+def _timed(iterable, stage_seconds: dict, stage: str):
+    """
+    Pass items through while adding the time spent producing them to
+    stage_seconds[stage] (inclusive of the stages feeding it).
+    """
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            stage_seconds[stage] += time.perf_counter() - start
+            return
+        stage_seconds[stage] += time.perf_counter() - start
+        yield item
+
+async def ingest_document(source, doc_id: str) -> dict:
+    """
+    Parse, chunk, embed and store a document as a pipeline.
+
+    Pages are extracted and chunked in a worker thread while earlier
+    embedding batches are in flight and finished batches are being stored,
+    so the network and the CPU work overlap. At most EMBEDDING_MAX_WORKERS
+    batches are being embedded and INGESTION_QUEUE_DEPTH are waiting to be
+    stored at any time.
+
+    Returns {"chunks", "embeddings", "metadatas", "stage_seconds",
+    "embedding_cache"}, where metadatas holds each chunk's source pages and
+    character offsets, stage_seconds holds the busy time of each stage plus
+    the wall-clock "total" and embedding_cache the chunks served from the
+    embedding cache ("hits") and sent upstream ("misses").
+    """
+    started = time.perf_counter()
+    inclusive = {"parse": 0.0, "chunk": 0.0, "batch": 0.0}
+    stage_seconds = {"embed": 0.0, "store": 0.0}
+    cache_counts = {"hits": 0, "misses": 0}
+    chunks = _timed(iter_token_chunks(_timed(iter_pages(source), inclusive, "parse")), inclusive, "chunk")
+    batches = _timed(iter_batches(chunks, key=lambda chunk: chunk["text"]), inclusive, "batch")
+
+    all_chunks, all_embeddings, all_metadatas = [], [], []
+    store_queue = asyncio.Queue(maxsize=INGESTION_QUEUE_DEPTH)
+    in_flight = deque()
+
+    async def embed(texts):
+        start = time.perf_counter()
+        with track_lookups() as counts:
+            embeddings = await embed_chunks_async(texts)
+        stage_seconds["embed"] += time.perf_counter() - start
+        for name, count in counts.items():
+            cache_counts[name] += count
+        return embeddings
+
+    async def store_stage():
+        while True:
+            item = await store_queue.get()
+            if item is None:
+                return
+            start = time.perf_counter()
+            await asyncio.to_thread(store_embeddings, doc_id, *item)
+            stage_seconds["store"] += time.perf_counter() - start
+
+    async def enqueue(item):
+        # A failed store stage stops reading the queue: raise its error
+        # instead of waiting forever for room in it
+        put = asyncio.ensure_future(store_queue.put(item))
+        await asyncio.wait({put, store_task}, return_when=asyncio.FIRST_COMPLETED)
+        if store_task.done() and store_task.exception() is not None:
+            put.cancel()
+            raise store_task.exception()
+
+    async def drain_oldest():
+        # Batches are stored in document order, whatever order they finish in
+        texts, metadatas, task = in_flight.popleft()
+        embeddings = await task
+        all_chunks.extend(texts)
+        all_embeddings.extend(embeddings)
+        all_metadatas.extend(metadatas)
+        await enqueue((texts, embeddings, metadatas))
+
+    store_task = asyncio.create_task(store_stage())
+    try:
+        while True:
+            batch = await asyncio.to_thread(next, batches, None)
+            if batch is None:
+                break
+            texts = [chunk["text"] for chunk in batch]
+            metadatas = [{k: v for k, v in chunk.items() if k != "text"} for chunk in batch]
+            in_flight.append((texts, metadatas, asyncio.create_task(embed(texts))))
+            if len(in_flight) >= EMBEDDING_MAX_WORKERS:
+                await drain_oldest()
+        while in_flight:
+            await drain_oldest()
+        await enqueue(None)
+        await store_task
+        await asyncio.to_thread(publish_document, doc_id)
+    except BaseException:
+        for _, _, task in in_flight:
+            task.cancel()
+        # Let a store already running in its thread finish before deleting,
+        # or it could recreate the document afterwards
+        while not store_queue.empty():
+            store_queue.get_nowait()
+        store_queue.put_nowait(None)
+        await asyncio.gather(store_task, return_exceptions=True)
+        # Never leave a half-stored document behind
+        await asyncio.to_thread(delete_document, doc_id)
+        raise
+
+    # Each generator's time includes the stages feeding it
+    stage_seconds["parse"] = inclusive["parse"]
+    stage_seconds["chunk"] = inclusive["chunk"] - inclusive["parse"]
+    stage_seconds["total"] = time.perf_counter() - started
+    return {
+        "chunks": all_chunks,
+        "embeddings": all_embeddings,
+        "metadatas": all_metadatas,
+        "stage_seconds": {stage: round(seconds, 3) for stage, seconds in stage_seconds.items()},
+        "embedding_cache": cache_counts,
+    }
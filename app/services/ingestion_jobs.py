@@ -0,0 +1,139 @@
+# app/services/ingestion_jobs.py
+
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+from loguru import logger
+
+# Job lifecycle
+QUEUED, RUNNING, READY, FAILED = "queued", "running", "ready", "failed"
+
+class JobQueueFull(Exception):
+    """Raised when the ingestion backlog is at its limit."""
+
+class IngestionJobs:
+    """
+    Bounded pool of background ingestion workers.
+
+    Jobs are queued and run by at most `workers` tasks at a time; submitting
+    beyond `max_queued` waiting jobs raises JobQueueFull. A job submitted
+    with the dedupe key of a job that is still queued or running returns
+    that job instead of starting another. Finished jobs are kept (up to
+    `history`) so their status and timings can be looked up.
+    """
+
+    def __init__(self, workers: int = 2, max_queued: int = 32, history: int = 1000):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.history = history
+        # job_id -> job dict (public fields only)
+        self._jobs = OrderedDict()
+        self._active = {}
+        self._done_events = {}
+        self._work = {}
+        self._queue = None
+        self._tasks = []
+        self._loop = None
+
+    def _ensure_workers(self):
+        # Workers belong to the event loop serving requests; restart them if
+        # that loop changed (e.g. between test clients)
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and all(not task.done() for task in self._tasks):
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+        for job_id, job in self._jobs.items():
+            if job["status"] in (QUEUED, RUNNING):
+                # Orphaned by a previous loop; run it again
+                job["status"] = QUEUED
+                self._done_events[job_id] = asyncio.Event()
+                self._queue.put_nowait(job_id)
+
+    def submit(self, dedupe_key: str, work: Callable[[dict], Awaitable[None]], job_id: str = None, **fields) -> dict:
+        """
+        Queue work(job) and return the job. work may set "digest",
+        "doc_id" and "timings" on the job; raising marks the job failed.
+        """
+        self._ensure_workers()
+        existing = self._active.get(dedupe_key)
+        if existing is not None:
+            return self._jobs[existing]
+        if self._queue.qsize() >= self.max_queued:
+            raise JobQueueFull(f"{self._queue.qsize()} ingestion jobs are already waiting")
+
+        job_id = job_id or uuid.uuid4().hex[:16]
+        job = {
+            "document_id": job_id,
+            "status": QUEUED,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "timings": {},
+            "error": None,
+            **fields,
+        }
+        self._jobs[job_id] = job
+        self._jobs.move_to_end(job_id)
+        self._active[dedupe_key] = job_id
+        self._work[job_id] = (dedupe_key, work)
+        self._done_events[job_id] = asyncio.Event()
+        self._queue.put_nowait(job_id)
+        self._trim_history()
+        return job
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self._jobs.get(job_id)
+
+    async def wait(self, job_id: str) -> Optional[dict]:
+        """Wait for a job to finish and return it (None if unknown)."""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        event = self._done_events.get(job_id)
+        if event is not None and job["status"] in (QUEUED, RUNNING):
+            self._ensure_workers()
+            await event.wait()
+        return job
+
+    def stats(self) -> dict:
+        counts = {status: 0 for status in (QUEUED, RUNNING, READY, FAILED)}
+        for job in self._jobs.values():
+            counts[job["status"]] += 1
+        return {"workers": self.workers, "max_queued": self.max_queued, **counts}
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            job = self._jobs.get(job_id)
+            dedupe_key, work = self._work.get(job_id, (None, None))
+            if job is None or work is None:
+                continue
+            job["status"] = RUNNING
+            job["started_at"] = time.time()
+            job["timings"]["queued"] = round(job["started_at"] - job["created_at"], 3)
+            try:
+                await work(job)
+                job["status"] = READY
+            except Exception as e:
+                logger.warning("Ingestion job {job_id} failed: {error}", job_id=job_id, error=str(e))
+                job["status"] = FAILED
+                job["error"] = str(e)
+            finally:
+                job["finished_at"] = time.time()
+                job["timings"]["total"] = round(job["finished_at"] - job["created_at"], 3)
+                if self._active.get(dedupe_key) == job_id:
+                    del self._active[dedupe_key]
+                self._work.pop(job_id, None)
+                event = self._done_events.pop(job_id, None)
+                if event is not None:
+                    event.set()
+
+    def _trim_history(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job["status"] in (READY, FAILED)]
+        for job_id in finished[:max(0, len(self._jobs) - self.history)]:
+            del self._jobs[job_id]
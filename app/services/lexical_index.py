@@ -0,0 +1,247 @@
+# app/services/lexical_index.py
+
+import os
+import re
+import math
+import threading
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from loguru import logger
+
+from app.config import LEXICAL_INDEX_DIR, VECTOR_STORE_MAX_DOCUMENTS
+
+# Numbers are kept whole with their separators: clause "4.2.1", amount "1,00,000"
+_TOKEN = re.compile(r"\d+(?:[.,/]\d+)*%?|[^\W\d_]+")
+STOPWORDS = frozenset(
+    "a an and any are as at be been by can do does for from has have how i if in is it its of on or "
+    "than that the their there this to under was what when where which who whom will with".split()
+)
+
+def _stem(word: str) -> str:
+    # Inflections only: "diseases" -> "disease", "policies" -> "policy", "limited" -> "limit"
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 5 and word.endswith("ing"):
+        return word[:-3]
+    if len(word) > 4 and word.endswith("ed"):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+def tokenize(text: str) -> list:
+    """Lower-cased BM25 terms of text, without stopwords; digit group commas are dropped."""
+    terms = []
+    for token in _TOKEN.findall(text.lower()):
+        if token[0].isdigit():
+            terms.append(token.replace(",", ""))
+        elif token not in STOPWORDS:
+            terms.append(_stem(token))
+    return terms
+
+def reciprocal_rank_fusion(rankings: list, k: int = 60, weights: list = None) -> list:
+    """Items of several best-first rankings, ordered by their summed weight / (k + rank)."""
+    scores = {}
+    for ranking, weight in zip(rankings, weights or [1.0] * len(rankings)):
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + weight / (k + rank)
+    # Stable: ties keep the order of the first ranking
+    return sorted(scores, key=scores.get, reverse=True)
+
+class BM25Index:
+    """
+    Okapi BM25 over the chunks of one document, as compressed sparse rows:
+    the chunks containing term t are postings[offsets[t]:offsets[t + 1]]
+    (ascending), with the term's frequency in each at the same positions
+    of freqs. Each posting's BM25 weight is precomputed, so scoring a query
+    is one scatter-add per query term.
+    """
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, terms: np.ndarray, offsets: np.ndarray, postings: np.ndarray, freqs: np.ndarray,
+                 lengths: np.ndarray):
+        self.terms = terms
+        self.offsets = offsets
+        self.postings = postings
+        self.freqs = freqs
+        self.lengths = lengths
+        self.vocabulary = {str(term): i for i, term in enumerate(terms)}
+        chunks = len(lengths)
+        frequencies = np.diff(offsets)
+        self.idf = np.log1p((chunks - frequencies + 0.5) / (frequencies + 0.5)).astype(np.float32)
+        # Weight of a term absent from the document: as rare as a term can be
+        self.max_idf = math.log1p((chunks + 0.5) / 0.5)
+        average = float(lengths.mean()) if chunks else 0.0
+        norms = self.K1 * (1 - self.B + self.B * lengths / (average or 1.0))
+        tf = freqs.astype(np.float32)
+        term_of_posting = np.repeat(np.arange(len(terms)), frequencies)
+        self.weights = (self.idf[term_of_posting] * tf * (self.K1 + 1) / (tf + norms[postings])).astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.terms, self.offsets, self.postings, self.freqs, self.lengths, self.weights))
+
+    @classmethod
+    def build(cls, chunks: list) -> "BM25Index":
+        vocabulary, term_ids, rows, counts = {}, [], [], []
+        lengths = np.zeros(len(chunks), dtype=np.int32)
+        for row, chunk in enumerate(chunks):
+            tokens = tokenize(chunk)
+            lengths[row] = len(tokens)
+            for term, count in Counter(tokens).items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                rows.append(row)
+                counts.append(count)
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        # A stable sort keeps each term's chunks in ascending order
+        order = np.argsort(term_ids, kind="stable")
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(vocabulary)), out=offsets[1:])
+        return cls(
+            np.array(list(vocabulary), dtype=str),
+            offsets,
+            np.asarray(rows, dtype=np.int32)[order],
+            np.minimum(np.asarray(counts, dtype=np.int64), np.iinfo(np.uint16).max).astype(np.uint16)[order],
+            lengths,
+        )
+
+    def save(self, path: Path):
+        # Written aside and renamed, so other worker processes never read a partial file
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, terms=self.terms, offsets=self.offsets, postings=self.postings, freqs=self.freqs,
+                     lengths=self.lengths)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "BM25Index":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["terms"], data["offsets"], data["postings"], data["freqs"], data["lengths"])
+
+    def search(self, query: str, top_k: int) -> dict:
+        """
+        Rows of the top_k chunks (best first, only chunks matching a term)
+        with their scores, plus how strongly the best chunk matches: the
+        share of the query's IDF mass it contains ("coverage", where terms
+        the document lacks count at the maximum IDF) and that mass ("idf").
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        scores = np.zeros(len(self), dtype=np.float32)
+        matched = np.zeros(len(self), dtype=np.float32)
+        total = 0.0
+        for term in terms:
+            t = self.vocabulary.get(term)
+            if t is None:
+                total += self.max_idf
+                continue
+            total += float(self.idf[t])
+            # Postings of a term are distinct chunks, so fancy-index adds are exact
+            start, end = self.offsets[t], self.offsets[t + 1]
+            scores[self.postings[start:end]] += self.weights[start:end]
+            matched[self.postings[start:end]] += self.idf[t]
+        hits = np.flatnonzero(scores)
+        if len(hits) > top_k:
+            hits = hits[np.argpartition(-scores[hits], top_k - 1)[:top_k]]
+        rows = hits[np.argsort(-scores[hits], kind="stable")]
+        best = float(matched[rows[0]]) if len(rows) else 0.0
+        return {
+            "rows": rows,
+            "scores": scores[rows],
+            "coverage": best / total if total else 0.0,
+            "idf": best,
+        }
+
+class LexicalIndexStore:
+    """
+    BM25 indexes of the stored documents, next to their vectors: chunks
+    staged by store_embeddings are indexed when the document is published,
+    saved as <directory>/<doc_id>.npz and loaded on demand, keeping the
+    max_documents most recently used in memory. Chunk rows are the
+    vector store's, so hits can be fetched from it by position.
+    """
+
+    def __init__(self, directory: str = "./data/lexical", max_documents: int = 50):
+        self.directory = Path(directory)
+        self.max_documents = max_documents
+        self._pending = {}
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, doc_id: str) -> Path:
+        return self.directory / f"{doc_id}.npz"
+
+    def _remember(self, doc_id: str, index: BM25Index):
+        # Called with self._lock held
+        self._loaded[doc_id] = index
+        self._loaded.move_to_end(doc_id)
+        while self.max_documents and len(self._loaded) > self.max_documents:
+            self._loaded.popitem(last=False)
+
+    def add(self, doc_id: str, chunks: list):
+        """Stage chunks appended to a document; indexed by publish()."""
+        with self._lock:
+            self._pending.setdefault(doc_id, []).extend(chunks)
+
+    def publish(self, doc_id: str):
+        """Build and persist the index of a document whose chunks have all been added."""
+        with self._lock:
+            chunks = self._pending.pop(doc_id, None)
+        if chunks is None:
+            return
+        index = BM25Index.build(chunks)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        index.save(self._path(doc_id))
+        with self._lock:
+            self._remember(doc_id, index)
+        logger.debug("Built BM25 index of {doc_id}: {terms} terms", doc_id=doc_id, terms=len(index.terms))
+
+    def get(self, doc_id: str) -> Optional[BM25Index]:
+        """The document's index, or None if it has none (e.g. ingested before hybrid retrieval)."""
+        with self._lock:
+            index = self._loaded.get(doc_id)
+            if index is not None:
+                self.hits += 1
+                self._loaded.move_to_end(doc_id)
+                return index
+            self.misses += 1
+        try:
+            index = BM25Index.load(self._path(doc_id))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Unreadable BM25 index of {doc_id}: {error}", doc_id=doc_id, error=str(e))
+            return None
+        with self._lock:
+            self._remember(doc_id, index)
+        return index
+
+    def delete(self, doc_id: str):
+        with self._lock:
+            self._pending.pop(doc_id, None)
+            self._loaded.pop(doc_id, None)
+        self._path(doc_id).unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._loaded),
+                "max_documents": self.max_documents,
+                "bytes": sum(index.nbytes for index in self._loaded.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+# Global store, None when LEXICAL_INDEX_DIR is empty (vector-only retrieval)
+lexical_index = LexicalIndexStore(LEXICAL_INDEX_DIR, VECTOR_STORE_MAX_DOCUMENTS) if LEXICAL_INDEX_DIR else None
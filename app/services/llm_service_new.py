@@ -2,39 +2,38 @@
 # This file completely replaces the old llm_service.py
 # Deployment ID: COMPLETE-NUCLEAR-SOLUTION-2024
 
-import os
-import requests
+import httpx
 import json
+from loguru import logger
+from app.config import (
+    AZURE_OPENAI_CHAT_API_KEY,
+    AZURE_OPENAI_CHAT_ENDPOINT,
+    AZURE_OPENAI_CHAT_DEPLOYMENT,
+)
+from app.services.http_client import async_request_with_retries
+from app.services.metrics import record_usage
+from app.services.rate_limiter import scheduler
+from app.utils.helpers import estimate_tokens
 
-def query_llm(prompt, context_chunks):
+# Read once at import; the endpoint does not change per call
+CHAT_API_URL = (
+    f"{(AZURE_OPENAI_CHAT_ENDPOINT or '').rstrip('/')}/openai/deployments/"
+    f"{AZURE_OPENAI_CHAT_DEPLOYMENT}/chat/completions?api-version=2024-12-01-preview"
+)
+CHAT_HEADERS = {
+    "Content-Type": "application/json",
+    "api-key": AZURE_OPENAI_CHAT_API_KEY or ""
+}
+
+def _build_chat_body(prompt, context_chunks):
     """
-    Query GPT-4.1 with context chunks using direct HTTP requests.
-    This bypasses the openai library issues completely.
+    Build the request body of an Azure OpenAI chat completion call.
     """
-    # Load environment variables
-    API_KEY = os.getenv("AZURE_OPENAI_CHAT_API_KEY")
-    ENDPOINT = os.getenv("AZURE_OPENAI_CHAT_ENDPOINT")
-    DEPLOYMENT = os.getenv("AZURE_OPENAI_CHAT_DEPLOYMENT")
-
-    print(f"🔗 Azure Endpoint: {ENDPOINT}")
-    print(f"🔑 API Key (last 5): {API_KEY[-5:] if API_KEY else 'MISSING'}")
-    print(f"🤖 Deployment: {DEPLOYMENT}")
-
-    # Construct the API URL
-    api_url = f"{ENDPOINT}/openai/deployments/{DEPLOYMENT}/chat/completions?api-version=2024-12-01-preview"
-    
-    # Prepare headers
-    headers = {
-        "Content-Type": "application/json",
-        "api-key": API_KEY
-    }
-    
     # Prepare context and prompt
     context = "\n\n".join(context_chunks)
     final_prompt = f"{prompt}\n\nContext:\n{context}"
-    
-    # Prepare request body
-    data = {
+
+    return {
         "messages": [
             {
                 "role": "user",
@@ -44,24 +43,109 @@ def query_llm(prompt, context_chunks):
         "max_tokens": 1000,
         "temperature": 0.7
     }
-    
+
+def _estimated_tokens(body):
+    # Azure counts max_tokens against the deployment's TPM quota up front
+    return sum(estimate_tokens(message["content"]) for message in body["messages"]) + body["max_tokens"]
+
+async def query_llm_async(prompt, context_chunks):
+    """
+    Query GPT-4.1 with context chunks on the shared async HTTP client, so
+    concurrent questions do not block the event loop.
+    """
+    body = _build_chat_body(prompt, context_chunks)
+    estimated = _estimated_tokens(body)
+    await scheduler.acquire("chat", estimated)
     try:
-        print("🚀 Making direct HTTP request to Azure OpenAI...")
-        response = requests.post(api_url, headers=headers, json=data, timeout=60)
+        response = await async_request_with_retries("POST", CHAT_API_URL, headers=CHAT_HEADERS, json=body, timeout=60)
         response.raise_for_status()
-        
+
         result = response.json()
+        record_usage("chat", result)
+        scheduler.settle("chat", estimated, result.get("usage"))
         answer = result["choices"][0]["message"]["content"]
-        
-        print("✅ Successfully generated LLM response")
+
+        logger.debug("Generated LLM response")
         return answer
-        
-    except requests.exceptions.RequestException as e:
-        print(f"❌ HTTP request failed: {e}")
+
+    except httpx.HTTPError as e:
+        logger.error("LLM request failed: {error}", error=str(e))
         raise RuntimeError(f"Failed to query LLM via HTTP: {e}")
     except json.JSONDecodeError as e:
-        print(f"❌ JSON parsing failed: {e}")
+        logger.error("LLM response is not JSON: {error}", error=str(e))
         raise RuntimeError(f"Failed to parse LLM response: {e}")
     except Exception as e:
-        print(f"❌ Unexpected error: {e}")
-        raise RuntimeError(f"Failed to query LLM: {e}") 
\ No newline at end of file
+        logger.error("Unexpected LLM error: {error}", error=str(e))
+        raise RuntimeError(f"Failed to query LLM: {e}")
+
+def _build_packed_body(questions, context_chunks):
+    """
+    Build a chat completion body asking several questions over one shared
+    context, answered as a JSON object.
+    """
+    context = "\n\n".join(context_chunks)
+    numbered = "\n".join(f"{i}. {question}" for i, question in enumerate(questions))
+    final_prompt = (
+        "Answer each of the following questions using the context below.\n\n"
+        f"Questions:\n{numbered}\n\n"
+        f"Context:\n{context}\n\n"
+        'Respond with only a JSON object of the form {"answers": [{"index": 0, "answer": "..."}, ...]} '
+        "containing exactly one answer for every question index."
+    )
+
+    return {
+        "messages": [
+            {
+                "role": "user",
+                "content": final_prompt
+            }
+        ],
+        "max_tokens": max(1000, 400 * len(questions)),
+        "temperature": 0.7,
+        "response_format": {"type": "json_object"}
+    }
+
+def parse_packed_answers(content, question_count):
+    """
+    Parse the JSON of a packed completion into one answer per question.
+    Raises ValueError when the output is malformed or incomplete.
+    """
+    content = content.strip()
+    if content.startswith("```"):
+        # Tolerate a fenced code block around the JSON
+        content = content.strip("`").removeprefix("json").strip()
+    try:
+        items = json.loads(content)["answers"]
+        answers = {int(item["index"]): str(item["answer"]) for item in items}
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Unparseable packed answer: {e}")
+    if set(answers) != set(range(question_count)):
+        raise ValueError(f"Packed answer covers questions {sorted(answers)}, expected {question_count}")
+    return [answers[i] for i in range(question_count)]
+
+async def query_llm_packed_async(questions, context_chunks):
+    """
+    Answer several questions with one chat completion over a shared
+    context. Raises RuntimeError on upstream failures and ValueError when
+    the output does not parse, so callers can fall back to single calls.
+    """
+    body = _build_packed_body(questions, context_chunks)
+    estimated = _estimated_tokens(body)
+    await scheduler.acquire("chat", estimated)
+    try:
+        response = await async_request_with_retries("POST", CHAT_API_URL, headers=CHAT_HEADERS, json=body, timeout=60)
+        response.raise_for_status()
+        result = response.json()
+        record_usage("chat", result)
+        scheduler.settle("chat", estimated, result.get("usage"))
+        content = result["choices"][0]["message"]["content"]
+    except httpx.HTTPError as e:
+        logger.error("LLM request failed: {error}", error=str(e))
+        raise RuntimeError(f"Failed to query LLM via HTTP: {e}")
+    except Exception as e:
+        logger.error("Unexpected LLM error: {error}", error=str(e))
+        raise RuntimeError(f"Failed to query LLM: {e}")
+
+    answers = parse_packed_answers(content, len(questions))
+    logger.debug("Generated packed LLM response for {count} questions", count=len(questions))
+    return answers
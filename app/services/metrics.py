@@ -0,0 +1,151 @@
+# app/services/metrics.py
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+STAGES = ("download", "save", "parse", "chunk", "embed", "store", "retrieval", "llm", "evaluation")
+
+STAGE_SECONDS = Histogram(
+    "docquery_stage_seconds",
+    "Time spent in each processing stage",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+REQUEST_SECONDS = Histogram(
+    "docquery_request_seconds",
+    "End-to-end latency of API requests",
+    ["route", "status"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+REQUESTS_IN_FLIGHT = Gauge("docquery_requests_in_flight", "API requests being processed")
+UPSTREAM_REQUESTS = Counter(
+    "docquery_upstream_requests_total",
+    "HTTP calls to Azure OpenAI and document hosts, by final status",
+    ["service", "status"],
+)
+UPSTREAM_RETRIES = Counter(
+    "docquery_upstream_retries_total",
+    "Retried upstream calls, by the status code or error that caused the retry",
+    ["service", "reason"],
+)
+UPSTREAM_THROTTLED = Counter(
+    "docquery_upstream_throttled_total",
+    "Upstream 429 responses",
+    ["service"],
+)
+TOKENS_USED = Counter(
+    "docquery_tokens_total",
+    "Tokens reported by Azure OpenAI usage blocks",
+    ["service", "kind"],
+)
+SCHEDULER_QUEUE_DEPTH = Gauge(
+    "docquery_scheduler_queue_depth",
+    "Azure OpenAI calls waiting for rate-limit capacity",
+    ["service"],
+)
+SCHEDULER_WAIT_SECONDS = Histogram(
+    "docquery_scheduler_wait_seconds",
+    "Time Azure OpenAI calls waited for rate-limit capacity",
+    ["service", "priority"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+SCHEDULER_REJECTED = Counter(
+    "docquery_scheduler_rejected_total",
+    "Azure OpenAI calls rejected because their deadline would pass in the queue",
+    ["service", "priority"],
+)
+ADMISSION_ACTIVE = Gauge("docquery_admission_active", "Slots in use per admission pool", ["pool"])
+ADMISSION_QUEUED = Gauge("docquery_admission_queued", "Callers waiting for an admission slot", ["pool"])
+ADMISSION_REJECTED = Counter(
+    "docquery_admission_rejected_total",
+    "Work rejected by admission control, by pool and reason",
+    ["pool", "reason"],
+)
+RETRIEVAL_PATHS = Counter(
+    "docquery_retrieval_paths_total",
+    "Questions retrieved lexically only (no embedding call), by fused hybrid search, or by vectors only",
+    ["path"],
+)
+
+# Per-request stage durations for the Server-Timing header; None outside
+# requests that opted in
+_request_timings: ContextVar[Optional[dict]] = ContextVar("request_timings", default=None)
+
+def upstream_service(url: str) -> str:
+    """Label of an upstream call: "embeddings", "chat" or "download"."""
+    if "/embeddings" in url:
+        return "embeddings"
+    if "/chat/completions" in url:
+        return "chat"
+    return "download"
+
+def observe_stage(stage: str, seconds: float):
+    """Record a stage duration in the histogram and the request's timings."""
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+@contextmanager
+def stage_timer(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+def record_usage(service: str, result: dict):
+    """Count the tokens of an Azure OpenAI response's usage block."""
+    usage = result.get("usage") or {}
+    for kind in ("prompt_tokens", "completion_tokens"):
+        if usage.get(kind):
+            TOKENS_USED.labels(service, kind.removesuffix("_tokens")).inc(usage[kind])
+
+def start_request_timings() -> tuple:
+    """Collect stage timings for the current request; returns (timings, reset token)."""
+    timings = {}
+    return timings, _request_timings.set(timings)
+
+def stop_request_timings(token):
+    _request_timings.reset(token)
+
+def request_timings() -> Optional[dict]:
+    """Stage timings collected so far for the current request, if enabled."""
+    return _request_timings.get()
+
+def server_timing_header(timings: dict) -> str:
+    """Format stage timings as a Server-Timing header value (milliseconds)."""
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
+
+class CacheStatsCollector:
+    """Export the hit/miss counters of the in-process caches at scrape time."""
+
+    def __init__(self):
+        self.caches = {}
+
+    def register(self, name: str, stats: Callable[[], dict]):
+        self.caches[name] = stats
+
+    def collect(self):
+        hit_ratio = GaugeMetricFamily("docquery_cache_hit_ratio", "Cache hit ratio", labels=["cache"])
+        lookups = GaugeMetricFamily("docquery_cache_lookups", "Cache lookups by result", labels=["cache", "result"])
+        entries = GaugeMetricFamily("docquery_cache_entries", "Entries held by each cache", labels=["cache"])
+        for name, stats in self.caches.items():
+            values = stats()
+            hit_ratio.add_metric([name], values.get("hit_ratio", 0.0))
+            lookups.add_metric([name, "hit"], values.get("hits", 0))
+            lookups.add_metric([name, "miss"], values.get("misses", 0))
+            entries.add_metric([name], values.get("entries", 0))
+        yield from (hit_ratio, lookups, entries)
+
+cache_stats = CacheStatsCollector()
+REGISTRY.register(cache_stats)
+
+def render_metrics() -> tuple:
+    """Current metrics in the Prometheus text format; returns (body, content type)."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
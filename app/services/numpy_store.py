@@ -0,0 +1,301 @@
+# app/services/numpy_store.py
+
+import os
+import json
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+from app.services.vector_store import VectorStore
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """
+    L2-normalize each row so a dot product is the cosine similarity.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """
+    Column indices of the top_k highest scores of each row, best first.
+    """
+    top_k = min(top_k, scores.shape[1])
+    if top_k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    if top_k < scores.shape[1]:
+        candidates = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+    else:
+        candidates = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1)
+    return np.take_along_axis(candidates, order, axis=1)
+
+PRECISIONS = ("float32", "float16", "int8")
+
+def quantize_rows(vectors: np.ndarray, precision: str) -> tuple:
+    """
+    Compress normalized float32 rows; returns (codes, scales). int8 codes
+    carry one float32 scale per row, the other precisions None.
+    """
+    if precision == "float32":
+        return vectors, None
+    if precision == "float16":
+        return vectors.astype(np.float16), None
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1.0
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def dequantize_rows(codes: np.ndarray, scales: np.ndarray = None) -> np.ndarray:
+    rows = np.asarray(codes, dtype=np.float32)
+    return rows * scales[:, None] if scales is not None else rows
+
+def approximate_scores(queries: np.ndarray, codes: np.ndarray, scales: np.ndarray = None,
+                       block_rows: int = 8192) -> np.ndarray:
+    """
+    Scores of normalized float32 queries against (possibly quantized) rows.
+    Compressed rows are widened block_rows at a time, so a search never
+    holds a float32 copy of the whole matrix.
+    """
+    if codes.dtype == np.float32:
+        return queries @ codes.T
+    scores = np.empty((queries.shape[0], codes.shape[0]), dtype=np.float32)
+    for start in range(0, codes.shape[0], block_rows):
+        block = np.asarray(codes[start:start + block_rows], dtype=np.float32)
+        scores[:, start:start + block_rows] = queries @ block.T
+    if scales is not None:
+        scores *= scales
+    return scores
+
+class NumpyVectorStore(VectorStore):
+    """
+    In-process vector store keeping each document's embeddings as one
+    contiguous, L2-normalized matrix. A batch of queries is one matrix
+    product plus argpartition. With a persist directory the matrices are
+    written as .npy files and memory-mapped when reloaded, so documents
+    unloaded to stay within the memory budget come back lazily.
+
+    Batches added to a document are kept in memory (pinned, and joined
+    into one matrix only when the document is searched) until publish(),
+    which writes its files once; ingestion that stores a document batch by
+    batch therefore writes each document a single time.
+
+    With precision "float16" or "int8" (one scale per row) the matrix that
+    is searched is compressed to a half or a quarter of its size. When the
+    float32 vectors are persisted too, the top_k * rescore_factor best
+    candidates are re-scored against them, reading only those rows.
+    """
+
+    def __init__(self, persist_directory: str = None, max_bytes: int = 0, max_documents: int = 0,
+                 precision: str = "float32", rescore_factor: int = 4):
+        super().__init__(max_bytes, max_documents)
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown vector precision: {precision}")
+        self.precision = precision
+        self.rescore_factor = rescore_factor
+        self.persist_directory = Path(persist_directory) if persist_directory else None
+        if self.persist_directory:
+            self.persist_directory.mkdir(parents=True, exist_ok=True)
+        # doc_id -> {"matrix": np.ndarray, "scales": np.ndarray | None, "exact": np.ndarray | None,
+        #            "chunks": list[str], "metadatas": list[dict] | None}
+        # where "exact" is the memory-mapped float32 matrix kept for re-scoring
+        self.documents = {}
+        # doc_id -> batches added and not yet published, in the same form
+        self._batches = {}
+
+    def _document_dir(self, doc_id: str) -> Path:
+        return self.persist_directory / doc_id
+
+    def _save_array(self, doc_dir: Path, name: str, array: np.ndarray):
+        # Write then rename so a concurrent reader never maps a partial file
+        tmp_path = doc_dir / f"{name}.tmp.npy"
+        np.save(tmp_path, array)
+        os.replace(tmp_path, doc_dir / f"{name}.npy")
+
+    def _save(self, doc_id: str, document: dict, exact: np.ndarray):
+        doc_dir = self._document_dir(doc_id)
+        doc_dir.mkdir(parents=True, exist_ok=True)
+        if self.precision != "float32":
+            self._save_array(doc_dir, f"embeddings.{self.precision}", document["matrix"])
+            if document["scales"] is not None:
+                self._save_array(doc_dir, "scales", document["scales"])
+        for name in ("chunks", "metadatas"):
+            with open(doc_dir / f"{name}.json.tmp", "w", encoding="utf-8") as f:
+                json.dump(document[name], f)
+            os.replace(doc_dir / f"{name}.json.tmp", doc_dir / f"{name}.json")
+        # Written last: its presence means the document is complete
+        self._save_array(doc_dir, "embeddings", exact)
+
+    def _load(self, doc_id: str):
+        doc_dir = self._document_dir(doc_id)
+        with open(doc_dir / "chunks.json", "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+        metadatas = None
+        if (doc_dir / "metadatas.json").exists():
+            with open(doc_dir / "metadatas.json", "r", encoding="utf-8") as f:
+                metadatas = json.load(f)
+        exact = np.load(doc_dir / "embeddings.npy", mmap_mode="r")
+        if self.precision == "float32":
+            return {"matrix": exact, "scales": None, "exact": None, "chunks": chunks, "metadatas": metadatas}
+        compressed = doc_dir / f"embeddings.{self.precision}.npy"
+        if compressed.exists():
+            matrix = np.load(compressed, mmap_mode="r")
+            scales = np.load(doc_dir / "scales.npy") if self.precision == "int8" else None
+        else:
+            # Stored before the precision was changed
+            matrix, scales = quantize_rows(np.asarray(exact), self.precision)
+        return {"matrix": matrix, "scales": scales, "exact": exact, "chunks": chunks, "metadatas": metadatas}
+
+    @staticmethod
+    def _footprint(document: dict) -> int:
+        scales = document["scales"].nbytes if document["scales"] is not None else 0
+        return document["matrix"].nbytes + scales + sum(len(chunk.encode("utf-8")) for chunk in document["chunks"])
+
+    def _get(self, doc_id: str):
+        with self._lock:
+            if self._writing(doc_id):
+                return self._join_batches(doc_id)
+            document = self.documents.get(doc_id)
+            if document is not None:
+                self.resident.hits += 1
+                self.resident.touch(doc_id)
+            elif self._on_disk(doc_id):
+                document = self.documents[doc_id] = self._load(doc_id)
+                self.resident.reloads += 1
+                self.resident.touch(doc_id, self._footprint(document))
+                self._enforce_budget(keep=doc_id)
+            return document
+
+    def _unload(self, doc_id):
+        # Persisted documents stay on disk and are memory-mapped again on use
+        self.documents.pop(doc_id, None)
+
+    def _on_disk(self, doc_id: str) -> bool:
+        return bool(self.persist_directory) and (self._document_dir(doc_id) / "embeddings.npy").exists()
+
+    def _writing(self, doc_id: str) -> bool:
+        return doc_id in self._batches
+
+    def _start_writing(self, doc_id: str):
+        # Called with self._lock held; appending to a stored document starts from its rows.
+        # Pinned so the memory budget cannot drop batches that exist nowhere else
+        document = self._get(doc_id)
+        self._batches[doc_id] = [] if document is None else [{
+            **document,
+            "metadatas": document["metadatas"] or [{} for _ in document["chunks"]],
+            "exact": document["exact"] if document["exact"] is not None else dequantize_rows(
+                document["matrix"], document["scales"]
+            ),
+        }]
+        self.documents.pop(doc_id, None)
+        self.resident.pins[doc_id] += 1
+
+    def _finish_writing(self, doc_id: str):
+        if self._batches.pop(doc_id, None) is not None:
+            self.resident.pins[doc_id] -= 1
+            if not self.resident.pins[doc_id]:
+                del self.resident.pins[doc_id]
+
+    def _join_batches(self, doc_id: str) -> dict:
+        # Called with self._lock held; the joined document replaces its batches
+        batches = self._batches[doc_id]
+        if len(batches) == 1 and doc_id in self.documents:
+            return self.documents[doc_id]
+        # Rows are quantized independently, so codes just concatenate
+        matrix = np.ascontiguousarray(np.concatenate([b["matrix"] for b in batches]))
+        batch = {
+            "matrix": matrix,
+            "scales": np.concatenate([b["scales"] for b in batches]) if self.precision == "int8" else None,
+            "exact": matrix if self.precision == "float32" else np.concatenate([b["exact"] for b in batches]),
+            "chunks": [chunk for b in batches for chunk in b["chunks"]],
+            "metadatas": [metadata for b in batches for metadata in b["metadatas"]],
+        }
+        self._batches[doc_id] = [batch]
+        # float32 rows of a compressed matrix are only kept for re-scoring when persisted
+        rescore = self.persist_directory and self.precision != "float32"
+        document = self.documents[doc_id] = {**batch, "exact": batch["exact"] if rescore else None}
+        self.resident.touch(doc_id, self._footprint(document))
+        return document
+
+    def add(self, doc_id, chunks, embeddings, metadatas=None):
+        vectors = normalize_rows(embeddings)
+        codes, scales = quantize_rows(vectors, self.precision)
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in chunks]
+        with self._lock:
+            if not self._writing(doc_id):
+                self._start_writing(doc_id)
+            self._batches[doc_id].append(
+                {"matrix": codes, "scales": scales, "exact": vectors, "chunks": list(chunks), "metadatas": metadatas}
+            )
+            # The next query joins the new batch in
+            self.documents.pop(doc_id, None)
+            self.resident.touch(doc_id, sum(self._footprint(batch) for batch in self._batches[doc_id]))
+            self._enforce_budget(keep=doc_id)
+
+    def publish(self, doc_id):
+        """Write a document's added batches to disk in one go and release them."""
+        with self._lock:
+            if not self._writing(doc_id):
+                return
+            document = self._join_batches(doc_id)
+            if self.persist_directory:
+                self._save(doc_id, document, self._batches[doc_id][0]["exact"])
+                if self.precision != "float32":
+                    # Only the rows being re-scored are read back from disk
+                    document["exact"] = np.load(self._document_dir(doc_id) / "embeddings.npy", mmap_mode="r")
+            self._finish_writing(doc_id)
+            self._enforce_budget(keep=doc_id)
+
+    def has(self, doc_id):
+        return doc_id in self.documents or self._writing(doc_id) or self._on_disk(doc_id)
+
+    def delete(self, doc_id):
+        with self._lock:
+            self._finish_writing(doc_id)
+            self.documents.pop(doc_id, None)
+            self.resident.discard(doc_id)
+            if self.persist_directory:
+                shutil.rmtree(self._document_dir(doc_id), ignore_errors=True)
+
+    def _top_k(self, doc_id, query_vectors, top_k):
+        document = self._get(doc_id)
+        if document is None:
+            raise ValueError(f"No document found for ID: {doc_id}")
+        queries = normalize_rows(query_vectors)
+        scores = approximate_scores(queries, document["matrix"], document["scales"])
+        if document["exact"] is None or not self.rescore_factor:
+            return document, top_k_indices(scores, top_k)
+        candidates = top_k_indices(scores, top_k * self.rescore_factor)
+        exact_scores = np.einsum("qd,qkd->qk", queries, np.asarray(document["exact"][candidates]))
+        order = top_k_indices(exact_scores, top_k)
+        return document, np.take_along_axis(candidates, order, axis=1)
+
+    @staticmethod
+    def _vectors(document: dict, rows: np.ndarray) -> np.ndarray:
+        if document["exact"] is not None:
+            return np.asarray(document["exact"][rows])
+        scales = document["scales"][rows] if document["scales"] is not None else None
+        return dequantize_rows(document["matrix"][rows], scales)
+
+    def query(self, doc_id, query_vectors, top_k):
+        with self.pinned(doc_id):
+            document, indices = self._top_k(doc_id, query_vectors, top_k)
+            chunks = document["chunks"]
+            return [[chunks[i] for i in row] for row in indices]
+
+    def query_with_embeddings(self, doc_id, query_vectors, top_k):
+        with self.pinned(doc_id):
+            document, indices = self._top_k(doc_id, query_vectors, top_k)
+            chunks = document["chunks"]
+            # Stored rows are normalized, which is all cosine re-ranking needs
+            return [([chunks[i] for i in row], self._vectors(document, row)) for row in indices]
+
+    def fetch(self, doc_id, rows):
+        with self.pinned(doc_id):
+            document = self._get(doc_id)
+            if document is None:
+                raise ValueError(f"No document found for ID: {doc_id}")
+            rows = np.asarray(rows, dtype=np.int64)
+            return [document["chunks"][i] for i in rows], self._vectors(document, rows)
@@ -0,0 +1,51 @@
+# app/services/question_packing.py
+
+from app.utils.helpers import estimate_tokens
+
+def merge_contexts(retrievals: list) -> list:
+    """
+    De-duplicated union of several questions' retrieved chunks, taking the
+    best-ranked chunk of each question first so the shared context keeps
+    the most relevant text at the top.
+    """
+    merged, seen = [], set()
+    for rank in range(max((len(chunks) for chunks in retrievals), default=0)):
+        for chunks in retrievals:
+            if rank < len(chunks) and chunks[rank] not in seen:
+                seen.add(chunks[rank])
+                merged.append(chunks[rank])
+    return merged
+
+def group_questions(questions: list, retrievals: list, max_group_size: int, max_tokens: int) -> list:
+    """
+    Group question indices whose retrieved chunks overlap, for answering
+    in one prompt.
+
+    Each question joins the open group it shares the most chunks with, as
+    long as the group stays within max_group_size questions and its
+    de-duplicated context plus questions within max_tokens; otherwise it
+    starts a new group. Groups keep the questions' original order.
+    """
+    # Per group: question indices, context chunk set and estimated tokens
+    groups = []
+    for i, (question, chunks) in enumerate(zip(questions, retrievals)):
+        chunk_set = set(chunks)
+        best, best_overlap = None, 0
+        for group in groups:
+            overlap = len(chunk_set & group["chunks"])
+            if overlap <= best_overlap or len(group["indices"]) >= max_group_size:
+                continue
+            extra = sum(estimate_tokens(c) for c in chunk_set - group["chunks"]) + estimate_tokens(question)
+            if group["tokens"] + extra <= max_tokens:
+                best, best_overlap = group, overlap
+        if best is None:
+            groups.append({
+                "indices": [i],
+                "chunks": chunk_set,
+                "tokens": sum(estimate_tokens(c) for c in chunk_set) + estimate_tokens(question),
+            })
+            continue
+        best["tokens"] += sum(estimate_tokens(c) for c in chunk_set - best["chunks"]) + estimate_tokens(question)
+        best["indices"].append(i)
+        best["chunks"] |= chunk_set
+    return [group["indices"] for group in groups]
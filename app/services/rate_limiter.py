@@ -0,0 +1,330 @@
+# app/services/rate_limiter.py
+
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from loguru import logger
+
+from app.config import (
+    AZURE_EMBEDDING_RPM,
+    AZURE_EMBEDDING_TPM,
+    AZURE_CHAT_RPM,
+    AZURE_CHAT_TPM,
+)
+from app.services.metrics import SCHEDULER_QUEUE_DEPTH, SCHEDULER_WAIT_SECONDS, SCHEDULER_REJECTED
+
+# Lower values are served first
+INTERACTIVE, BULK = 0, 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+# Priority and deadline (time.monotonic()) of upstream calls made in the
+# current context; set with scheduling()
+_priority: ContextVar[int] = ContextVar("scheduler_priority", default=INTERACTIVE)
+_deadline: ContextVar[Optional[float]] = ContextVar("scheduler_deadline", default=None)
+
+def current_deadline() -> Optional[float]:
+    """Deadline (time.monotonic()) of the current request, if any."""
+    return _deadline.get()
+
+def time_left() -> Optional[float]:
+    """Seconds until the current request's deadline, or None without one."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+class SchedulerRejected(Exception):
+    """An upstream call could not be admitted before its deadline."""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+@contextmanager
+def scheduling(priority: int = None, deadline: float = None):
+    """
+    Run upstream calls made inside the block (including tasks and threads
+    started from it) at `priority` and/or with an absolute deadline.
+    """
+    tokens = []
+    if priority is not None:
+        tokens.append((_priority, _priority.set(priority)))
+    if deadline is not None:
+        tokens.append((_deadline, _deadline.set(deadline)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+class TokenBucket:
+    """
+    Continuously refilled bucket of `per_minute` units; 0 means unlimited.
+    A cost larger than the capacity is admitted once the bucket is full.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        if self.capacity:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def seconds_until(self, cost: float, backlog: float = 0.0) -> float:
+        """Seconds until cost can be taken after backlog units queued ahead of it."""
+        if not self.capacity:
+            return 0.0
+        needed = min(cost, self.capacity) + backlog - self.level
+        return max(0.0, needed / self.rate)
+
+    def take(self, cost: float):
+        if self.capacity:
+            self.level -= min(cost, self.capacity)
+
+    def give_back(self, amount: float):
+        if self.capacity:
+            self.level = min(self.capacity, self.level + amount)
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "tokens", "enqueued", "grant", "done")
+
+    def __init__(self, priority, seq, tokens, grant):
+        self.priority = priority
+        self.seq = seq
+        self.tokens = tokens
+        self.enqueued = time.monotonic()
+        self.grant = grant
+        # Set once granted or abandoned
+        self.done = False
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+class _Service:
+    def __init__(self, rpm: float, tpm: float):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.queue = []
+        self.paused_until = 0.0
+        self.timer = None
+        self.timer_due = 0.0
+        self.granted = 0
+        self.rejected = 0
+        self.waited = 0.0
+        self.max_wait = 0.0
+
+class RateLimitScheduler:
+    """
+    Process-wide admission of Azure OpenAI calls.
+
+    Each service ("embeddings", "chat") has a requests-per-minute and a
+    tokens-per-minute bucket. A call takes one request and its estimated
+    tokens; when either bucket is short, callers queue by priority
+    (interactive before bulk), first come first served within a priority.
+    A caller whose deadline would pass before its turn is rejected with
+    SchedulerRejected right away instead of queueing. A 429 from upstream
+    pauses the service until its Retry-After. Works for coroutines on any
+    event loop and for blocking callers.
+    """
+
+    def __init__(self, limits: dict):
+        # limits: service -> (requests per minute, tokens per minute)
+        self.services = {name: _Service(rpm, tpm) for name, (rpm, tpm) in limits.items()}
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+
+    # Admission
+
+    def _ready_in(self, service: _Service, tokens: float, now: float, ahead: list) -> float:
+        """Seconds until a call of `tokens` can go once the `ahead` waiters have been served."""
+        return max(
+            service.paused_until - now,
+            service.requests.seconds_until(1, len(ahead)),
+            service.tokens.seconds_until(tokens, sum(min(w.tokens, service.tokens.capacity or w.tokens) for w in ahead)),
+            0.0,
+        )
+
+    def _admit_or_enqueue(self, name: str, tokens: float, priority: int, deadline: Optional[float], grant):
+        """Take capacity now (returns None) or enqueue a waiter (returns it); raises when hopeless."""
+        service = self.services[name]
+        with self._lock:
+            now = time.monotonic()
+            service.requests.refill(now)
+            service.tokens.refill(now)
+            ahead = [w for w in service.queue if not w.done and w.priority <= priority]
+            wait = self._ready_in(service, tokens, now, ahead)
+            if wait == 0 and not any(not w.done for w in service.queue):
+                self._take(service, name, tokens, priority, 0.0)
+                return None
+            if deadline is not None and now + wait > deadline:
+                service.rejected += 1
+                SCHEDULER_REJECTED.labels(name, PRIORITY_NAMES[priority]).inc()
+                raise SchedulerRejected(
+                    f"{name} quota is exhausted for about {wait:.1f}s, past the call's deadline", retry_after=wait
+                )
+            waiter = _Waiter(priority, next(self._seq), tokens, grant)
+            heapq.heappush(service.queue, waiter)
+            SCHEDULER_QUEUE_DEPTH.labels(name).inc()
+            self._dispatch(name)
+            return waiter
+
+    def _take(self, service: _Service, name: str, tokens: float, priority: int, waited: float):
+        service.requests.take(1)
+        service.tokens.take(tokens)
+        service.granted += 1
+        service.waited += waited
+        service.max_wait = max(service.max_wait, waited)
+        SCHEDULER_WAIT_SECONDS.labels(name, PRIORITY_NAMES[priority]).observe(waited)
+
+    def _dispatch(self, name: str):
+        # Called with self._lock held: grant queued callers in order while capacity lasts
+        service = self.services[name]
+        now = time.monotonic()
+        service.requests.refill(now)
+        service.tokens.refill(now)
+        while service.queue:
+            waiter = service.queue[0]
+            if waiter.done:
+                heapq.heappop(service.queue)
+                continue
+            wait = self._ready_in(service, waiter.tokens, now, ahead=[])
+            if wait > 0:
+                self._schedule_dispatch(name, wait)
+                return
+            heapq.heappop(service.queue)
+            waiter.done = True
+            SCHEDULER_QUEUE_DEPTH.labels(name).dec()
+            self._take(service, name, waiter.tokens, waiter.priority, now - waiter.enqueued)
+            waiter.grant()
+
+    def _schedule_dispatch(self, name: str, delay: float):
+        service = self.services[name]
+        due = time.monotonic() + delay
+        if service.timer is not None:
+            if service.timer_due <= due:
+                return
+            service.timer.cancel()
+        service.timer_due = due
+        service.timer = threading.Timer(delay, self._dispatch_locked, args=(name,))
+        service.timer.daemon = True
+        service.timer.start()
+
+    def _dispatch_locked(self, name: str):
+        with self._lock:
+            self.services[name].timer = None
+            self._dispatch(name)
+
+    def _abandon(self, name: str, waiter: _Waiter, rejected: bool):
+        with self._lock:
+            if waiter.done:
+                return False
+            waiter.done = True
+            SCHEDULER_QUEUE_DEPTH.labels(name).dec()
+            if rejected:
+                self.services[name].rejected += 1
+                SCHEDULER_REJECTED.labels(name, PRIORITY_NAMES[waiter.priority]).inc()
+            # The abandoned caller may have been holding up the rest of the queue
+            self._dispatch(name)
+            return True
+
+    async def acquire(self, name: str, tokens: float, priority: int = None, deadline: float = None):
+        """
+        Wait for a slot to call `name` with an estimated `tokens`. priority
+        and deadline default to those set with scheduling().
+        """
+        if name not in self.services:
+            return
+        priority = _priority.get() if priority is None else priority
+        deadline = _deadline.get() if deadline is None else deadline
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def grant():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        waiter = self._admit_or_enqueue(name, tokens, priority, deadline, grant)
+        if waiter is None:
+            return
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            if self._abandon(name, waiter, rejected=True):
+                raise SchedulerRejected(f"Deadline passed while queued for {name}", retry_after=1.0)
+        except asyncio.CancelledError:
+            self._abandon(name, waiter, rejected=False)
+            raise
+
+    def acquire_sync(self, name: str, tokens: float, priority: int = None, deadline: float = None):
+        """Blocking counterpart of acquire for synchronous callers."""
+        if name not in self.services:
+            return
+        priority = _priority.get() if priority is None else priority
+        deadline = _deadline.get() if deadline is None else deadline
+        event = threading.Event()
+        waiter = self._admit_or_enqueue(name, tokens, priority, deadline, event.set)
+        if waiter is None:
+            return
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        if not event.wait(timeout) and self._abandon(name, waiter, rejected=True):
+            raise SchedulerRejected(f"Deadline passed while queued for {name}", retry_after=1.0)
+
+    # Feedback from upstream
+
+    def settle(self, name: str, estimated: float, usage: dict):
+        """Correct the token bucket by the difference between estimated and reported tokens."""
+        if name not in self.services or not usage or not usage.get("total_tokens"):
+            return
+        with self._lock:
+            self.services[name].tokens.give_back(estimated - usage["total_tokens"])
+
+    def throttled(self, name: str, retry_after: Optional[float]):
+        """Hold the service's queue after a 429 until upstream's Retry-After."""
+        if name not in self.services:
+            return
+        with self._lock:
+            service = self.services[name]
+            service.paused_until = max(service.paused_until, time.monotonic() + (retry_after or 1.0))
+            # Our view of the quota was too optimistic
+            service.requests.level = min(service.requests.level, 0.0)
+            logger.debug("Pausing {service} calls for {seconds:.2f}s after a 429", service=name, seconds=retry_after or 1.0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            result = {}
+            for name, service in self.services.items():
+                service.requests.refill(now)
+                service.tokens.refill(now)
+                queued = [w for w in service.queue if not w.done]
+                result[name] = {
+                    "rpm_limit": service.requests.capacity,
+                    "tpm_limit": service.tokens.capacity,
+                    # None when the limit is disabled
+                    "requests_available": round(service.requests.level, 1) if service.requests.capacity else None,
+                    "tokens_available": round(service.tokens.level) if service.tokens.capacity else None,
+                    "queue_depth": len(queued),
+                    "queued_by_priority": {
+                        PRIORITY_NAMES[p]: sum(1 for w in queued if w.priority == p) for p in PRIORITY_NAMES
+                    },
+                    "oldest_wait_seconds": round(max((now - w.enqueued for w in queued), default=0.0), 3),
+                    "granted": service.granted,
+                    "rejected": service.rejected,
+                    "avg_wait_seconds": round(service.waited / service.granted, 4) if service.granted else 0.0,
+                    "max_wait_seconds": round(service.max_wait, 3),
+                    "paused_seconds": round(max(0.0, service.paused_until - now), 3),
+                }
+            return result
+
+scheduler = RateLimitScheduler({
+    "embeddings": (AZURE_EMBEDDING_RPM, AZURE_EMBEDDING_TPM),
+    "chat": (AZURE_CHAT_RPM, AZURE_CHAT_TPM),
+})
@@ -0,0 +1,109 @@
+# app/services/shared_store.py
+
+import os
+import fcntl
+from pathlib import Path
+
+from app.services.numpy_store import NumpyVectorStore
+
+class FileLock:
+    """
+    Advisory flock(2) lock on a file, shared between the processes of one
+    host. A lock is held per open file, so threads and processes that use
+    separate FileLock objects exclude each other.
+    """
+
+    def __init__(self, path: Path, shared: bool = False):
+        self.path = Path(path)
+        self.shared = shared
+        self._fd = None
+
+    def acquire(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX)
+        except BaseException:
+            os.close(self._fd)
+            self._fd = None
+            raise
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+class SharedNumpyVectorStore(NumpyVectorStore):
+    """
+    NumpyVectorStore on a directory shared by all worker processes of a
+    host, so a document is embedded and written once and every worker
+    memory-maps the same .npy file (one copy in the page cache).
+
+    Writes and reads of a document's files are serialized with a per-document
+    file lock. A document only becomes visible to other workers once its
+    writer publishes it (a "complete" marker), so a half-written or
+    abandoned ingestion is never served. write_lock() gives a separate
+    per-document lock for a whole ingestion, letting one worker embed a
+    document while the others wait and then reuse it.
+    """
+
+    COMPLETE_MARKER = "complete"
+
+    def __init__(self, persist_directory: str, max_bytes: int = 0, max_documents: int = 0,
+                 precision: str = "float32", rescore_factor: int = 4):
+        super().__init__(persist_directory, max_bytes, max_documents, precision, rescore_factor)
+        self.lock_directory = self.persist_directory / ".locks"
+        self.lock_directory.mkdir(parents=True, exist_ok=True)
+
+    def _file_lock(self, doc_id: str, shared: bool = False) -> FileLock:
+        return FileLock(self.lock_directory / f"{doc_id}.lock", shared)
+
+    def write_lock(self, doc_id):
+        return FileLock(self.lock_directory / f"{doc_id}.ingest.lock")
+
+    def _on_disk(self, doc_id):
+        return (self._document_dir(doc_id) / self.COMPLETE_MARKER).exists()
+
+    def _load(self, doc_id):
+        with self._file_lock(doc_id, shared=True):
+            return super()._load(doc_id)
+
+    def _get(self, doc_id):
+        with self._lock:
+            if doc_id in self.documents and not self._writing(doc_id) and not self._on_disk(doc_id):
+                # Deleted by another worker
+                self._unload(doc_id)
+                self.resident.discard(doc_id)
+            return super()._get(doc_id)
+
+    def _start_writing(self, doc_id):
+        # Start over rather than append to a published copy another worker may have replaced
+        self.documents.pop(doc_id, None)
+        self._batches[doc_id] = []
+        self.resident.pins[doc_id] += 1
+
+    def publish(self, doc_id):
+        with self._lock, self._file_lock(doc_id):
+            if not self._writing(doc_id):
+                return
+            (self._document_dir(doc_id) / self.COMPLETE_MARKER).unlink(missing_ok=True)
+            super().publish(doc_id)
+            (self._document_dir(doc_id) / self.COMPLETE_MARKER).touch()
+            # Drop the private copy; the next query maps the shared file
+            self.documents.pop(doc_id, None)
+            self.resident.discard(doc_id)
+
+    def has(self, doc_id):
+        return self._on_disk(doc_id)
+
+    def delete(self, doc_id):
+        with self._lock, self._file_lock(doc_id):
+            super().delete(doc_id)
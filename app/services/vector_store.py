@@ -1,62 +1,544 @@
 # app/services/vector_store.py
 
-import chromadb
-from chromadb.config import Settings
 import os
+import json
+import time
+import shutil
+import asyncio
+import threading
+from pathlib import Path
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager, contextmanager, nullcontext
 
-# Global client and collection management
-# Use persistent storage for production
-persist_directory = os.getenv("CHROMA_PERSIST_DIR", ".chromadb")
-client = chromadb.Client(Settings(
-    persist_directory=persist_directory,
-    anonymized_telemetry=False  # Disable telemetry for production
-))
+import numpy as np
+from loguru import logger
+from app.config import (
+    VECTOR_STORE_BACKEND,
+    CHROMA_PERSIST_DIR,
+    NUMPY_STORE_DIR,
+    SHARED_STORE_DIR,
+    VECTOR_STORE_MAX_BYTES,
+    VECTOR_STORE_MAX_DOCUMENTS,
+    VECTOR_STORE_SPILL,
+    VECTOR_STORE_PRECISION,
+    VECTOR_STORE_RESCORE_FACTOR,
+    HYBRID_RRF_K,
+    LEXICAL_FAST_PATH,
+    LEXICAL_FAST_PATH_COVERAGE,
+    LEXICAL_FAST_PATH_MIN_IDF,
+)
+from app.services import metrics
+from app.services.lexical_index import lexical_index, reciprocal_rank_fusion
+from app.services.rate_limiter import SchedulerRejected
 
-# Dictionary to hold collections by doc_id
-collections = {}
+class ResidentDocuments:
+    """
+    LRU bookkeeping of the documents a backend holds in memory: approximate
+    size, last use and pins of documents in use by a query. Memory reserved
+    by other holders of vectors (e.g. the corpus index) counts against
+    max_bytes too. Not thread-safe; the owning store serializes access with
+    its lock.
+    """
+
+    def __init__(self, max_bytes: int = 0, max_documents: int = 0):
+        # 0 disables the corresponding limit
+        self.max_bytes = max_bytes
+        self.max_documents = max_documents
+        # doc_id -> {"bytes": int, "last_used": float}, least recently used first
+        self.entries = OrderedDict()
+        self.pins = Counter()
+        # name -> bytes held outside the documents
+        self.reserved = {}
+        self.hits = 0
+        self.reloads = 0
+        self.evictions = 0
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(entry["bytes"] for entry in self.entries.values())
+
+    def touch(self, doc_id: str, nbytes: int = None):
+        entry = self.entries.setdefault(doc_id, {"bytes": 0, "last_used": 0.0})
+        if nbytes is not None:
+            entry["bytes"] = nbytes
+        entry["last_used"] = time.time()
+        self.entries.move_to_end(doc_id)
+
+    def discard(self, doc_id: str):
+        self.entries.pop(doc_id, None)
 
-def store_embeddings(doc_id: str, chunks: list[str], embeddings: list[list[float]]):
+    def victims(self, keep: str = None) -> list:
+        """Least recently used unpinned documents to unload to get back within budget."""
+        count, total = len(self.entries), self.total_bytes + sum(self.reserved.values())
+        victims = []
+        for doc_id, entry in self.entries.items():
+            over_count = self.max_documents and count > self.max_documents
+            over_bytes = self.max_bytes and total > self.max_bytes
+            if not (over_count or over_bytes):
+                break
+            if doc_id == keep or self.pins[doc_id]:
+                continue
+            victims.append(doc_id)
+            count -= 1
+            total -= entry["bytes"]
+        return victims
+
+    def snapshot(self) -> list:
+        return [
+            {"doc_id": doc_id, "bytes": entry["bytes"], "last_used": entry["last_used"], "pinned": self.pins[doc_id] > 0}
+            for doc_id, entry in reversed(self.entries.items())
+        ]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.reloads
+        return {
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "reserved_bytes": dict(self.reserved),
+            "max_bytes": self.max_bytes,
+            "max_documents": self.max_documents,
+            "hits": self.hits,
+            "misses": self.reloads,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+class VectorStore:
     """
-    Store document chunks and their embeddings into ChromaDB collection.
+    Interface of a per-document vector store backend.
+
+    Backends keep documents in memory under a byte / count budget: the
+    least recently used unpinned documents are unloaded (and, where the
+    backend supports it, reloaded lazily from disk) once it is exceeded.
+    Queries pin the document they read so it cannot be unloaded under them.
     """
-    try:
-        if doc_id not in collections:
-            # Create a collection for the document
-            collections[doc_id] = client.create_collection(name=doc_id)
-
-        collection = collections[doc_id]
-        
-        # Add chunks with embeddings
-        collection.add(
-            documents=chunks,
-            embeddings=embeddings,
-            ids=[f"{doc_id}_{i}" for i in range(len(chunks))]
+
+    def __init__(self, max_bytes: int = 0, max_documents: int = 0):
+        self.resident = ResidentDocuments(max_bytes, max_documents)
+        self._lock = threading.RLock()
+
+    @contextmanager
+    def pinned(self, doc_id: str):
+        """Keep doc_id loaded for the duration of the block."""
+        with self._lock:
+            self.resident.pins[doc_id] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.resident.pins[doc_id] -= 1
+                if not self.resident.pins[doc_id]:
+                    del self.resident.pins[doc_id]
+                self._enforce_budget()
+
+    def _enforce_budget(self, keep: str = None):
+        # Called with self._lock held
+        for doc_id in self.resident.victims(keep):
+            self._unload(doc_id)
+            self.resident.discard(doc_id)
+            self.resident.evictions += 1
+            logger.debug("Unloaded document {doc_id} from memory", doc_id=doc_id)
+
+    def _unload(self, doc_id: str):
+        """Drop a document from memory, keeping it on disk where supported."""
+        raise NotImplementedError
+
+    def reserve(self, name: str, nbytes: int):
+        """Count nbytes held elsewhere under name against the memory budget, unloading documents to fit."""
+        with self._lock:
+            self.resident.reserved[name] = nbytes
+            self._enforce_budget()
+
+    def resident_documents(self) -> list[dict]:
+        """Documents held in memory, most recently used first."""
+        with self._lock:
+            return self.resident.snapshot()
+
+    def residency_stats(self) -> dict:
+        with self._lock:
+            return self.resident.stats()
+
+    def add(self, doc_id: str, chunks: list[str], embeddings: list[list[float]], metadatas: list[dict] = None):
+        """Append chunks, their embeddings and optional per-chunk metadata to a document."""
+        raise NotImplementedError
+
+    def has(self, doc_id: str) -> bool:
+        raise NotImplementedError
+
+    def delete(self, doc_id: str):
+        raise NotImplementedError
+
+    def publish(self, doc_id: str):
+        """Mark a fully added document as ready for other processes (no-op unless shared)."""
+
+    def write_lock(self, doc_id: str):
+        """Lock held across a whole ingestion of doc_id; only shared stores need one."""
+        return nullcontext()
+
+    def warm(self):
+        """Create clients and open files the first query would otherwise wait for."""
+
+    def query(self, doc_id: str, query_vectors: list[list[float]], top_k: int) -> list[list[str]]:
+        """Top-k chunk texts for each query vector, best first."""
+        raise NotImplementedError
+
+    def query_with_embeddings(self, doc_id: str, query_vectors: list[list[float]], top_k: int) -> list[tuple]:
+        """Like query, but each result is (chunk texts, their embeddings)."""
+        raise NotImplementedError
+
+    def fetch(self, doc_id: str, rows: list[int]) -> tuple:
+        """(chunk texts, embeddings) of the chunks at the given positions, in that order."""
+        raise NotImplementedError
+
+class ChromaVectorStore(VectorStore):
+    """
+    One ChromaDB collection per document. With spill enabled, collections
+    unloaded to stay within the memory budget are written to
+    <persist_directory>/spilled and recreated on their next use.
+    """
+
+    def __init__(self, persist_directory: str = ".chromadb", max_bytes: int = 0, max_documents: int = 0,
+                 spill: bool = False):
+        super().__init__(max_bytes, max_documents)
+        self.persist_directory = persist_directory
+        self._client = None
+        # Dictionary to hold collections by doc_id
+        self.collections = {}
+        self.spill_directory = Path(persist_directory) / "spilled" if spill else None
+
+    @property
+    def client(self):
+        """The Chroma client, created on first use: importing chromadb takes a large share of startup."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import chromadb
+                    from chromadb.config import Settings
+
+                    # Use persistent storage for production
+                    self._client = chromadb.Client(Settings(
+                        persist_directory=self.persist_directory,
+                        anonymized_telemetry=False  # Disable telemetry for production
+                    ))
+        return self._client
+
+    def warm(self):
+        self.client.heartbeat()
+
+    def _spill_dir(self, doc_id: str) -> Path:
+        return self.spill_directory / doc_id
+
+    def _spilled(self, doc_id: str) -> bool:
+        return bool(self.spill_directory) and (self._spill_dir(doc_id) / "embeddings.npy").exists()
+
+    @staticmethod
+    def _footprint(chunks, embeddings) -> int:
+        # Vectors are held twice (HNSW index and segment store) plus the chunk texts
+        dimensions = len(embeddings[0]) if len(embeddings) else 0
+        return len(embeddings) * dimensions * 4 * 2 + sum(len(chunk.encode("utf-8")) for chunk in chunks)
+
+    def _collection(self, doc_id: str):
+        """The document's collection, reloading it from the spill directory if needed."""
+        with self._lock:
+            collection = self.collections.get(doc_id)
+            if collection is not None:
+                self.resident.hits += 1
+                self.resident.touch(doc_id)
+                return collection
+            if not self._spilled(doc_id):
+                raise ValueError(f"No document found for ID: {doc_id}")
+            doc_dir = self._spill_dir(doc_id)
+            with open(doc_dir / "chunks.json", "r", encoding="utf-8") as f:
+                chunks = json.load(f)
+            with open(doc_dir / "metadatas.json", "r", encoding="utf-8") as f:
+                metadatas = json.load(f)
+            embeddings = np.load(doc_dir / "embeddings.npy").tolist()
+            # Chroma rejects empty metadata entries
+            metadatas = metadatas if metadatas and all(metadatas) else None
+            self.resident.reloads += 1
+            self.collections[doc_id] = self.client.get_or_create_collection(name=doc_id)
+            self.add(doc_id, chunks, embeddings, metadatas)
+            shutil.rmtree(doc_dir, ignore_errors=True)
+            logger.debug("Reloaded spilled document {doc_id}", doc_id=doc_id)
+            return self.collections[doc_id]
+
+    def add(self, doc_id, chunks, embeddings, metadatas=None):
+        with self._lock:
+            if doc_id not in self.collections:
+                if self._spilled(doc_id):
+                    self._collection(doc_id)
+                else:
+                    # Create a collection for the document
+                    self.collections[doc_id] = self.client.get_or_create_collection(name=doc_id)
+
+            collection = self.collections[doc_id]
+            start = collection.count()
+
+            # Add chunks with embeddings
+            collection.add(
+                documents=chunks,
+                embeddings=embeddings,
+                metadatas=metadatas,
+                ids=[f"{doc_id}_{i}" for i in range(start, start + len(chunks))]
+            )
+            previous = self.resident.entries.get(doc_id, {}).get("bytes", 0)
+            self.resident.touch(doc_id, previous + self._footprint(chunks, embeddings))
+            self._enforce_budget(keep=doc_id)
+
+    def _unload(self, doc_id):
+        collection = self.collections.pop(doc_id)
+        if self.spill_directory:
+            rows = collection.get(include=["documents", "embeddings", "metadatas"])
+            doc_dir = self._spill_dir(doc_id)
+            doc_dir.mkdir(parents=True, exist_ok=True)
+            for name, value in (("chunks", rows["documents"]), ("metadatas", rows["metadatas"])):
+                with open(doc_dir / f"{name}.json", "w", encoding="utf-8") as f:
+                    json.dump(value, f)
+            # Written last: its presence marks a complete spill
+            np.save(doc_dir / "embeddings.tmp.npy", np.asarray(rows["embeddings"], dtype=np.float32))
+            os.replace(doc_dir / "embeddings.tmp.npy", doc_dir / "embeddings.npy")
+        self.client.delete_collection(name=doc_id)
+
+    def has(self, doc_id):
+        return doc_id in self.collections or self._spilled(doc_id)
+
+    def delete(self, doc_id):
+        with self._lock:
+            self.resident.discard(doc_id)
+            if self.collections.pop(doc_id, None) is not None:
+                self.client.delete_collection(name=doc_id)
+            if self.spill_directory:
+                shutil.rmtree(self._spill_dir(doc_id), ignore_errors=True)
+
+    def query(self, doc_id, query_vectors, top_k):
+        with self.pinned(doc_id):
+            results = self._collection(doc_id).query(
+                query_embeddings=query_vectors,
+                n_results=top_k
+            )
+        return results["documents"]
+
+    def query_with_embeddings(self, doc_id, query_vectors, top_k):
+        with self.pinned(doc_id):
+            results = self._collection(doc_id).query(
+                query_embeddings=query_vectors,
+                n_results=top_k,
+                include=["documents", "embeddings"]
+            )
+        return list(zip(results["documents"], results["embeddings"]))
+
+    def fetch(self, doc_id, rows):
+        ids = [f"{doc_id}_{i}" for i in rows]
+        with self.pinned(doc_id):
+            results = self._collection(doc_id).get(ids=ids, include=["documents", "embeddings"])
+        # get() does not return rows in the order of the ids asked for
+        found = {id_: (chunk, embedding) for id_, chunk, embedding in
+                 zip(results["ids"], results["documents"], results["embeddings"])}
+        return [found[id_][0] for id_ in ids], [found[id_][1] for id_ in ids]
+
+def create_vector_store(backend: str) -> VectorStore:
+    """
+    Build the backend selected by VECTOR_STORE_BACKEND ("chroma", "numpy"
+    or "shared", the numpy format shared by the worker processes of a host).
+    """
+    if backend == "chroma":
+        return ChromaVectorStore(
+            CHROMA_PERSIST_DIR, VECTOR_STORE_MAX_BYTES, VECTOR_STORE_MAX_DOCUMENTS, VECTOR_STORE_SPILL
+        )
+    if backend == "numpy":
+        from app.services.numpy_store import NumpyVectorStore
+        return NumpyVectorStore(
+            NUMPY_STORE_DIR or None, VECTOR_STORE_MAX_BYTES, VECTOR_STORE_MAX_DOCUMENTS,
+            VECTOR_STORE_PRECISION, VECTOR_STORE_RESCORE_FACTOR,
+        )
+    if backend == "shared":
+        from app.services.shared_store import SharedNumpyVectorStore
+        return SharedNumpyVectorStore(
+            SHARED_STORE_DIR, VECTOR_STORE_MAX_BYTES, VECTOR_STORE_MAX_DOCUMENTS,
+            VECTOR_STORE_PRECISION, VECTOR_STORE_RESCORE_FACTOR,
         )
-        print(f"✅ Stored {len(chunks)} chunks for document {doc_id}")
+    raise ValueError(f"Unknown vector store backend: {backend}")
+
+# Global store shared by all requests
+vector_store = create_vector_store(VECTOR_STORE_BACKEND)
+
+def _corpus_index():
+    # Imported on use: the corpus index builds on numpy_store, which imports this module
+    from app.services.corpus_index import corpus_index
+    return corpus_index
+
+def store_embeddings(doc_id: str, chunks: list[str], embeddings: list[list[float]], metadatas: list[dict] = None):
+    """
+    Store document chunks, their embeddings and optional per-chunk metadata
+    (source page, character offsets) in the vector store.
+    """
+    try:
+        vector_store.add(doc_id, chunks, embeddings, metadatas)
+        if _corpus_index() is not None:
+            _corpus_index().add(doc_id, chunks, embeddings, metadatas)
+        if lexical_index is not None:
+            lexical_index.add(doc_id, chunks)
+        logger.debug("Stored {count} chunks for document {doc_id}", count=len(chunks), doc_id=doc_id)
     except Exception as e:
-        print(f"❌ Error storing embeddings: {e}")
+        logger.error("Error storing embeddings: {error}", error=str(e))
         raise RuntimeError(f"Failed to store embeddings: {str(e)}")
 
-def search_similar_chunks(query: str, doc_id: str, top_k: int = 5) -> list[str]:
+def publish_document(doc_id: str):
     """
-    Search for the most similar chunks in ChromaDB.
+    Make a document whose chunks have all been stored visible to the other
+    worker processes (shared backend only), to corpus-wide search and to
+    hybrid retrieval (its BM25 index is built here).
     """
-    from app.services.embedder import embed_chunks
+    vector_store.publish(doc_id)
+    if lexical_index is not None:
+        try:
+            lexical_index.publish(doc_id)
+        except Exception as e:
+            # Retrieval of the document falls back to vector-only search
+            logger.error("Error building BM25 index of {doc_id}: {error}", doc_id=doc_id, error=str(e))
+    if _corpus_index() is not None:
+        try:
+            _corpus_index().publish(doc_id)
+        except Exception as e:
+            # The document stays queryable by ID; only corpus search misses it
+            logger.error("Error indexing document {doc_id} for corpus search: {error}", doc_id=doc_id, error=str(e))
 
+@asynccontextmanager
+async def document_write_lock(doc_id: str):
+    """
+    Hold the store's ingestion lock of doc_id, so with a shared backend only
+    one worker process embeds a document; the others wait and reuse it.
+    """
+    lock = vector_store.write_lock(doc_id)
+    await asyncio.to_thread(lock.__enter__)
     try:
-        if doc_id not in collections:
-            raise ValueError(f"No document found for ID: {doc_id}")
+        yield
+    finally:
+        lock.__exit__(None, None, None)
 
-        collection = collections[doc_id]
-        query_vector = embed_chunks([query])[0]
+def has_document(doc_id: str) -> bool:
+    """
+    Check whether a document's chunks are currently stored.
+    """
+    return vector_store.has(doc_id)
 
-        results = collection.query(
-            query_embeddings=[query_vector],
-            n_results=top_k
-        )
+def pinned_document(doc_id: str):
+    """
+    Context manager keeping a document in memory while a request uses it,
+    so the memory budget cannot unload it between retrieval calls.
+    """
+    return vector_store.pinned(doc_id)
+
+def resident_documents() -> dict:
+    """Documents held in memory with their approximate sizes, and the budget."""
+    return {
+        "backend": VECTOR_STORE_BACKEND,
+        **vector_store.residency_stats(),
+        "documents": vector_store.resident_documents(),
+    }
+
+def delete_document(doc_id: str):
+    """
+    Drop a document's vectors, e.g. when it is evicted from the document cache.
+    """
+    try:
+        vector_store.delete(doc_id)
+        if _corpus_index() is not None:
+            _corpus_index().delete(doc_id)
+        if lexical_index is not None:
+            lexical_index.delete(doc_id)
+    except Exception as e:
+        logger.error("Error deleting document {doc_id}: {error}", doc_id=doc_id, error=str(e))
+
+async def search_candidates_batch_async(queries: list[str], doc_id: str, top_k: int = 10) -> tuple:
+    """
+    Retrieve the top_k candidate chunks of every query together with their
+    embeddings, for re-ranking. Returns (query_vectors, candidates) where
+    each candidate is (chunk texts, embeddings); empty on failure.
+    """
+    from app.services.embedder_new import embed_chunks_async
+
+    try:
+        with pinned_document(doc_id):
+            if not has_document(doc_id):
+                raise ValueError(f"No document found for ID: {doc_id}")
+
+            query_vectors = await embed_chunks_async(queries)
+            candidates = await asyncio.to_thread(vector_store.query_with_embeddings, doc_id, query_vectors, top_k)
+        return query_vectors, candidates
+    except SchedulerRejected:
+        # Out of Azure quota before the deadline: let the request fail fast
+        raise
+    except Exception as e:
+        logger.error("Error searching chunks: {error}", error=str(e))
+        # Return empty candidates if search fails
+        return [[] for _ in queries], [([], []) for _ in queries]
+
+def lexical_fast_path(hits: dict) -> bool:
+    """Whether BM25 hits match their question strongly enough to skip the embedding call."""
+    return (
+        LEXICAL_FAST_PATH
+        and hits["coverage"] >= LEXICAL_FAST_PATH_COVERAGE
+        and hits["idf"] >= LEXICAL_FAST_PATH_MIN_IDF
+    )
+
+async def hybrid_candidates_batch_async(queries: list[str], doc_id: str, top_k: int = 10) -> tuple:
+    """
+    search_candidates_batch_async fused with the document's BM25 index by
+    reciprocal rank fusion, weighting the BM25 ranking by its coverage of
+    the question's terms. Questions whose best lexical hit is strong
+    (lexical_fast_path) keep the BM25 ranking and are never embedded; their
+    query vector is returned as None, so context selection falls back to
+    their rank. Documents without a BM25 index get vector-only search.
+    """
+    from app.services.embedder_new import embed_chunks_async
+
+    index = lexical_index.get(doc_id) if lexical_index is not None else None
+    if index is None:
+        metrics.RETRIEVAL_PATHS.labels("vector").inc(len(queries))
+        return await search_candidates_batch_async(queries, doc_id, top_k)
+
+    try:
+        with pinned_document(doc_id):
+            if not has_document(doc_id):
+                raise ValueError(f"No document found for ID: {doc_id}")
+
+            lexical = [index.search(query, top_k) for query in queries]
+            embedded = [i for i, hits in enumerate(lexical) if not lexical_fast_path(hits)]
+            query_vectors, vector_results = [None] * len(queries), {}
+            if embedded:
+                vectors = await embed_chunks_async([queries[i] for i in embedded])
+                found = await asyncio.to_thread(vector_store.query_with_embeddings, doc_id, vectors, top_k)
+                vector_results = dict(zip(embedded, found))
+                for i, vector in zip(embedded, vectors):
+                    query_vectors[i] = vector
+            rows = sorted({int(row) for hits in lexical for row in hits["rows"]})
+            texts, embeddings = await asyncio.to_thread(vector_store.fetch, doc_id, rows) if rows else ([], [])
+        fetched = dict(zip(rows, zip(texts, embeddings)))
+        metrics.RETRIEVAL_PATHS.labels("lexical").inc(len(queries) - len(embedded))
+        metrics.RETRIEVAL_PATHS.labels("hybrid").inc(len(embedded))
 
-        return results["documents"][0]
+        candidates = []
+        for i, hits in enumerate(lexical):
+            lexical_hits = [fetched[int(row)] for row in hits["rows"]]
+            if i not in vector_results:
+                candidates.append(([text for text, _ in lexical_hits], [vector for _, vector in lexical_hits]))
+                continue
+            # Chunks are keyed by text: identical chunks are one candidate. The
+            # BM25 ranking counts as much as the question's terms were found,
+            # so questions worded unlike the document lean on vector search
+            chunks, vectors = vector_results[i]
+            pool = dict(lexical_hits)
+            pool.update(zip(chunks, vectors))
+            fused = reciprocal_rank_fusion(
+                [list(chunks), [text for text, _ in lexical_hits]], HYBRID_RRF_K, [1.0, hits["coverage"]]
+            )[:top_k]
+            candidates.append((fused, [pool[text] for text in fused]))
+        return query_vectors, candidates
+    except SchedulerRejected:
+        # Out of Azure quota before the deadline: let the request fail fast
+        raise
     except Exception as e:
-        print(f"❌ Error searching chunks: {e}")
-        # Return empty list if search fails
-        return []
+        logger.error("Error searching chunks: {error}", error=str(e))
+        # Return empty candidates if search fails
+        return [None] * len(queries), [([], []) for _ in queries]
@@ -0,0 +1,97 @@
+# app/services/warmup.py
+
+import time
+import asyncio
+import inspect
+from typing import Callable, Optional
+
+from loguru import logger
+
+PENDING, OK, FAILED = "pending", "ok", "failed"
+
+class Warmup:
+    """
+    Startup steps run in the background once the server accepts requests,
+    so liveness checks answer at once while readiness waits for them.
+
+    Steps run concurrently, so waiting on the network overlaps imports.
+    The process is ready when every required step has succeeded; a failed
+    optional step (e.g. an unreachable upstream) is reported but does not
+    hold readiness back. Failed required steps are retried with exponential
+    backoff (retry_seconds doubling up to max_retry_seconds) until they
+    succeed, so a dependency down at boot does not leave the process
+    unready until it restarts.
+    """
+
+    def __init__(self, retry_seconds: float = 1.0, max_retry_seconds: float = 60.0):
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max_retry_seconds
+        self._steps = []
+        self._results = {}
+        self._task: Optional[asyncio.Task] = None
+        self._started = None
+        self._finished = None
+
+    def add(self, name: str, step: Callable, required: bool = True):
+        """Register step(), a function or coroutine function taking no arguments."""
+        self._steps.append((name, step, required))
+        self._results[name] = {"status": PENDING, "required": required}
+
+    def start(self):
+        """Run the steps in a task of the running event loop."""
+        self._started = time.time()
+        self._finished = None
+        for result in self._results.values():
+            result.update(status=PENDING, seconds=None, error=None, attempts=0)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self):
+        await asyncio.gather(*(self._run_step(name, step, required) for name, step, required in self._steps))
+        self._finished = time.time()
+        logger.info(
+            "Warmup finished in {seconds}s, ready: {ready}",
+            seconds=round(self._finished - self._started, 3), ready=self.ready,
+        )
+        delay = self.retry_seconds
+        while failed := [
+            (name, step) for name, step, required in self._steps
+            if required and self._results[name]["status"] != OK
+        ]:
+            await asyncio.sleep(delay)
+            delay = min(2 * delay, self.max_retry_seconds)
+            await asyncio.gather(*(self._run_step(name, step, True) for name, step in failed))
+            if self.ready:
+                logger.info("Warmup recovered after retrying {steps}", steps=[name for name, _ in failed])
+
+    async def _run_step(self, name: str, step: Callable, required: bool):
+        start = time.perf_counter()
+        self._results[name]["attempts"] += 1
+        try:
+            result = step()
+            if inspect.isawaitable(result):
+                await result
+            self._results[name].update(status=OK, error=None)
+        except Exception as e:
+            self._results[name].update(status=FAILED, error=str(e))
+            log = logger.error if required else logger.warning
+            log("Warmup step {step} failed: {error}", step=name, error=str(e))
+        self._results[name]["seconds"] = round(time.perf_counter() - start, 3)
+
+    @property
+    def ready(self) -> bool:
+        return self._finished is not None and all(
+            result["status"] == OK for result in self._results.values() if result["required"]
+        )
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "started": self._started,
+            "finished": self._finished,
+            "steps": {name: dict(result) for name, result in self._results.items()},
+        }
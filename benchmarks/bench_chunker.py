@@ -0,0 +1,55 @@
+# benchmarks/bench_chunker.py
+"""
+Throughput of the chunkers on a large synthetic corpus: chunks/sec and
+MB/sec of the fixed word-window chunker against the token-aware one.
+
+    python -m benchmarks.bench_chunker --pages 2000 --max-tokens 400 --overlap 50
+"""
+
+import argparse
+import random
+import time
+
+from app.services.chunker import chunk_document, iter_token_chunks
+
+WORDS = (
+    "policy insured premium coverage claim hospital treatment benefit period waiting "
+    "sum deductible exclusion renewal grace maternity cataract surgery room rent"
+).split()
+
+def make_pages(pages: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    result = []
+    for _ in range(pages):
+        paragraphs = []
+        for _ in range(rng.randint(3, 6)):
+            sentences = [
+                " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 30))).capitalize() + rng.choice(".;:?")
+                for _ in range(rng.randint(2, 8))
+            ]
+            paragraphs.append(" ".join(sentences))
+        result.append("\n\n".join(paragraphs) + "\n")
+    return result
+
+def bench(name, run, megabytes):
+    start = time.perf_counter()
+    count = sum(1 for _ in run())
+    elapsed = time.perf_counter() - start
+    print(f"{name:<16}{count:>10}{count / elapsed:>14.0f}{megabytes / elapsed:>10.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--max-tokens", type=int, default=400)
+    parser.add_argument("--overlap", type=int, default=50)
+    args = parser.parse_args()
+
+    pages = make_pages(args.pages)
+    megabytes = sum(len(page) for page in pages) / 1e6
+    print(f"{args.pages} pages, {megabytes:.1f} MB of text")
+    print(f"{'chunker':<16}{'chunks':>10}{'chunks/sec':>14}{'MB/sec':>10}")
+    bench("word windows", lambda: chunk_document("".join(pages)), megabytes)
+    bench("token-aware", lambda: iter_token_chunks(pages, args.max_tokens, args.overlap), megabytes)
+
+if __name__ == "__main__":
+    main()
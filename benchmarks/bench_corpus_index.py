@@ -0,0 +1,86 @@
+# benchmarks/bench_corpus_index.py
+"""
+Query latency and recall@k of the corpus-wide IVF index against exact
+(brute-force) search, at several corpus sizes. Synthetic documents of
+clustered vectors are published one by one, as ingestion does.
+
+    python -m benchmarks.bench_corpus_index --sizes 10000 100000 1000000 --dim 128
+"""
+
+import argparse
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from app.services.corpus_index import CorpusIndex
+from app.services.numpy_store import normalize_rows, top_k_indices
+
+def _percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+def bench_size(size: int, dim: int, chunks_per_doc: int, queries: int, top_k: int, nprobe: int) -> dict:
+    rng = np.random.default_rng(size)
+    topics = rng.standard_normal((max(64, size // 200), dim)).astype(np.float32)
+    corpus = np.empty((size, dim), dtype=np.float32)
+    with tempfile.TemporaryDirectory() as directory:
+        index = CorpusIndex(directory, nprobe=nprobe)
+        build_start = time.perf_counter()
+        for start in range(0, size, chunks_per_doc):
+            count = min(chunks_per_doc, size - start)
+            vectors = topics[rng.integers(0, len(topics), count)] + rng.standard_normal((count, dim)).astype(np.float32)
+            corpus[start:start + count] = vectors
+            doc_id = f"doc{start // chunks_per_doc:06d}"
+            index.add(doc_id, [str(start + i) for i in range(count)], vectors)
+            index.publish(doc_id)
+        build_seconds = time.perf_counter() - build_start
+
+        query_vectors = topics[rng.integers(0, len(topics), queries)] + rng.standard_normal((queries, dim)).astype(np.float32)
+        corpus = normalize_rows(corpus)
+
+        ivf_times, exact_times, recalls = [], [], []
+        for query in query_vectors:
+            start = time.perf_counter()
+            [hits] = index.search([query], top_k)
+            ivf_times.append(time.perf_counter() - start)
+            found = {int(hit["chunk"]) for hit in hits}
+
+            start = time.perf_counter()
+            exact = top_k_indices(normalize_rows([query]) @ corpus.T, top_k)[0]
+            exact_times.append(time.perf_counter() - start)
+            recalls.append(len(found & set(exact.tolist())) / top_k)
+        stats = index.stats()
+
+    return {
+        "size": size,
+        "lists": stats["lists"],
+        "build_s": build_seconds,
+        "recall": statistics.mean(recalls),
+        "ivf_ms_p50": _percentile(ivf_times, 50) * 1000,
+        "ivf_ms_p95": _percentile(ivf_times, 95) * 1000,
+        "exact_ms_p50": _percentile(exact_times, 50) * 1000,
+        "index_mb": stats["bytes"] / 1024 ** 2,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--chunks-per-doc", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=32)
+    args = parser.parse_args()
+
+    print(f"{args.dim} dims, {args.chunks_per_doc} chunks per document, nprobe {args.nprobe}, recall@{args.top_k}")
+    print(f"{'chunks':>10}{'lists':>8}{'build s':>10}{'recall':>9}{'ivf p50 ms':>12}{'ivf p95 ms':>12}"
+          f"{'exact p50 ms':>14}{'index MB':>10}")
+    for size in args.sizes:
+        r = bench_size(size, args.dim, args.chunks_per_doc, args.queries, args.top_k, args.nprobe)
+        print(f"{r['size']:>10}{r['lists']:>8}{r['build_s']:>10.1f}{r['recall']:>9.3f}{r['ivf_ms_p50']:>12.2f}"
+              f"{r['ivf_ms_p95']:>12.2f}{r['exact_ms_p50']:>14.2f}{r['index_mb']:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+# benchmarks/bench_hybrid_retrieval.py
+"""
+Hit rate and latency of retrieval: vector-only search against hybrid
+BM25 + vector search (reciprocal rank fusion), with and without the
+lexical fast path that skips the embedding call.
+
+Synthetic policy documents: every chunk has a clause number, a benefit
+topic (each topic recurs in several clauses) and a monetary limit. Three
+kinds of question, each with one correct chunk:
+
+    exact       "What is the limit under clause 3.4.2?"
+    topic+exact "Maternity benefit limit under clause 3.4.2"
+    paraphrase  a synonym of a topic the document has once ("pregnancy")
+
+The stand-in embedding model knows synonyms and topics but barely tells
+numbers apart, the way general-purpose embeddings blur identifiers. Each
+embedding call costs --embed-latency-ms.
+
+    python -m benchmarks.bench_hybrid_retrieval --docs 20 --chunks 300 --questions-per-request 1
+"""
+
+import argparse
+import asyncio
+import hashlib
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from app.services import corpus_index, embedder_new, vector_store
+from app.services.lexical_index import LexicalIndexStore
+from app.services.numpy_store import NumpyVectorStore
+
+TOPICS = {
+    "maternity": "pregnancy", "cataract": "lens", "ambulance": "paramedic", "ayush": "homeopathy",
+    "dialysis": "kidney", "chemotherapy": "oncology", "physiotherapy": "rehabilitation", "dental": "teeth",
+    "organ": "transplant", "psychiatric": "mental", "bariatric": "obesity", "newborn": "infant",
+    "vaccination": "immunisation", "domiciliary": "home", "prosthesis": "artificial", "hearing": "deafness",
+}
+FILLER = ("insured person hospital expenses claim shall benefit period policy covered treatment sum payable "
+          "subject conditions medical practitioner admission day care company").split()
+DIM = 256
+
+# Embedding calls made so far, and the chunk texts of each document
+embed_calls = [0]
+chunk_texts = {}
+
+def _word_vector(word: str) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(word.encode()).digest()[:8], "little")
+    return np.random.default_rng(seed).standard_normal(DIM).astype(np.float32)
+
+def embed(text: str) -> np.ndarray:
+    synonyms = {synonym: topic for topic, synonym in TOPICS.items()}
+    vector = np.zeros(DIM, dtype=np.float32)
+    for word in text.lower().replace("?", " ").replace(":", " ").split():
+        word = synonyms.get(word, word)
+        if word[0].isdigit() or word.startswith("rs"):
+            # Numbers mostly land on one shared direction
+            vector += 0.1 * _word_vector(word) + _word_vector("<number>")
+        else:
+            vector += (3.0 if word in TOPICS else 1.0) * _word_vector(word)
+    return vector / (np.linalg.norm(vector) or 1.0)
+
+def synthetic_document(seed: int, chunks: int) -> tuple:
+    rng = np.random.default_rng(seed)
+    topics = list(TOPICS)
+    # One topic occurs only once, so its paraphrase has a single right answer
+    unique, repeated = topics[seed % len(topics)], [t for t in topics if t != topics[seed % len(topics)]]
+    texts, questions = [], []
+    for i in range(chunks):
+        clause = f"{i // 100 + 1}.{i // 10 % 10 + 1}.{i % 10 + 1}"
+        topic = unique if i == chunks // 2 else repeated[rng.integers(len(repeated))]
+        amount = f"{int(rng.integers(1, 200)) * 500:,}"
+        filler = " ".join(rng.choice(FILLER, 40))
+        texts.append(f"Clause {clause}: {topic} benefit is limited to Rs. {amount}. {filler}.")
+        if i == chunks // 2:
+            questions.append(("paraphrase", f"Is {TOPICS[topic]} treatment covered?", i))
+        elif rng.random() < 0.05:
+            questions.append(("exact", f"What is the limit under clause {clause}?", i))
+            questions.append(("topic+exact", f"{topic.capitalize()} benefit limit under clause {clause}", i))
+    return texts, questions
+
+async def run_mode(mode: str, documents: dict, per_request: int, top_k: int, hit_k: int) -> dict:
+    vector_store.LEXICAL_FAST_PATH = mode == "hybrid+fast path"
+    latencies, hits, kinds, embedded = [], [], {}, 0
+    for doc_id, questions in documents.items():
+        for start in range(0, len(questions), per_request):
+            batch = questions[start:start + per_request]
+            texts = [question for _, question, _ in batch]
+            calls_before = embed_calls[0]
+            started = time.perf_counter()
+            if mode == "vector":
+                _, candidates = await vector_store.search_candidates_batch_async(texts, doc_id, top_k)
+            else:
+                _, candidates = await vector_store.hybrid_candidates_batch_async(texts, doc_id, top_k)
+            latencies.append(time.perf_counter() - started)
+            embedded += embed_calls[0] - calls_before
+            for (kind, _, answer), (chunks, _) in zip(batch, candidates):
+                hit = chunk_texts[doc_id][answer] in chunks[:hit_k]
+                hits.append(hit)
+                kinds.setdefault(kind, []).append(hit)
+    return {
+        "mode": mode,
+        "hit_rate": statistics.mean(hits),
+        "by_kind": {kind: statistics.mean(values) for kind, values in sorted(kinds.items())},
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": sorted(latencies)[int(0.95 * (len(latencies) - 1))] * 1000,
+        "embed_calls": embedded,
+        "requests": len(latencies),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=20)
+    parser.add_argument("--chunks", type=int, default=300)
+    parser.add_argument("--questions-per-request", type=int, default=1)
+    parser.add_argument("--top-k", type=int, default=10, help="Candidates retrieved per question")
+    parser.add_argument("--hit-k", type=int, default=5, help="A hit is the answer among the first this many")
+    parser.add_argument("--embed-latency-ms", type=float, default=150)
+    args = parser.parse_args()
+
+    async def fake_embed(texts):
+        embed_calls[0] += 1
+        await asyncio.sleep(args.embed_latency_ms / 1000)
+        return [embed(text) for text in texts]
+
+    embedder_new.embed_chunks_async = fake_embed
+    corpus_index.corpus_index = None
+    with tempfile.TemporaryDirectory() as directory:
+        vector_store.vector_store = NumpyVectorStore(None)
+        vector_store.lexical_index = LexicalIndexStore(directory)
+        documents = {}
+        for d in range(args.docs):
+            texts, questions = synthetic_document(d, args.chunks)
+            doc_id = f"synthetic{d:04d}"
+            vector_store.store_embeddings(doc_id, texts, [embed(text) for text in texts])
+            vector_store.publish_document(doc_id)
+            chunk_texts[doc_id] = texts
+            documents[doc_id] = questions
+
+        results = [
+            asyncio.run(run_mode(mode, documents, args.questions_per_request, args.top_k, args.hit_k))
+            for mode in ("vector", "hybrid", "hybrid+fast path")
+        ]
+
+    total = sum(len(questions) for questions in documents.values())
+    print(f"{args.docs} docs x {args.chunks} chunks, {total} questions, {args.questions_per_request} per request, "
+          f"hit@{args.hit_k} of {args.top_k} candidates, {args.embed_latency_ms:.0f} ms per embedding call")
+    kinds = list(results[0]["by_kind"])
+    print(f"{'mode':<18}{'hit rate':>10}" + "".join(f"{kind:>13}" for kind in kinds)
+          + f"{'mean ms':>9}{'p50 ms':>9}{'p95 ms':>9}{'embed calls':>13}")
+    for r in results:
+        print(f"{r['mode']:<18}{r['hit_rate']:>10.3f}" + "".join(f"{r['by_kind'][kind]:>13.3f}" for kind in kinds)
+              + f"{r['mean_ms']:>9.1f}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['embed_calls']:>8}/{r['requests']}")
+
+if __name__ == "__main__":
+    main()
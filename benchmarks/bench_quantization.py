@@ -0,0 +1,105 @@
+# benchmarks/bench_quantization.py
+"""
+Recall vs memory of the numpy vector store's precisions: float32, float16
+and int8, each with and without re-scoring against the float32 copy on
+disk. Recall@k is measured against exact float32 search.
+
+Synthetic documents (clustered vectors, like chunks of one policy):
+
+    python -m benchmarks.bench_quantization --docs 20 --chunks 500 --dim 3072
+
+Real documents from the document cache (one held-out chunk in ten is
+used as a query against the rest):
+
+    python -m benchmarks.bench_quantization --document-cache ./data/cache/documents
+"""
+
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.services.numpy_store import NumpyVectorStore, normalize_rows, top_k_indices
+
+MODES = [
+    ("float32", 0),
+    ("float16", 0),
+    ("float16", 4),
+    ("int8", 0),
+    ("int8", 4),
+]
+
+def synthetic_documents(docs: int, chunks: int, dim: int, questions: int, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    documents = {}
+    for i in range(docs):
+        # Chunks of one document share topics, which makes near-ties common
+        topics = rng.standard_normal((8, dim), dtype=np.float32)
+        vectors = topics[rng.integers(0, 8, chunks)] + 0.6 * rng.standard_normal((chunks, dim), dtype=np.float32)
+        queries = topics[rng.integers(0, 8, questions)] + 0.8 * rng.standard_normal((questions, dim), dtype=np.float32)
+        documents[f"synthetic{i:04d}"] = (vectors, queries)
+    return documents
+
+def cached_documents(cache_dir: str, questions: int) -> dict:
+    documents = {}
+    for path in sorted(Path(cache_dir).glob("*/embeddings.npy")):
+        vectors = np.load(path)
+        if len(vectors) < 20:
+            continue
+        held_out = np.arange(len(vectors)) % 10 == 0
+        documents[path.parent.name[:12]] = (vectors[~held_out], vectors[held_out][:questions])
+    return documents
+
+def bench_mode(precision: str, rescore_factor: int, documents: dict, top_k: int, rounds: int) -> dict:
+    with tempfile.TemporaryDirectory() as persist_dir:
+        store = NumpyVectorStore(persist_dir, precision=precision, rescore_factor=rescore_factor)
+        recalls, query_times = [], []
+        for doc_id, (vectors, queries) in documents.items():
+            store.add(doc_id, [str(i) for i in range(len(vectors))], vectors)
+            store.publish(doc_id)
+            expected = top_k_indices(normalize_rows(queries) @ normalize_rows(vectors).T, top_k)
+            for _ in range(rounds):
+                start = time.perf_counter()
+                found = store.query(doc_id, queries, top_k)
+                query_times.append(time.perf_counter() - start)
+            for want, got in zip(expected, found):
+                recalls.append(len(set(want.tolist()) & {int(chunk) for chunk in got}) / len(want))
+        resident = sum(entry["bytes"] for entry in store.resident_documents())
+    return {
+        "mode": precision + (f"+rescore x{rescore_factor}" if rescore_factor else ""),
+        "recall": statistics.mean(recalls),
+        "resident_mb": resident / 1024 ** 2,
+        "query_ms_p50": statistics.median(query_times) * 1000,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=20)
+    parser.add_argument("--chunks", type=int, default=500)
+    parser.add_argument("--dim", type=int, default=3072)
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--document-cache", help="Benchmark the documents of this document cache directory instead")
+    args = parser.parse_args()
+
+    if args.document_cache:
+        documents = cached_documents(args.document_cache, args.questions)
+        if not documents:
+            parser.error(f"No cached documents with at least 20 chunks in {args.document_cache}")
+        label = f"{len(documents)} cached documents"
+    else:
+        documents = synthetic_documents(args.docs, args.chunks, args.dim, args.questions)
+        label = f"{args.docs} synthetic docs x {args.chunks} chunks x {args.dim} dims"
+
+    results = [bench_mode(precision, factor, documents, args.top_k, args.rounds) for precision, factor in MODES]
+    print(f"{label}, recall@{args.top_k} against exact float32 search")
+    print(f"{'mode':<22}{'recall':>10}{'resident MB':>14}{'query p50 ms':>16}")
+    for r in results:
+        print(f"{r['mode']:<22}{r['recall']:>10.4f}{r['resident_mb']:>14.2f}{r['query_ms_p50']:>16.3f}")
+
+if __name__ == "__main__":
+    main()
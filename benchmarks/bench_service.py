@@ -0,0 +1,189 @@
+# benchmarks/bench_service.py
+"""
+End-to-end benchmark of /api/v1/hackrx/run without Azure credentials.
+
+Starts benchmarks.fake_azure as the Azure OpenAI endpoint and PDF host,
+runs the API with uvicorn against it and replays query bodies
+({"documents", "questions"}) from .json / .jsonl files at a given
+concurrency. Each distinct document URL is mapped to a sample PDF on the
+local server. Reports latency percentiles, requests/sec, upstream call
+counts and the mean time per processing stage, and can save the result as
+a baseline or compare against one.
+
+    python -m benchmarks.bench_service --requests test_request.json --rounds 5 --concurrency 4
+    python -m benchmarks.bench_service --save-baseline benchmarks/baseline.json
+    python -m benchmarks.bench_service --baseline benchmarks/baseline.json --tolerance 0.15
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import statistics
+from pathlib import Path
+
+import httpx
+from prometheus_client.parser import text_string_to_metric_families
+
+from benchmarks.fake_azure import FakeAzure, BackgroundServer
+
+# Lower is better for these; higher is better for requests_per_second
+LATENCY_KEYS = ("p50_ms", "p95_ms", "p99_ms")
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+def load_requests(paths: list) -> list:
+    """Query bodies from .json (object or list) and .jsonl files; other records are skipped."""
+    bodies = []
+    for path in paths:
+        text = Path(path).read_text(encoding="utf-8")
+        if path.endswith(".jsonl"):
+            records = [json.loads(line) for line in text.splitlines() if line.strip()]
+        else:
+            data = json.loads(text)
+            records = data if isinstance(data, list) else [data]
+        usable = [r for r in records if isinstance(r, dict) and r.get("documents") and r.get("questions")]
+        if len(usable) < len(records):
+            print(f"{path}: skipped {len(records) - len(usable)} records without documents/questions")
+        bodies.extend(usable)
+    return bodies
+
+def _configure_app_environment(fake_url: str, workdir: str):
+    # app.config reads the environment at import time
+    os.environ.update({
+        "ENVIRONMENT": "benchmark",
+        "AZURE_OPENAI_EMBEDDING_ENDPOINT": fake_url,
+        "AZURE_OPENAI_CHAT_ENDPOINT": fake_url,
+        "AZURE_OPENAI_EMBEDDING_API_KEY": "benchmark",
+        "AZURE_OPENAI_CHAT_API_KEY": "benchmark",
+        "DOCUMENT_CACHE_DIR": os.path.join(workdir, "documents"),
+        "ANSWER_CACHE_PATH": os.path.join(workdir, "answers.sqlite3"),
+        "NUMPY_STORE_DIR": os.path.join(workdir, "vectors"),
+        "CHROMA_PERSIST_DIR": os.path.join(workdir, "chroma"),
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+    })
+
+def stage_means(metrics_text: str) -> dict:
+    """Mean seconds per observation of each stage, from the app's /metrics."""
+    sums, counts = {}, {}
+    for family in text_string_to_metric_families(metrics_text):
+        if family.name != "docquery_stage_seconds":
+            continue
+        for sample in family.samples:
+            stage = sample.labels.get("stage")
+            if sample.name.endswith("_sum"):
+                sums[stage] = sample.value
+            elif sample.name.endswith("_count"):
+                counts[stage] = sample.value
+    return {stage: round(sums[stage] / counts[stage] * 1000, 2) for stage in sums if counts.get(stage)}
+
+async def replay(api_url: str, token: str, bodies: list, rounds: int, concurrency: int) -> tuple:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, failures = [], 0
+
+    async with httpx.AsyncClient(timeout=600) as client:
+        async def send(body):
+            nonlocal failures
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(
+                    f"{api_url}/api/v1/hackrx/run", json=body, headers={"Authorization": f"Bearer {token}"}
+                )
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    failures += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(send(body) for _ in range(rounds) for body in bodies))
+        elapsed = time.perf_counter() - started
+        metrics_text = (await client.get(f"{api_url}/metrics")).text
+    return latencies, failures, elapsed, metrics_text
+
+def run_benchmark(args) -> dict:
+    bodies = load_requests(args.requests)
+    if not bodies:
+        raise SystemExit("No query bodies to replay")
+
+    fake = FakeAzure(args.latency_ms, args.jitter_ms, args.throttle_rate, args.dim, args.pages)
+    with tempfile.TemporaryDirectory() as workdir, BackgroundServer(fake.app, _free_port()) as upstream:
+        # Same URL -> same sample PDF, so repeated documents exercise the caches
+        documents = {}
+        for body in bodies:
+            documents.setdefault(body["documents"], f"{upstream.url}/docs/sample{len(documents)}.pdf")
+        bodies = [{**body, "documents": documents[body["documents"]]} for body in bodies]
+
+        _configure_app_environment(upstream.url, workdir)
+        from app.main import app, TEAM_TOKEN
+
+        with BackgroundServer(app, _free_port()) as api:
+            latencies, failures, elapsed, metrics_text = asyncio.run(
+                replay(api.url, TEAM_TOKEN, bodies, args.rounds, args.concurrency)
+            )
+
+    return {
+        "requests": len(latencies),
+        "failures": failures,
+        "concurrency": args.concurrency,
+        "questions_per_request": round(statistics.mean(len(b["questions"]) for b in bodies), 1),
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(_percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 1),
+        "requests_per_second": round(len(latencies) / elapsed, 2),
+        "upstream_calls": dict(fake.calls),
+        "embedded_inputs": fake.embedded_inputs,
+        "stage_ms_mean": stage_means(metrics_text),
+    }
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list:
+    """Human-readable regressions of result against baseline beyond tolerance."""
+    regressions = []
+    for key in LATENCY_KEYS:
+        if baseline.get(key) and result[key] > baseline[key] * (1 + tolerance):
+            regressions.append(f"{key}: {baseline[key]} -> {result[key]}")
+    if baseline.get("requests_per_second") and \
+            result["requests_per_second"] < baseline["requests_per_second"] * (1 - tolerance):
+        regressions.append(f"requests_per_second: {baseline['requests_per_second']} -> {result['requests_per_second']}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", nargs="+", default=["test_request.json"],
+                        help=".json / .jsonl files of {documents, questions} bodies")
+    parser.add_argument("--rounds", type=int, default=3, help="times each body is replayed")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=200, help="fake chat latency")
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--throttle-rate", type=float, default=0.02, help="share of upstream calls answered with 429")
+    parser.add_argument("--dim", type=int, default=256, help="fake embedding dimensions")
+    parser.add_argument("--pages", type=int, default=20, help="pages per sample PDF")
+    parser.add_argument("--save-baseline", help="write the result as a baseline JSON file")
+    parser.add_argument("--baseline", help="baseline JSON file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression")
+    args = parser.parse_args()
+
+    result = run_benchmark(args)
+    print(json.dumps(result, indent=2))
+
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(json.dumps(result, indent=2) + "\n", encoding="utf-8")
+        print(f"Saved baseline to {args.save_baseline}")
+    if args.baseline:
+        regressions = compare(result, json.loads(Path(args.baseline).read_text(encoding="utf-8")), args.tolerance)
+        if regressions:
+            print("Regressions beyond tolerance:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("No regressions beyond tolerance")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# benchmarks/bench_startup.py
+"""
+Cold start of the API: time to import app.main, and for a fresh uvicorn
+process the time until /api/v1/health answers, until /api/v1/ready
+reports the warmup done (with the time of each warmup step), and until
+the first /api/v1/hackrx/run query succeeds (followed by a second query
+on the same document, for comparison). Azure OpenAI and the PDF host
+are benchmarks.fake_azure; every round starts from empty caches.
+
+    python -m benchmarks.bench_startup --rounds 5
+    python -m benchmarks.bench_startup --save-baseline benchmarks/startup_baseline.json
+    python -m benchmarks.bench_startup --baseline benchmarks/startup_baseline.json --tolerance 0.25
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+
+import httpx
+
+from benchmarks.bench_service import _configure_app_environment, _free_port
+from benchmarks.fake_azure import FakeAzure, BackgroundServer
+
+# Lower is better for all of them
+KEYS = ("import_ms", "health_ms", "ready_ms", "first_query_ms", "second_query_ms")
+TOKEN = "benchmark"
+IMPORT_SNIPPET = "import time; start = time.perf_counter(); import app.main; print(time.perf_counter() - start)"
+
+def _environment(upstream_url: str, workdir: str) -> dict:
+    _configure_app_environment(upstream_url, workdir)
+    return {
+        **os.environ,
+        "TEAM_TOKEN": TOKEN,
+        "EMBEDDING_CACHE_DIR": os.path.join(workdir, "embeddings"),
+        "CORPUS_INDEX_DIR": os.path.join(workdir, "corpus_index"),
+        "LEXICAL_INDEX_DIR": os.path.join(workdir, "lexical"),
+        "SHARED_STORE_DIR": os.path.join(workdir, "shared_vectors"),
+    }
+
+def measure_import(env: dict) -> float:
+    output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], env=env, capture_output=True, text=True, check=True)
+    return float(output.stdout.strip().splitlines()[-1]) * 1000
+
+def _wait_for(client: httpx.Client, url: str, process: subprocess.Popen, timeout: float) -> float:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"API process exited with {process.returncode}")
+        try:
+            if client.get(url).status_code == 200:
+                return time.perf_counter()
+        except httpx.TransportError:
+            pass
+        time.sleep(0.01)
+    raise RuntimeError(f"{url} not ready after {timeout}s")
+
+def measure_server(env: dict, document_url: str, timeout: float) -> tuple:
+    port = _free_port()
+    api = f"http://127.0.0.1:{port}"
+    headers = {"Authorization": f"Bearer {TOKEN}"}
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        with httpx.Client(timeout=timeout) as client:
+            health = _wait_for(client, f"{api}/api/v1/health", process, timeout)
+            ready = _wait_for(client, f"{api}/api/v1/ready", process, timeout)
+            steps = client.get(f"{api}/api/v1/ready").json()["steps"]
+            queries = []
+            for question in ("What is the grace period?", "Is AYUSH treatment covered?"):
+                start = time.perf_counter()
+                response = client.post(f"{api}/api/v1/hackrx/run", headers=headers,
+                                       json={"documents": document_url, "questions": [question]})
+                response.raise_for_status()
+                queries.append(time.perf_counter() - start)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    return {
+        "health_ms": (health - started) * 1000,
+        "ready_ms": (ready - started) * 1000,
+        "first_query_ms": queries[0] * 1000,
+        "second_query_ms": queries[1] * 1000,
+    }, {name: step["seconds"] * 1000 for name, step in steps.items()}
+
+def run_benchmark(args) -> dict:
+    fake = FakeAzure(args.latency_ms, 0, 0.0, args.dim, args.pages)
+    samples = {key: [] for key in KEYS}
+    warmup_steps = {}
+    with BackgroundServer(fake.app, _free_port()) as upstream:
+        for round_number in range(args.rounds):
+            with tempfile.TemporaryDirectory() as workdir:
+                env = _environment(upstream.url, workdir)
+                samples["import_ms"].append(measure_import(env))
+                # A new document each round, so the first query really ingests it
+                document_url = f"{upstream.url}/docs/sample{round_number}.pdf"
+                timings, steps = measure_server(env, document_url, args.timeout)
+                for key, value in timings.items():
+                    samples[key].append(value)
+                for name, value in steps.items():
+                    warmup_steps.setdefault(name, []).append(value)
+    return {
+        "rounds": args.rounds,
+        **{key: round(statistics.median(values), 1) for key, values in samples.items()},
+        "warmup_step_ms": {name: round(statistics.median(values), 1) for name, values in warmup_steps.items()},
+        "upstream_calls": dict(fake.calls),
+    }
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list:
+    """Human-readable regressions of result against baseline beyond tolerance."""
+    return [
+        f"{key}: {baseline[key]} -> {result[key]}"
+        for key in KEYS
+        if baseline.get(key) and result[key] > baseline[key] * (1 + tolerance)
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=3, help="cold starts measured (medians are reported)")
+    parser.add_argument("--latency-ms", type=float, default=50, help="fake Azure latency")
+    parser.add_argument("--dim", type=int, default=256, help="fake embedding dimensions")
+    parser.add_argument("--pages", type=int, default=10, help="pages of the sample PDF")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds to wait for the API at each step")
+    parser.add_argument("--save-baseline", help="write the result as a baseline JSON file")
+    parser.add_argument("--baseline", help="baseline JSON file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    args = parser.parse_args()
+
+    result = run_benchmark(args)
+    print(json.dumps(result, indent=2))
+
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(json.dumps(result, indent=2) + "\n", encoding="utf-8")
+        print(f"Saved baseline to {args.save_baseline}")
+    if args.baseline:
+        regressions = compare(result, json.loads(Path(args.baseline).read_text(encoding="utf-8")), args.tolerance)
+        if regressions:
+            print("Regressions beyond tolerance:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("No regressions beyond tolerance")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# benchmarks/bench_vector_store.py
+"""
+Micro-benchmark of the vector store backends: store latency per document
+and batched top-k query latency.
+
+    python -m benchmarks.bench_vector_store --docs 20 --chunks 300 --dim 3072
+"""
+
+import argparse
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from app.config import CHROMA_PERSIST_DIR
+from app.services.vector_store import ChromaVectorStore
+from app.services.numpy_store import NumpyVectorStore
+
+def _percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+def bench_backend(name, store, documents, queries, top_k, rounds):
+    store_times = []
+    for doc_id, (chunks, embeddings) in documents.items():
+        start = time.perf_counter()
+        store.add(doc_id, chunks, embeddings)
+        store.publish(doc_id)
+        store_times.append(time.perf_counter() - start)
+
+    query_times = []
+    for _ in range(rounds):
+        for doc_id in documents:
+            start = time.perf_counter()
+            store.query(doc_id, queries, top_k)
+            query_times.append(time.perf_counter() - start)
+
+    return {
+        "backend": name,
+        "store_ms_mean": statistics.mean(store_times) * 1000,
+        "query_ms_p50": _percentile(query_times, 50) * 1000,
+        "query_ms_p95": _percentile(query_times, 95) * 1000,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--docs", type=int, default=20)
+    parser.add_argument("--chunks", type=int, default=300)
+    parser.add_argument("--dim", type=int, default=3072)
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    documents = {
+        f"bench{i:04d}": (
+            [f"chunk {j} of document {i}" for j in range(args.chunks)],
+            rng.standard_normal((args.chunks, args.dim), dtype=np.float32).tolist(),
+        )
+        for i in range(args.docs)
+    }
+    queries = rng.standard_normal((args.questions, args.dim), dtype=np.float32).tolist()
+
+    with tempfile.TemporaryDirectory() as numpy_dir:
+        results = [
+            bench_backend("chroma", ChromaVectorStore(CHROMA_PERSIST_DIR), documents, queries, args.top_k, args.rounds),
+            bench_backend("numpy", NumpyVectorStore(None), documents, queries, args.top_k, args.rounds),
+            bench_backend("numpy+npy", NumpyVectorStore(numpy_dir), documents, queries, args.top_k, args.rounds),
+        ]
+
+    print(f"{args.docs} docs x {args.chunks} chunks x {args.dim} dims, {args.questions} queries per search")
+    print(f"{'backend':<12}{'store ms':>12}{'query p50 ms':>16}{'query p95 ms':>16}")
+    for r in results:
+        print(f"{r['backend']:<12}{r['store_ms_mean']:>12.2f}{r['query_ms_p50']:>16.3f}{r['query_ms_p95']:>16.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+# benchmarks/fake_azure.py
+"""
+Local stand-in for the Azure OpenAI routes used by embedder_new.py and
+llm_service_new.py, plus a static server for sample PDFs.
+
+Embeddings are deterministic per input text. Latency, jitter and the share
+of requests answered with 429 are configurable, and every call is counted
+so a benchmark can report upstream traffic.
+
+    python -m benchmarks.fake_azure --port 8100 --latency-ms 200 --throttle-rate 0.05
+"""
+
+import re
+import json
+import random
+import asyncio
+import hashlib
+import argparse
+import threading
+import time
+from collections import Counter
+
+import fitz
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+SAMPLE_CLAUSES = [
+    "The grace period for premium payment is thirty days from the due date.",
+    "Pre-existing diseases are covered after thirty-six months of continuous coverage.",
+    "Maternity expenses are covered after twenty-four months, limited to two deliveries.",
+    "Cataract surgery has a waiting period of two years.",
+    "Organ donor hospitalisation expenses are covered for harvesting the organ.",
+    "A No Claim Discount of five percent is offered on renewal for each claim-free year.",
+    "Preventive health check-ups are reimbursed at the end of every block of two years.",
+    "A hospital is an institution with at least ten inpatient beds and qualified nursing staff.",
+    "AYUSH treatment is covered up to the sum insured in an AYUSH hospital.",
+    "Room rent is capped at one percent of the sum insured per day under Plan A.",
+]
+
+def sample_pdf(seed: int, pages: int = 20) -> bytes:
+    """A policy-like PDF whose text depends on seed."""
+    rng = random.Random(seed)
+    pdf = fitz.open()
+    for number in range(pages):
+        page = pdf.new_page()
+        clauses = [rng.choice(SAMPLE_CLAUSES) for _ in range(12)]
+        text = f"Section {number + 1}. " + " ".join(clauses)
+        page.insert_textbox(fitz.Rect(54, 54, 558, 788), text, fontsize=10)
+    return pdf.tobytes()
+
+def deterministic_embedding(text: str, dim: int) -> list:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim, dtype=np.float32)
+    return (vector / np.linalg.norm(vector)).round(6).tolist()
+
+class FakeAzure:
+    """Configurable fake upstream; `app` is the ASGI application."""
+
+    def __init__(self, latency_ms: float = 100, jitter_ms: float = 0, throttle_rate: float = 0.0,
+                 dim: int = 256, pages: int = 20, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.throttle_rate = throttle_rate
+        self.dim = dim
+        self.pages = pages
+        self.calls = Counter()
+        self.embedded_inputs = 0
+        self._random = random.Random(seed)
+        self._pdfs = {}
+        self._lock = threading.Lock()
+        self.app = self._build_app()
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self.calls[key] += amount
+
+    async def _delay(self, scale: float = 1.0):
+        delay = self.latency_ms * scale + self._random.uniform(-self.jitter_ms, self.jitter_ms)
+        await asyncio.sleep(max(0.0, delay) / 1000)
+
+    def _throttled(self, route: str):
+        if self.throttle_rate and self._random.random() < self.throttle_rate:
+            self._count(f"{route}_429")
+            return JSONResponse(
+                {"error": {"code": "429", "message": "Rate limit exceeded"}},
+                status_code=429,
+                headers={"retry-after-ms": str(self._random.randint(50, 250))},
+            )
+        return None
+
+    def _pdf(self, name: str) -> bytes:
+        with self._lock:
+            if name not in self._pdfs:
+                self._pdfs[name] = sample_pdf(int(hashlib.sha256(name.encode()).hexdigest()[:8], 16), self.pages)
+            return self._pdfs[name]
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.post("/openai/deployments/{deployment}/embeddings")
+        async def embeddings(deployment: str, request: Request):
+            self._count("embeddings")
+            throttled = self._throttled("embeddings")
+            if throttled:
+                return throttled
+            inputs = (await request.json())["input"]
+            with self._lock:
+                self.embedded_inputs += len(inputs)
+            # Embedding latency grows mildly with batch size
+            await self._delay(0.25 + 0.01 * len(inputs))
+            tokens = sum(len(text) // 4 for text in inputs)
+            return {
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": deterministic_embedding(text, self.dim)}
+                    for i, text in enumerate(inputs)
+                ],
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            }
+
+        @app.post("/openai/deployments/{deployment}/chat/completions")
+        async def chat(deployment: str, request: Request):
+            self._count("chat")
+            throttled = self._throttled("chat")
+            if throttled:
+                return throttled
+            body = await request.json()
+            prompt = body["messages"][-1]["content"]
+            await self._delay()
+            if body.get("response_format", {}).get("type") == "json_object":
+                questions = re.findall(r"^(\d+)\. (.+)$", prompt.split("Context:")[0], flags=re.MULTILINE)
+                content = json.dumps({"answers": [
+                    {"index": int(i), "answer": f"Answer to: {question}"} for i, question in questions
+                ]})
+            else:
+                content = f"Answer to: {prompt.splitlines()[0][:200]}"
+            return {
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4,
+                          "total_tokens": (len(prompt) + len(content)) // 4},
+            }
+
+        @app.get("/docs/{name}")
+        async def document(name: str):
+            self._count("documents")
+            return Response(self._pdf(name), media_type="application/pdf",
+                            headers={"ETag": f'"{hashlib.sha256(name.encode()).hexdigest()[:16]}"'})
+
+        return app
+
+class BackgroundServer:
+    """Run an ASGI app with uvicorn in a daemon thread."""
+
+    def __init__(self, app, port: int):
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+        self.url = f"http://127.0.0.1:{port}"
+
+    def __enter__(self):
+        self.thread.start()
+        deadline = time.time() + 30
+        while not self.server.started:
+            if time.time() > deadline or not self.thread.is_alive():
+                raise RuntimeError(f"Server on {self.url} did not start")
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--pages", type=int, default=20)
+    args = parser.parse_args()
+
+    fake = FakeAzure(args.latency_ms, args.jitter_ms, args.throttle_rate, args.dim, args.pages)
+    uvicorn.run(fake.app, host="127.0.0.1", port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# tests/test_admission.py
+
+import time
+import asyncio
+
+import pytest
+
+from app.services.admission import AdmissionController, AdmissionRejected
+
+def test_excess_work_is_rejected_when_the_queue_is_full():
+    admission = AdmissionController({"questions": (1, 1)})
+    order = []
+
+    async def work(name, hold):
+        async with admission.slot("questions"):
+            order.append(name)
+            await asyncio.sleep(hold)
+
+    async def scenario():
+        first = asyncio.create_task(work("first", 0.1))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(work("second", 0))
+        await asyncio.sleep(0.01)
+        with pytest.raises(AdmissionRejected) as rejected:
+            admission.check("questions")
+        with pytest.raises(AdmissionRejected):
+            await work("third", 0)
+        stats = admission.stats()["questions"]
+        await asyncio.gather(first, second)
+        return rejected.value, stats
+
+    error, stats = asyncio.run(scenario())
+    # The released slot went to the queued caller
+    assert order == ["first", "second"]
+    assert error.status_code == 503 and int(error.retry_after_header) >= 1
+    assert stats["active"] == 1 and stats["queued"] == 1 and stats["rejected"] == 2
+    final = admission.stats()["questions"]
+    assert final["active"] == 0 and final["queued"] == 0 and final["admitted"] == 2
+
+def test_waiting_past_the_deadline_is_rejected_and_frees_the_queue():
+    admission = AdmissionController({"ingestion": (1, 4)})
+
+    async def scenario():
+        async with admission.slot("ingestion"):
+            start = time.monotonic()
+            with pytest.raises(AdmissionRejected):
+                async with admission.slot("ingestion", deadline=time.monotonic() + 0.05):
+                    pass
+            waited = time.monotonic() - start
+        # Unbounded background work still gets a slot
+        async with admission.slot("ingestion", bounded=False):
+            pass
+        return waited
+
+    waited = asyncio.run(scenario())
+    assert 0.04 < waited < 0.5
+    stats = admission.stats()["ingestion"]
+    assert stats["active"] == 0 and stats["queued"] == 0 and stats["admitted"] == 2 and stats["rejected"] == 1
@@ -0,0 +1,56 @@
+# tests/test_answer_cache.py
+
+import asyncio
+
+from app.services.answer_cache import AnswerCache, answer_key
+
+def test_answer_key_normalizes_question_and_tracks_context():
+    key = answer_key("doc", "What is the grace period?", ["chunk a", "chunk b"])
+    assert answer_key("doc", "  what is the GRACE period ", ["chunk a", "chunk b"]) == key
+    assert answer_key("doc", "What is the grace period?", ["chunk b", "chunk c"]) != key
+    assert answer_key("other", "What is the grace period?", ["chunk a", "chunk b"]) != key
+
+def test_answer_cache_disk_tier_and_invalidation(tmp_path):
+    db_path = str(tmp_path / "answers.sqlite3")
+    cache = AnswerCache(max_entries=1, db_path=db_path)
+    cache.put("k1", "doc1", "thirty days")
+    cache.put("k2", "doc2", "two years")
+
+    # k1 fell out of the memory tier but is still on disk, also after a restart
+    reopened = AnswerCache(max_entries=1, db_path=db_path)
+    assert reopened.get("k1") == "thirty days"
+    reopened.invalidate_document("doc1")
+    assert reopened.get("k1") is None
+    assert reopened.get("k2") == "two years"
+    assert reopened.stats()["hit_ratio"] == round(2 / 3, 4)
+
+def test_answer_cache_collapses_concurrent_misses():
+    cache = AnswerCache(ttl_seconds=0)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_compute("k", "doc", compute) for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert [answer for answer, _ in results] == ["answer"] * 5
+    assert sum(cached for _, cached in results) == 4
+    assert cache.stats()["coalesced"] == 4
+
+def test_answer_cache_disk_tier_is_bounded_and_purges_expired_rows(tmp_path):
+    cache = AnswerCache(max_entries=1, ttl_seconds=3600, db_path=str(tmp_path / "answers.sqlite3"), max_disk_entries=3)
+    for i in range(5):
+        cache.put(f"k{i}", "doc", f"answer {i}")
+    # The oldest rows went first
+    assert cache.stats()["entries"] == 3
+    assert cache.get("k0") is None and cache.get("k1") is None and cache.get("k4") == "answer 4"
+
+    cache._db.execute("UPDATE answers SET created_at = created_at - 7200 WHERE key != 'k4'")
+    cache.put("k5", "doc", "answer 5")
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["disk_evictions"] == 4
@@ -0,0 +1,89 @@
+# tests/test_corpus_index.py
+
+import numpy as np
+
+from app.services.corpus_index import CorpusIndex
+from app.services.numpy_store import NumpyVectorStore
+
+def test_corpus_index_searches_published_documents_and_follows_deletes(tmp_path):
+    index = CorpusIndex(str(tmp_path))
+    index.add("doc1", ["grace period"], [[1.0, 0.0, 0.0]], [{"page": 1}])
+    index.add("doc1", ["maternity"], [[0.0, 1.0, 0.0]], [{"page": 2}])
+    index.add("doc2", ["exclusions"], [[0.0, 0.0, 1.0]])
+    # Staged chunks are not searchable until their document is published
+    assert index.search([[1.0, 0.0, 0.0]], top_k=1) == [[]]
+    index.publish("doc1")
+    index.publish("doc2")
+
+    [hits] = index.search([[0.1, 1.0, 0.0]], top_k=2)
+    assert [(hit["document_id"], hit["chunk"]) for hit in hits] == [("doc1", "maternity"), ("doc1", "grace period")]
+    assert hits[0]["metadata"] == {"page": 2} and 0.99 < hits[0]["score"] <= 1.0
+
+    # A second process sharing the directory picks up documents and deletes
+    other = CorpusIndex(str(tmp_path))
+    assert other.stats()["documents"] == 2
+    index.delete("doc1")
+    assert [hit["document_id"] for hit in other.search([[1.0, 0.0, 0.0]], top_k=3)[0]] == ["doc2"]
+
+def test_trained_index_matches_exact_search(tmp_path):
+    rng = np.random.default_rng(0)
+    topics = rng.standard_normal((20, 32)).astype(np.float32)
+    index = CorpusIndex(str(tmp_path), nprobe=8, train_size=1000)
+    vectors = {}
+    for d in range(5):
+        vectors[f"doc{d}"] = topics[rng.integers(0, 20, 400)] + 0.3 * rng.standard_normal((400, 32)).astype(np.float32)
+        index.add(f"doc{d}", [f"{d}:{i}" for i in range(400)], vectors[f"doc{d}"])
+        index.publish(f"doc{d}")
+    stats = index.stats()
+    assert stats["trained"] and stats["lists"] == 34 and stats["chunks"] == 2000
+
+    all_vectors = np.concatenate(list(vectors.values()))
+    all_vectors /= np.linalg.norm(all_vectors, axis=1, keepdims=True)
+    queries = topics[:10] + 0.3 * rng.standard_normal((10, 32)).astype(np.float32)
+    found = index.search(queries, top_k=10)
+    exact = np.argsort(-(queries / np.linalg.norm(queries, axis=1, keepdims=True)) @ all_vectors.T, axis=1)[:, :10]
+    recall = np.mean([
+        len({hit["chunk"] for hit in hits} & {f"{i // 400}:{i % 400}" for i in row}) / 10
+        for hits, row in zip(found, exact)
+    ])
+    assert recall >= 0.9
+    # Reloaded from disk with the saved clustering
+    assert CorpusIndex(str(tmp_path), nprobe=8, train_size=1000).search(queries, top_k=10) == found
+
+def test_deleted_documents_are_compacted_away(tmp_path):
+    rng = np.random.default_rng(0)
+    index = CorpusIndex(str(tmp_path), train_size=100000)
+    vectors = rng.standard_normal((10, 300, 16)).astype(np.float32)
+    for d in range(10):
+        index.add(f"doc{d}", [f"{d}:{i}" for i in range(300)], vectors[d])
+        index.publish(f"doc{d}")
+    for d in range(8):
+        index.delete(f"doc{d}")
+    # Row IDs were renumbered, so the per-row bookkeeping shrank with the corpus
+    assert len(index._row_doc) <= 1200 and len(index._doc_ids) <= 4
+    assert index.stats()["chunks"] == 600
+    [hits] = index.search(np.eye(16)[:1], top_k=600)
+    assert len(hits) == 600 and {hit["chunk"].split(":")[0] for hit in hits} == {"8", "9"}
+    assert index.search(vectors[9, 42:43], top_k=1)[0][0]["chunk"] == "9:42"
+
+def test_quantized_index_is_smaller_and_counted_in_the_store_budget(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((500, 64)).astype(np.float32)
+    store = NumpyVectorStore(str(tmp_path / "store"), max_bytes=100_000)
+    store.add("cached", ["a"], [[1.0, 0.0]])
+    store.publish("cached")
+    indexes = {}
+    for precision in ("float32", "int8"):
+        indexes[precision] = CorpusIndex(
+            str(tmp_path / precision), precision=precision,
+            on_resize=lambda nbytes: store.reserve("corpus_index", nbytes),
+        )
+        indexes[precision].add("doc", [str(i) for i in range(500)], vectors)
+        indexes[precision].publish("doc")
+    assert indexes["int8"].nbytes < indexes["float32"].nbytes / 2
+    [hits] = indexes["int8"].search(vectors[7:8], top_k=1)
+    assert hits[0]["chunk"] == "7"
+
+    # The float32 index pushed the store over budget, unloading its document
+    assert store.residency_stats()["evictions"] == 1
+    assert store.residency_stats()["reserved_bytes"] == {"corpus_index": indexes["int8"].nbytes}
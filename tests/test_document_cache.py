@@ -0,0 +1,66 @@
+# tests/test_document_cache.py
+
+from app.services.document_cache import DocumentCache, content_hash
+
+def test_cache_hit_survives_restart(tmp_path):
+    key = content_hash(b"policy bytes")
+    cache = DocumentCache(cache_dir=str(tmp_path))
+    assert cache.get(key) is None
+    cache.put(key, "doc1", ["chunk a", "chunk b"], [[0.1, 0.2], [0.3, 0.4]])
+    cache.remember_url("http://example/doc.pdf", key, etag='"abc"')
+
+    reopened = DocumentCache(cache_dir=str(tmp_path))
+    assert reopened.get(key)["doc_id"] == "doc1"
+    chunks, embeddings, metadatas = reopened.load(key)
+    assert chunks == ["chunk a", "chunk b"]
+    assert len(embeddings) == 2
+    assert metadatas is None
+    assert reopened.conditional_headers("http://example/doc.pdf") == {"If-None-Match": '"abc"'}
+    assert reopened.stats()["hits"] == 1
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    evicted = []
+    cache = DocumentCache(cache_dir=str(tmp_path), max_entries=2, on_evict=evicted.append)
+    for name in ["a", "b"]:
+        cache.put(name, f"doc_{name}", [name], [[1.0]])
+    cache.get("a")
+    cache.put("c", "doc_c", ["c"], [[1.0]])
+
+    assert [e["doc_id"] for e in evicted] == ["doc_b"]
+    assert "a" in cache and "c" in cache and "b" not in cache
+
+def test_cache_ttl_expires_entries(tmp_path):
+    cache = DocumentCache(cache_dir=str(tmp_path), ttl_seconds=1)
+    cache.put("a", "doc_a", ["a"], [[1.0]])
+    cache._entries["a"]["last_access"] -= 10
+    assert cache.get("a") is None
+    assert cache.stats()["misses"] == 1
+
+def test_cache_hits_do_not_rewrite_the_index(tmp_path):
+    cache = DocumentCache(cache_dir=str(tmp_path), flush_seconds=3600)
+    cache.put("a", "doc_a", ["a"], [[1.0]])
+    cache.remember_url("http://example/a.pdf", "a", etag='"a"')
+    index = tmp_path / DocumentCache.INDEX_FILE
+    saved = index.read_text()
+    cache.get("a")
+    # Downloading unchanged content again changes nothing
+    cache.remember_url("http://example/a.pdf", "a", etag='"a"')
+    assert index.read_text() == saved
+
+    cache.flush()
+    assert index.read_text() != saved
+
+def test_entries_and_aliases_are_shared_between_processes(tmp_path):
+    # Two caches on one directory stand in for two worker processes
+    first = DocumentCache(cache_dir=str(tmp_path))
+    second = DocumentCache(cache_dir=str(tmp_path))
+    first.put("a", "doc_a", ["a"], [[1.0]])
+    first.add_alias("job1", "a")
+
+    assert second.resolve_alias("job1") == "a"
+    assert "a" in second and second.get("a")["doc_id"] == "doc_a"
+    assert second.load("a")[0] == ["a"]
+    assert second.resolve_alias("../index") is None
+
+    first.invalidate("a")
+    assert first.resolve_alias("job1") is None
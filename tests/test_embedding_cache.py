@@ -0,0 +1,43 @@
+# tests/test_embedding_cache.py
+
+import numpy as np
+
+from app.services import embedder_new
+from app.services.embedding_cache import EmbeddingCache, embedding_key, track_lookups
+
+def test_cache_round_trip_lru_eviction_and_compaction(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), max_entries=2)
+    cache.MIN_COMPACT_BYTES = 0
+    cache.put_many({"a": [1.0, 2.0], "b": [3.0, 4.0, 5.0, 6.0]})
+    assert cache.get_many(["a"])["a"].tolist() == [1.0, 2.0]
+    # "b" is now the least recently used entry
+    cache.put_many({"c": [5.0, 6.0]})
+
+    reopened = EmbeddingCache(str(tmp_path), max_entries=2)
+    found = reopened.get_many(["a", "b", "c"])
+    assert sorted(found) == ["a", "c"]
+    assert found["c"].tolist() == [5.0, 6.0]
+    # Compacted into a new generation holding only live vectors
+    assert [path.name for path in tmp_path.glob("vectors.*.f32")] == ["vectors.1.f32"]
+    assert cache.stats()["evictions"] == 1
+
+def test_embed_chunks_sends_only_misses_upstream(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedder_new, "embedding_cache", EmbeddingCache(str(tmp_path)))
+    sent = []
+
+    def fake_embed(chunks):
+        sent.append(list(chunks))
+        return [[float(len(chunk)), 1.0] for chunk in chunks]
+
+    monkeypatch.setattr(embedder_new, "_embed_uncached", fake_embed)
+    embedder_new.embed_chunks(["grace period", "waiting  period"])
+
+    with track_lookups() as counts:
+        embeddings = embedder_new.embed_chunks(["exclusions", "waiting period", "grace period", "exclusions"])
+
+    assert sent == [["grace period", "waiting  period"], ["exclusions"]]
+    assert embeddings == [[10.0, 1.0], [15.0, 1.0], [12.0, 1.0], [10.0, 1.0]]
+    assert counts == {"hits": 3, "misses": 1}
+    assert embedding_key("d", "a  b\n") == embedding_key("d", "a b")
+    assert np.allclose(embedder_new.embedding_cache.get_many([embedding_key(
+        embedder_new.AZURE_OPENAI_EMBEDDING_DEPLOYMENT, "exclusions")]).popitem()[1], [10.0, 1.0])
@@ -0,0 +1,62 @@
+# tests/test_http_client.py
+
+import asyncio
+
+import httpx
+import pytest
+
+from app.services import http_client
+from app.services.metrics import UPSTREAM_RETRIES, UPSTREAM_THROTTLED
+from app.services.http_client import retry_after_seconds, backoff_delay, async_request_with_retries
+
+def test_retry_after_headers():
+    assert retry_after_seconds({"retry-after": "3"}) == 3.0
+    assert retry_after_seconds({"retry-after-ms": "250"}) == 0.25
+    assert retry_after_seconds({}) is None
+    assert 3.0 <= backoff_delay(0, 429, {"retry-after": "3"}) <= 3.0 + http_client.HTTP_BACKOFF_BASE_SECONDS
+
+def test_async_request_retries_on_429(monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) < 3:
+            return httpx.Response(429, headers={"retry-after-ms": "1"})
+        return httpx.Response(200, json={"ok": True})
+
+    throttled = UPSTREAM_THROTTLED.labels("embeddings")._value.get()
+    retries = UPSTREAM_RETRIES.labels("embeddings", "429")._value.get()
+
+    async def run():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        monkeypatch.setattr(http_client, "get_async_client", lambda: client)
+        async with client:
+            return await async_request_with_retries("POST", "http://azure/embeddings", json={})
+
+    response = asyncio.run(run())
+    assert response.status_code == 200
+    assert len(calls) == 3
+    assert UPSTREAM_THROTTLED.labels("embeddings")._value.get() == throttled + 2
+    assert UPSTREAM_RETRIES.labels("embeddings", "429")._value.get() == retries + 2
+
+def test_embedding_client_error_is_not_retried(monkeypatch, tmp_path):
+    from app.services import embedder_new
+    from app.services.embedding_cache import EmbeddingCache
+
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(400, json={"error": {"message": "bad input"}})
+
+    monkeypatch.setattr(embedder_new, "embedding_cache", EmbeddingCache(str(tmp_path), 0))
+
+    async def run():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        monkeypatch.setattr(http_client, "get_async_client", lambda: client)
+        async with client:
+            return await embedder_new.embed_chunks_async(["a chunk"])
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run())
+    assert len(calls) == 1
@@ -0,0 +1,123 @@
+# tests/test_index_document.py
+
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app.services.document_cache import DocumentCache, content_hash
+
+CONTENT = b"%PDF stand-in"
+DIGEST = content_hash(CONTENT)
+
+@pytest.fixture
+def ingested(monkeypatch, tmp_path):
+    sources = []
+
+    async def fake_ingest(source, doc_id):
+        sources.append(source)
+        return {
+            "chunks": ["chunk"],
+            "embeddings": [[1.0, 0.0]],
+            "metadatas": [{}],
+            "stage_seconds": {"parse": 0.0, "chunk": 0.0, "embed": 0.0, "store": 0.0},
+            "embedding_cache": {"hits": 0, "misses": 1},
+        }
+
+    # An empty cache: the entry the caller relied on is gone
+    monkeypatch.setattr(main, "document_cache", DocumentCache(cache_dir=str(tmp_path)))
+    monkeypatch.setattr(main, "ingest_document", fake_ingest)
+    return sources
+
+def test_evicted_document_without_content_is_gone_not_ingested(ingested):
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(main.index_document(None, DIGEST, {}))
+    assert error.value.status_code == 410
+    assert ingested == []
+    assert DIGEST not in main.document_cache
+
+def test_evicted_document_is_downloaded_again(ingested):
+    async def refetch():
+        return CONTENT, DIGEST
+
+    metrics = {}
+    doc_id = asyncio.run(main.index_document(None, DIGEST, metrics, refetch))
+    assert ingested == [CONTENT]
+    assert metrics["document_cache"] == "miss"
+    assert main.document_cache.get(DIGEST)["doc_id"] == doc_id
+
+def test_document_changed_since_validation_is_not_cached_under_old_digest(ingested):
+    async def refetch():
+        return b"new bytes", content_hash(b"new bytes")
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(main.index_document(None, DIGEST, {}, refetch))
+    assert error.value.status_code == 409
+    assert ingested == [] and DIGEST not in main.document_cache
+
+def test_document_id_resolves_without_the_in_memory_job(ingested, monkeypatch):
+    main.document_cache.put(DIGEST, "doc", ["chunk"], [[1.0, 0.0]])
+    main.document_cache.add_alias("job1", DIGEST)
+    # A worker process that did not run the job (or a restarted one)
+    monkeypatch.setattr(main, "ingestion_jobs", main.IngestionJobs())
+
+    assert asyncio.run(main.resolve_document_id("job1")) == DIGEST
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(main.resolve_document_id("job2"))
+    assert error.value.status_code == 404
+
+def test_upload_resolves_in_other_workers_while_still_ingesting(ingested, monkeypatch):
+    # Submitted to another worker, which has not finished ingesting it
+    main.document_cache.add_alias("upload1", DIGEST)
+    monkeypatch.setattr(main, "ingestion_jobs", main.IngestionJobs())
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(main.resolve_document_id("upload1"))
+    assert error.value.status_code == 409 and error.value.headers["Retry-After"]
+    assert main.document_status("upload1")["status"] == "running"
+
+    main.document_cache.put(DIGEST, "doc", ["chunk"], [[1.0, 0.0]])
+    assert asyncio.run(main.resolve_document_id("upload1")) == DIGEST
+    assert main.document_status("upload1")["status"] == "ready"
+
+def test_failed_upload_ingestion_drops_its_alias(ingested, monkeypatch):
+    async def failing_index(content, digest, performance_metrics, refetch=None):
+        raise RuntimeError("parser exploded")
+
+    monkeypatch.setattr(main, "index_document", failing_index)
+    main.document_cache.add_alias("upload1", DIGEST)
+    job = {"document_id": "upload1", "digest": DIGEST, "timings": {}}
+    with pytest.raises(RuntimeError):
+        asyncio.run(main.run_ingestion_job(job, CONTENT))
+    assert main.document_cache.resolve_alias("upload1") is None
+
+def test_submit_rejects_json_body_without_url():
+    client = TestClient(main.app)
+    headers = {"Authorization": f"Bearer {main.TEAM_TOKEN}", "Content-Type": "application/json"}
+    for body in ["{not json", '["http://example/doc.pdf"]', '"http://example/doc.pdf"', "{}"]:
+        response = client.post("/api/v1/documents", content=body, headers=headers)
+        assert response.status_code == 422
+        assert response.json()["detail"] == "Provide a url or a file upload"
+
+def test_ingestion_lock_is_not_replaced_while_a_waiter_is_waking():
+    inside = []
+
+    async def hold(name):
+        async with main._ingestion_lock(DIGEST):
+            inside.append(name)
+            await asyncio.sleep(0.01)
+            assert inside == [name]
+            inside.remove(name)
+
+    async def run():
+        async with main._ingestion_lock(DIGEST):
+            waiter = asyncio.create_task(hold("waiter"))
+            await asyncio.sleep(0)
+        # Released: the lock reads as unlocked before the waiter runs, but a
+        # newcomer must still queue behind it rather than get a fresh lock
+        await asyncio.gather(waiter, hold("newcomer"))
+
+    asyncio.run(run())
+    assert main._ingestion_locks == {}
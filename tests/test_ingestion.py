@@ -0,0 +1,70 @@
+# tests/test_ingestion.py
+
+import asyncio
+
+import fitz
+import pytest
+
+from app.services import ingestion
+from app.services.chunker import iter_token_chunks
+from app.services.document_loader import load_document
+from app.services.vector_store import has_document, vector_store
+
+def _pdf(pages: int) -> bytes:
+    pdf = fitz.open()
+    for i in range(pages):
+        pdf.new_page().insert_text((72, 72), f"Page {i} covers clause {i} of the policy. " * 3)
+    return pdf.tobytes()
+
+def test_ingest_document_pipelines_all_chunks(monkeypatch):
+    async def fake_embed(chunks):
+        return [[float(len(chunk)), 1.0] for chunk in chunks]
+
+    monkeypatch.setattr(ingestion, "embed_chunks_async", fake_embed)
+    monkeypatch.setattr(ingestion, "iter_token_chunks", lambda pages: iter_token_chunks(pages, max_tokens=20, overlap_tokens=0))
+    content = _pdf(8)
+
+    result = asyncio.run(ingestion.ingest_document(content, "ingest_ok"))
+
+    assert " ".join(result["chunks"]).split() == load_document(content).split()
+    assert len(result["embeddings"]) == len(result["metadatas"]) == len(result["chunks"])
+    assert [m["page"] for m in result["metadatas"]] == sorted(m["page"] for m in result["metadatas"])
+    assert result["metadatas"][-1]["last_page"] == 8
+    assert {"parse", "chunk", "embed", "store", "total"} <= set(result["stage_seconds"])
+    assert has_document("ingest_ok")
+    assert len(vector_store.query("ingest_ok", [[1.0, 1.0]], top_k=100)[0]) == len(result["chunks"])
+
+def test_ingest_document_removes_partial_document_on_failure(monkeypatch):
+    calls = []
+
+    async def flaky_embed(chunks):
+        calls.append(chunks)
+        if len(calls) > 1:
+            raise RuntimeError("embedding failed")
+        return [[1.0, 0.0] for _ in chunks]
+
+    monkeypatch.setattr(ingestion, "embed_chunks_async", flaky_embed)
+    monkeypatch.setattr(ingestion, "iter_token_chunks", lambda pages: iter_token_chunks(pages, max_tokens=20))
+    monkeypatch.setattr(ingestion, "iter_batches", lambda chunks, key=None: ([chunk] for chunk in chunks))
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(ingestion.ingest_document(_pdf(3), "ingest_fail"))
+    assert not has_document("ingest_fail")
+
+def test_ingest_document_fails_when_storing_fails(monkeypatch):
+    async def fake_embed(chunks):
+        return [[1.0, 0.0] for _ in chunks]
+
+    def failing_store(doc_id, chunks, embeddings, metadatas=None):
+        raise RuntimeError("store failed")
+
+    monkeypatch.setattr(ingestion, "embed_chunks_async", fake_embed)
+    monkeypatch.setattr(ingestion, "store_embeddings", failing_store)
+    monkeypatch.setattr(ingestion, "INGESTION_QUEUE_DEPTH", 2)
+    monkeypatch.setattr(ingestion, "iter_token_chunks", lambda pages: iter_token_chunks(pages, max_tokens=20))
+    monkeypatch.setattr(ingestion, "iter_batches", lambda chunks, key=None: ([chunk] for chunk in chunks))
+
+    # More batches than the store queue holds: ingestion must not wait for room forever
+    with pytest.raises(RuntimeError, match="store failed"):
+        asyncio.run(asyncio.wait_for(ingestion.ingest_document(_pdf(40), "ingest_store_fail"), timeout=30))
+    assert not has_document("ingest_store_fail")
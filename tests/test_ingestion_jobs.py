@@ -0,0 +1,51 @@
+# tests/test_ingestion_jobs.py
+
+import asyncio
+
+import pytest
+
+from app.services.ingestion_jobs import IngestionJobs, JobQueueFull
+
+def test_jobs_run_in_background_with_bounded_concurrency_and_dedupe():
+    jobs = IngestionJobs(workers=2, max_queued=10)
+    running, peak = 0, 0
+
+    async def work(job):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+        job["digest"] = job["source"]
+
+    async def scenario():
+        submitted = [jobs.submit(f"url:{i}", work, source=f"doc{i}") for i in range(5)]
+        duplicate = jobs.submit("url:0", work, source="doc0")
+        assert duplicate is submitted[0]
+        assert all(job["status"] == "queued" for job in submitted)
+        return [await jobs.wait(job["document_id"]) for job in submitted]
+
+    finished = asyncio.run(scenario())
+    assert peak == 2
+    assert [job["status"] for job in finished] == ["ready"] * 5
+    assert [job["digest"] for job in finished] == [f"doc{i}" for i in range(5)]
+    assert all("queued" in job["timings"] and "total" in job["timings"] for job in finished)
+    assert jobs.stats()["ready"] == 5
+
+def test_failed_job_and_full_queue():
+    jobs = IngestionJobs(workers=1, max_queued=1)
+
+    async def fail(job):
+        raise RuntimeError("bad pdf")
+
+    async def scenario():
+        first = jobs.submit("a", fail)
+        # The worker has not picked up "a" yet, so the backlog is full
+        with pytest.raises(JobQueueFull):
+            jobs.submit("b", fail)
+        return await jobs.wait(first["document_id"])
+
+    job = asyncio.run(scenario())
+    assert job["status"] == "failed"
+    assert job["error"] == "bad pdf"
+    assert jobs.get("missing") is None
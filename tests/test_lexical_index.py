@@ -0,0 +1,62 @@
+# tests/test_lexical_index.py
+
+import asyncio
+
+from app.services import corpus_index, embedder_new, vector_store
+from app.services.lexical_index import BM25Index, LexicalIndexStore, reciprocal_rank_fusion, tokenize
+from app.services.numpy_store import NumpyVectorStore
+
+CHUNKS = [
+    "Clause 4.2.1: AYUSH treatment is covered up to Rs. 50,000 per policy year.",
+    "The waiting period for pre-existing diseases is 36 months.",
+    "A grace period of thirty days is allowed for premium payment.",
+    "Maternity expenses are covered after 24 months of continuous coverage.",
+]
+
+def test_bm25_index_ranks_exact_terms_and_round_trips(tmp_path):
+    assert tokenize("Clause 4.2.1 covers Rs. 1,00,000 for AYUSH policies.") == [
+        "clause", "4.2.1", "cover", "rs", "100000", "ayush", "policy",
+    ]
+    index = BM25Index.build(CHUNKS)
+    hits = index.search("Is AYUSH covered under clause 4.2.1?", top_k=3)
+    assert hits["rows"].tolist() == [0, 3]
+    assert hits["coverage"] == 1.0 and hits["scores"][0] > hits["scores"][1]
+    # A term the document lacks weighs as much as its rarest term
+    assert index.search("AYUSH dental", top_k=3)["coverage"] < 0.6
+    assert index.search("the of", top_k=3)["rows"].tolist() == []
+
+    index.save(tmp_path / "doc.npz")
+    reloaded = BM25Index.load(tmp_path / "doc.npz")
+    assert reloaded.search("waiting period", top_k=2)["rows"].tolist() == [1, 2]
+    assert reciprocal_rank_fusion([["a", "b", "c"], ["c", "d", "a"]]) == ["a", "c", "b", "d"]
+
+def test_hybrid_retrieval_skips_embedding_for_strong_lexical_matches(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store, "vector_store", NumpyVectorStore(None))
+    monkeypatch.setattr(vector_store, "lexical_index", LexicalIndexStore(str(tmp_path)))
+    monkeypatch.setattr(vector_store, "LEXICAL_FAST_PATH_MIN_IDF", 1.0)
+    monkeypatch.setattr(corpus_index, "corpus_index", None)
+    embedded = []
+
+    async def fake_embed(texts):
+        embedded.extend(texts)
+        # Every question "means" maternity to the vector search, then AYUSH, then grace period
+        return [[0.1, 0.0, 0.05, 1.0] for _ in texts]
+
+    monkeypatch.setattr(embedder_new, "embed_chunks_async", fake_embed)
+    vector_store.store_embeddings("doc", CHUNKS, [[1.0, 0.0, 0.0, 0.0], [0.0, 1.0, 0.0, 0.0],
+                                                   [0.0, 0.7, 0.7, 0.0], [0.0, 0.0, 0.0, 1.0]])
+    vector_store.publish_document("doc")
+    assert (tmp_path / "doc.npz").exists()
+
+    questions = ["AYUSH clause 4.2.1", "Waiting period for maternity"]
+    query_vectors, candidates = asyncio.run(vector_store.hybrid_candidates_batch_async(questions, "doc", top_k=3))
+    assert embedded == ["Waiting period for maternity"]
+    # Only the embedded question has a vector to re-rank its context against
+    assert query_vectors == [None, [0.1, 0.0, 0.05, 1.0]]
+    assert candidates[0][0] == [CHUNKS[0]]
+    # Third in both rankings, the grace period chunk overtakes the vector search's second
+    assert candidates[1][0] == [CHUNKS[3], CHUNKS[2], CHUNKS[0]]
+    assert len(candidates[1][1]) == 3
+
+    vector_store.delete_document("doc")
+    assert not (tmp_path / "doc.npz").exists()
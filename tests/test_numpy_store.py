@@ -0,0 +1,82 @@
+# tests/test_numpy_store.py
+
+import numpy as np
+
+from app.services.numpy_store import NumpyVectorStore, top_k_indices
+
+def test_top_k_indices_sorted_best_first():
+    scores = np.array([[0.1, 0.9, 0.5, 0.7], [0.8, 0.2, 0.3, 0.1]])
+    assert top_k_indices(scores, 2).tolist() == [[1, 3], [0, 2]]
+    assert top_k_indices(scores, 10).tolist() == [[1, 3, 2, 0], [0, 2, 1, 3]]
+
+def test_numpy_store_appends_and_reloads_from_disk(tmp_path):
+    store = NumpyVectorStore(str(tmp_path))
+    store.add("doc1", ["grace period"], [[1.0, 0.0]])
+    store.add("doc1", ["maternity"], [[0.0, 2.0]])
+    assert store.query("doc1", [[0.1, 1.0], [1.0, 0.1]], top_k=1) == [["maternity"], ["grace period"]]
+    # Batches are written once, when the document is published
+    assert not (tmp_path / "doc1").exists()
+    store.publish("doc1")
+
+    reopened = NumpyVectorStore(str(tmp_path))
+    assert reopened.has("doc1")
+    assert reopened.query("doc1", [[0.0, 1.0]], top_k=2) == [["maternity", "grace period"]]
+    assert isinstance(reopened.documents["doc1"]["matrix"], np.memmap)
+
+    reopened.delete("doc1")
+    assert not reopened.has("doc1")
+
+def test_numpy_store_unloads_least_recently_used_unpinned_documents(tmp_path):
+    store = NumpyVectorStore(str(tmp_path), max_documents=2)
+    for doc_id, chunk, vector in [("doc1", "a", [1.0, 0.0]), ("doc2", "b", [0.0, 1.0])]:
+        store.add(doc_id, [chunk], [vector])
+        store.publish(doc_id)
+    with store.pinned("doc1"):
+        store.add("doc3", ["c"], [[1.0, 1.0]])
+        store.publish("doc3")
+        # doc1 is pinned, so the least recently used unpinned doc2 goes
+        assert set(store.documents) == {"doc1", "doc3"}
+    assert [d["doc_id"] for d in store.resident_documents()] == ["doc3", "doc1"]
+    assert store.resident_documents()[0]["bytes"] > 0
+
+    # Unloaded documents are still on disk and come back on use
+    assert store.has("doc2")
+    assert store.query("doc2", [[0.0, 1.0]], top_k=1) == [["b"]]
+    assert set(store.documents) == {"doc2", "doc3"}
+    stats = store.residency_stats()
+    assert stats["evictions"] == 2 and stats["misses"] == 1
+
+def test_quantized_store_rescores_against_float32_copy(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((200, 64)).astype(np.float32)
+    queries = vectors[:5] + 0.01 * rng.standard_normal((5, 64)).astype(np.float32)
+    chunks = [str(i) for i in range(200)]
+    exact = NumpyVectorStore(None)
+    exact.add("doc1", chunks, vectors)
+
+    for precision in ("float16", "int8"):
+        store = NumpyVectorStore(str(tmp_path / precision), precision=precision)
+        store.add("doc1", chunks[:100], vectors[:100])
+        store.add("doc1", chunks[100:], vectors[100:])
+        store.publish("doc1")
+        assert store.query("doc1", queries, top_k=3) == exact.query("doc1", queries, top_k=3)
+        assert store.residency_stats()["bytes"] < exact.residency_stats()["bytes"] * (0.6 if precision == "float16" else 0.35)
+
+        reopened = NumpyVectorStore(str(tmp_path / precision), precision=precision)
+        [(found, found_vectors)] = reopened.query_with_embeddings("doc1", queries[:1], top_k=2)
+        assert found[0] == "0" and found_vectors.dtype == np.float32
+        assert np.allclose(found_vectors[0], vectors[0] / np.linalg.norm(vectors[0]))
+
+def test_unpublished_batches_stay_in_memory_and_pinned(tmp_path):
+    store = NumpyVectorStore(str(tmp_path), max_documents=1)
+    store.add("doc1", ["a"], [[1.0, 0.0]])
+    store.add("doc2", ["b"], [[0.0, 1.0]])
+    store.add("doc1", ["c"], [[1.0, 1.0]])
+    # Neither can be unloaded: their batches exist nowhere else yet
+    assert store.has("doc1") and store.has("doc2")
+    assert store.query("doc1", [[1.0, 0.1]], top_k=2) == [["a", "c"]]
+
+    store.publish("doc1")
+    store.publish("doc2")
+    assert set(store.documents) == {"doc2"}
+    assert store.query("doc1", [[1.0, 0.1]], top_k=2) == [["a", "c"]]
@@ -0,0 +1,49 @@
+# tests/test_question_fanout.py
+
+import asyncio
+
+import app.main as main
+from app.main import DocumentQueryRequest
+from app.services.answer_cache import AnswerCache
+
+QUESTIONS = ["q0", "q1", "q2", "q3", "q4", "q5"]
+
+def _run(monkeypatch, ask_llm):
+    async def fake_prepare(request, performance_metrics):
+        return "digest", [[f"context {question}"] for question in request.questions]
+
+    monkeypatch.setattr(main, "prepare_questions", fake_prepare)
+    monkeypatch.setattr(main, "ask_llm", ask_llm)
+    monkeypatch.setattr(main, "answer_cache", AnswerCache(db_path=None))
+    monkeypatch.setattr(main, "QUESTION_CONCURRENCY", 2)
+    monkeypatch.setattr(main, "LLM_PACKED_MODE", False)
+    request = DocumentQueryRequest(documents="http://example/doc.pdf", questions=QUESTIONS)
+    return asyncio.run(main.run_document_queries(request, token="t", accept=None, x_request_timeout=None))
+
+def test_answers_keep_question_order_within_concurrency_limit(monkeypatch):
+    running, peak = 0, 0
+
+    async def fake_ask(question, context_chunks):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        # Later questions finish first
+        await asyncio.sleep(0.01 * (len(QUESTIONS) - int(question[1:])))
+        running -= 1
+        return f"answer {question}"
+
+    response = _run(monkeypatch, fake_ask)
+    assert response.answers == [f"answer {question}" for question in QUESTIONS]
+    assert peak == 2
+
+def test_failing_question_does_not_fail_the_others(monkeypatch):
+    async def fake_ask(question, context_chunks):
+        if question == "q2":
+            raise RuntimeError("upstream exploded")
+        return f"answer {question}"
+
+    response = _run(monkeypatch, fake_ask)
+    assert response.answers[2] == "Error processing question: upstream exploded"
+    assert [a for i, a in enumerate(response.answers) if i != 2] == [
+        f"answer {question}" for question in QUESTIONS if question != "q2"
+    ]
@@ -0,0 +1,58 @@
+# tests/test_rate_limiter.py
+
+import time
+import asyncio
+
+import pytest
+
+from app.services.rate_limiter import BULK, INTERACTIVE, RateLimitScheduler, SchedulerRejected
+
+def test_interactive_calls_overtake_queued_bulk_calls():
+    # 6000 tokens per minute refill at 100 tokens per second
+    scheduler = RateLimitScheduler({"chat": (0, 6000)})
+    order = []
+
+    async def call(name, priority):
+        await scheduler.acquire("chat", 50, priority=priority)
+        order.append(name)
+
+    async def scenario():
+        await scheduler.acquire("chat", 6000)
+        bulk = asyncio.create_task(call("bulk", BULK))
+        await asyncio.sleep(0.05)
+        interactive = asyncio.create_task(call("interactive", INTERACTIVE))
+        await asyncio.sleep(0.05)
+        stats = scheduler.stats()["chat"]
+        await asyncio.gather(bulk, interactive)
+        return stats
+
+    stats = asyncio.run(scenario())
+    assert order == ["interactive", "bulk"]
+    assert stats["queue_depth"] == 2
+    assert stats["queued_by_priority"] == {"interactive": 1, "bulk": 1}
+    final = scheduler.stats()["chat"]
+    assert final["queue_depth"] == 0 and final["granted"] == 3 and final["max_wait_seconds"] > 0
+
+def test_calls_that_cannot_make_their_deadline_are_rejected_early():
+    scheduler = RateLimitScheduler({"embeddings": (60, 0)})
+
+    async def scenario():
+        for _ in range(60):
+            await scheduler.acquire("embeddings", 1)
+        start = time.monotonic()
+        with pytest.raises(SchedulerRejected) as rejected:
+            # The next request slot frees up in about a second
+            await scheduler.acquire("embeddings", 1, deadline=time.monotonic() + 0.2)
+        return time.monotonic() - start, rejected.value
+
+    elapsed, error = asyncio.run(scenario())
+    assert elapsed < 0.1
+    assert error.retry_after > 0.2
+    assert scheduler.stats()["embeddings"]["rejected"] == 1
+
+def test_throttling_pauses_the_service():
+    scheduler = RateLimitScheduler({"chat": (0, 0)})
+    scheduler.throttled("chat", 0.2)
+    start = time.monotonic()
+    scheduler.acquire_sync("chat", 10)
+    assert time.monotonic() - start >= 0.15
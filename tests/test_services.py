@@ -1,8 +1,27 @@
 # tests/test_services.py
 
-from app.services.chunker import chunk_document
-from app.services.embedder import embed_chunks
-from app.services.vector_store import store_embeddings, search_similar_chunks
+import asyncio
+
+import fitz
+import pytest
+
+from app.services import document_loader
+from app.services.chunker import chunk_document, iter_token_chunks
+from app.utils.helpers import estimate_tokens
+from app.services import embedder_new
+from app.services.embedder_new import embed_chunks, split_batches
+from app.services.llm_service_new import parse_packed_answers
+from app.services.question_packing import group_questions, merge_contexts
+from app.services.rate_limiter import scheduling, current_deadline, BULK
+from app.services.context_selector import select_context, trim_to_tokens
+from app.services.vector_store import store_embeddings, search_candidates_batch_async
+from app.config import AZURE_OPENAI_EMBEDDING_ENDPOINT, AZURE_OPENAI_EMBEDDING_API_KEY
+
+# These call the Azure OpenAI embedding deployment for real
+requires_azure = pytest.mark.skipif(
+    not (AZURE_OPENAI_EMBEDDING_ENDPOINT and AZURE_OPENAI_EMBEDDING_API_KEY),
+    reason="Azure OpenAI embedding credentials are not configured",
+)
 
 def test_chunker():
     text = "This is a sample document text to test chunking." * 30
@@ -10,16 +29,95 @@ def test_chunker():
     assert isinstance(chunks, list)
     assert len(chunks) > 0
 
+def test_token_chunker_keeps_sentences_pages_and_overlap():
+    pages = ["Grace period is thirty days. " * 20 + "\n\n", "Waiting period is two years. " * 20]
+    chunks = list(iter_token_chunks(pages, max_tokens=40, overlap_tokens=10))
+    text = "".join(pages)
+
+    assert all(estimate_tokens(chunk["text"]) <= 45 for chunk in chunks)
+    assert all(chunk["text"].endswith(".") for chunk in chunks)
+    assert all(text[chunk["start"]:chunk["end"]].startswith(chunk["text"][:20]) for chunk in chunks)
+    assert chunks[0]["page"] == 1 and chunks[-1]["last_page"] == 2
+    assert chunks[1]["start"] < chunks[0]["end"]
+
+def test_question_packing_groups_overlapping_context():
+    questions = ["grace period?", "grace renewal?", "maternity?", "maternity wait?"]
+    retrievals = [["a", "b"], ["b", "c"], ["x", "y"], ["y", "z"]]
+    assert group_questions(questions, retrievals, max_group_size=5, max_tokens=1000) == [[0, 1], [2, 3]]
+    assert group_questions(questions, retrievals, max_group_size=1, max_tokens=1000) == [[0], [1], [2], [3]]
+    assert merge_contexts(retrievals[:2]) == ["a", "b", "c"]
+
+    assert parse_packed_answers('```json\n{"answers": [{"index": 1, "answer": "B"}, {"index": 0, "answer": "A"}]}\n```', 2) == ["A", "B"]
+    with pytest.raises(ValueError):
+        parse_packed_answers('{"answers": [{"index": 0, "answer": "A"}]}', 2)
+
+def test_context_selector_drops_duplicates_and_fits_budget():
+    chunks = ["Grace period is thirty days. " * 4, "Grace period is 30 days. " * 4, "Maternity waits two years. " * 4]
+    embeddings = [[1.0, 0.0, 0.1], [0.999, 0.0, 0.11], [0.6, 0.8, 0.0]]
+
+    context = select_context([1.0, 0.1, 0.0], chunks, embeddings, max_tokens=1000, max_chunks=5)
+    assert context == [chunks[0], chunks[2]]
+
+    context = select_context([1.0, 0.1, 0.0], chunks, embeddings, max_tokens=40, max_chunks=5)
+    assert context[0] == chunks[0]
+    assert context[1] == trim_to_tokens(chunks[2], 40 - len(chunks[0]) // 4)
+    assert context[1].endswith(".") and len(context[1]) < len(chunks[2])
+
+def test_embedding_sub_batches():
+    chunks = ["word " * 40] * 5 + ["word " * 400]
+    batches = split_batches(chunks, max_items=2, max_tokens=100)
+    assert [len(batch) for batch in batches] == [2, 2, 1, 1]
+    assert [chunk for batch in batches for chunk in batch] == chunks
+
+def test_embedding_sub_batches_keep_scheduling_context(monkeypatch):
+    seen = []
+
+    def fake_batch(chunks):
+        seen.append(current_deadline())
+        return [[1.0] for _ in chunks]
+
+    monkeypatch.setattr(embedder_new, "_embed_batch", fake_batch)
+    monkeypatch.setattr(embedder_new, "EMBEDDING_BATCH_MAX_ITEMS", 1)
+    with scheduling(priority=BULK, deadline=123.0):
+        assert embedder_new._embed_uncached(["a", "b", "c"]) == [[1.0]] * 3
+    assert seen == [123.0] * 3
+
+@requires_azure
 def test_embedder():
     chunks = ["Test embedding chunk"]
     embeddings = embed_chunks(chunks)
     assert isinstance(embeddings, list)
     assert len(embeddings) == 1
 
+@requires_azure
 def test_vector_store_search():
     chunks = ["Test vector store chunk"]
     embeddings = embed_chunks(chunks)
     store_embeddings("doc1", chunks, embeddings)
-    results = search_similar_chunks("vector", "doc1", top_k=1)
-    assert isinstance(results, list)
-    assert len(results) > 0
+    _, [(texts, _)] = asyncio.run(search_candidates_batch_async(["vector"], "doc1", top_k=1))
+    assert texts == chunks
+
+def test_vector_store_batch_search(monkeypatch):
+    async def fake_embed(queries):
+        return [[0.0, 1.0] if "maternity" in query else [1.0, 0.0] for query in queries]
+
+    monkeypatch.setattr(embedder_new, "embed_chunks_async", fake_embed)
+    chunks = ["grace period clause", "maternity clause"]
+    store_embeddings("doc_batch", chunks, [[1.0, 0.0], [0.0, 1.0]])
+    _, candidates = asyncio.run(search_candidates_batch_async(["maternity?", "grace?"], "doc_batch", top_k=1))
+    assert [texts for texts, _ in candidates] == [["maternity clause"], ["grace period clause"]]
+
+def test_load_document_from_bytes_in_parallel(monkeypatch):
+    pdf = fitz.open()
+    for i in range(6):
+        pdf.new_page().insert_text((72, 72), f"Page {i} text")
+    content = pdf.tobytes()
+
+    serial_text, serial_offsets = document_loader.load_document_with_offsets(content)
+    monkeypatch.setattr(document_loader, "PDF_PARALLEL_MIN_PAGES", 2)
+    monkeypatch.setattr(document_loader, "PDF_MAX_WORKERS", 3)
+    text, offsets = document_loader.load_document_with_offsets(content)
+
+    assert text == serial_text and offsets == serial_offsets
+    assert len(offsets) == 6
+    assert text[offsets[3]:].startswith("Page 3 text")
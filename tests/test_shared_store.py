@@ -0,0 +1,45 @@
+# tests/test_shared_store.py
+
+import time
+import threading
+
+import numpy as np
+
+from app.services.shared_store import SharedNumpyVectorStore
+
+def test_documents_are_shared_between_workers_once_published(tmp_path):
+    # Two store instances on one directory stand in for two worker processes
+    writer = SharedNumpyVectorStore(str(tmp_path))
+    reader = SharedNumpyVectorStore(str(tmp_path))
+
+    writer.add("doc1", ["grace period"], [[1.0, 0.0]])
+    writer.add("doc1", ["maternity"], [[0.0, 1.0]])
+    assert not reader.has("doc1")
+
+    writer.publish("doc1")
+    assert reader.has("doc1")
+    assert reader.query("doc1", [[0.0, 1.0]], top_k=2) == [["maternity", "grace period"]]
+    assert isinstance(reader.documents["doc1"]["matrix"], np.memmap)
+
+    writer.delete("doc1")
+    assert not reader.has("doc1")
+    assert reader._get("doc1") is None
+
+def test_write_lock_lets_one_worker_ingest_at_a_time(tmp_path):
+    first = SharedNumpyVectorStore(str(tmp_path))
+    second = SharedNumpyVectorStore(str(tmp_path))
+    order = []
+
+    def ingest(store, name):
+        with store.write_lock("doc1"):
+            order.append(f"{name} start")
+            time.sleep(0.05)
+            order.append(f"{name} end")
+
+    with first.write_lock("doc1"):
+        thread = threading.Thread(target=ingest, args=(second, "second"))
+        thread.start()
+        time.sleep(0.05)
+        order.append("first end")
+    thread.join()
+    assert order == ["first end", "second start", "second end"]
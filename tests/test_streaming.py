@@ -0,0 +1,55 @@
+# tests/test_streaming.py
+
+import json
+import asyncio
+
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app.services import metrics
+from app.main import DocumentQueryRequest, stream_answers
+
+def test_stream_answers_emits_answers_as_they_complete(monkeypatch):
+    async def fake_answer(index, question, relevant_chunks, semaphore, digest):
+        # Later questions finish first
+        await asyncio.sleep(0.01 * (3 - index))
+        return f"answer {index}", 0.01
+
+    monkeypatch.setattr(main, "answer_question", fake_answer)
+    request = DocumentQueryRequest(documents="http://example/doc.pdf", questions=["a", "b", "c"])
+
+    async def collect():
+        stream = stream_answers("application/x-ndjson", request, "digest", [[], [], []], 0.0, {})
+        return [json.loads(line) async for line in stream]
+
+    events = asyncio.run(collect())
+    assert [e["event"] for e in events] == ["ingested", "answer", "answer", "answer", "summary"]
+    assert [e["index"] for e in events[1:4]] == [2, 1, 0]
+    assert events[-1]["answers"] == ["answer 0", "answer 1", "answer 2"]
+
+def test_streamed_request_is_measured_until_its_body_is_sent(monkeypatch):
+    in_flight = []
+
+    async def fake_prepare(request, performance_metrics):
+        return "digest", [[] for _ in request.questions]
+
+    async def fake_answer(index, question, relevant_chunks, semaphore, digest):
+        metrics.observe_stage("llm", 0.25)
+        in_flight.append(metrics.REQUESTS_IN_FLIGHT._value.get())
+        return f"answer {index}", 0.25
+
+    monkeypatch.setattr(main, "prepare_questions", fake_prepare)
+    monkeypatch.setattr(main, "answer_question", fake_answer)
+    monkeypatch.setattr(main, "SERVER_TIMING_ENABLED", True)
+    before = metrics.REQUESTS_IN_FLIGHT._value.get()
+
+    response = TestClient(main.app).post(
+        "/api/v1/hackrx/run",
+        json={"documents": "http://example/doc.pdf", "questions": ["a", "b"]},
+        headers={"Authorization": f"Bearer {main.TEAM_TOKEN}", "Accept": "application/x-ndjson"},
+    )
+    events = [json.loads(line) for line in response.text.splitlines()]
+    # Still counted while the answers were being generated, and not after
+    assert in_flight == [before + 1] * 2
+    assert metrics.REQUESTS_IN_FLIGHT._value.get() == before
+    assert "llm;dur=500.0" in events[-1]["server_timing"]
@@ -0,0 +1,63 @@
+# tests/test_warmup.py
+
+import time
+import asyncio
+import threading
+
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app.services.warmup import Warmup
+
+def _unreachable():
+    raise ConnectionError("upstream unreachable")
+
+def test_ready_endpoint_waits_for_required_steps(monkeypatch):
+    gate = threading.Event()
+    warmup = Warmup()
+    warmup.add("vector_store", lambda: asyncio.to_thread(gate.wait, 10))
+    warmup.add("upstream_connections", _unreachable, required=False)
+    monkeypatch.setattr(main, "warmup", warmup)
+
+    with TestClient(main.app) as client:
+        # Liveness answers while warming up; readiness does not
+        assert client.get("/api/v1/health").status_code == 200
+        response = client.get("/api/v1/ready")
+        assert response.status_code == 503
+        assert response.json()["steps"]["vector_store"]["status"] == "pending"
+
+        gate.set()
+        deadline = time.time() + 10
+        while (response := client.get("/api/v1/ready")).status_code != 200 and time.time() < deadline:
+            time.sleep(0.01)
+        assert response.status_code == 200
+        # An optional step that failed is reported without holding readiness back
+        steps = response.json()["steps"]
+        assert steps["vector_store"]["status"] == "ok"
+        assert steps["upstream_connections"]["status"] == "failed"
+
+def test_failed_required_step_keeps_process_unready_until_a_retry_succeeds():
+    attempts = []
+
+    def flaky():
+        attempts.append(time.perf_counter())
+        if len(attempts) < 3:
+            _unreachable()
+
+    warmup = Warmup(retry_seconds=0.02, max_retry_seconds=0.03)
+    warmup.add("pdf_parser", flaky)
+
+    async def run():
+        warmup.start()
+        while warmup.status()["finished"] is None:
+            await asyncio.sleep(0.001)
+        unready = warmup.status()
+        await warmup._task
+        return unready, warmup.status()
+
+    unready, ready = asyncio.run(run())
+    assert not unready["ready"] and unready["steps"]["pdf_parser"]["error"] == "upstream unreachable"
+    assert ready["ready"] and ready["steps"]["pdf_parser"]["status"] == "ok"
+    assert ready["steps"]["pdf_parser"]["attempts"] == 3
+    # Backoff doubles, up to its cap
+    assert attempts[1] - attempts[0] >= 0.02 and attempts[2] - attempts[1] >= 0.03